@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can_log
+from data_log import iter_line_chunks
+
+DESCRIPTION = """Compares parsing a candump log line by line against parsing it in batches with
+can_log.parse_candump. The log is scaled up by repeating it with shifted timestamps."""
+
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples", \
+    "can_sample.log")
+
+def scale_log(lines, repeats):
+    """ Repeats a candump log, shifting the timestamps of each repetition to follow the last. """
+    first = can_log.parse_candump_line(lines[0])[0]
+    last = can_log.parse_candump_line(lines[-1])[0]
+    duration = last - first + 0.001
+
+    scaled = []
+    for i in range(repeats):
+        for line in lines:
+            stamp, rest = line.split(None, 1)
+            stamp = float(stamp[1:-1]) + i * duration
+            scaled.append("(%.6f) %s" % (stamp, rest))
+
+    return scaled
+
+def parse_line_by_line(lines):
+    frames = 0
+    for line in lines:
+        can_log.parse_candump_line(line)
+        frames += 1
+    return frames
+
+def parse_batched(lines):
+    frames = 0
+    for chunk in iter_line_chunks(lines):
+        frames += len(can_log.parse_candump(chunk))
+    return frames
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--log", type=str, default=DEFAULT_LOG, help="Path to candump log")
+    parser.add_argument("--repeats", type=int, default=20, \
+        help="Number of times to repeat the log")
+
+    args = parser.parse_args()
+
+    with open(os.path.expanduser(args.log), "r") as file:
+        lines = scale_log(file.readlines(), args.repeats)
+
+    print("Parsing %d frames..." % len(lines))
+    for name, parse in [("Line by line", parse_line_by_line), ("Batched", parse_batched)]:
+        t_start = time.perf_counter()
+        frames = parse(lines)
+        duration = time.perf_counter() - t_start
+        print("{:12} | {:8.3f} s | {:10.0f} frames/s".format(name, duration, frames / duration))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_log import Channel
+from motec_log import MotecLog
+
+DESCRIPTION = """Measures the time taken by MotecLog.add_channel to convert channels of increasing
+length. The time per sample should stay roughly constant as the sample count grows."""
+
+def time_add_channel(num_samples, values_dtype, repeats):
+    """ Returns the best time taken to add a channel with num_samples samples [s]. """
+    timestamps = np.arange(num_samples, dtype=np.float64) * 0.01
+    values = np.random.default_rng(0).uniform(-1000, 1000, num_samples).astype(values_dtype)
+    channel = Channel("Benchmark", "", float, 0, timestamps=timestamps, values=values)
+
+    best = np.inf
+    for i in range(repeats):
+        motec_log = MotecLog()
+        motec_log.initialize()
+
+        t_start = time.perf_counter()
+        motec_log.add_channel(channel)
+        best = min(best, time.perf_counter() - t_start)
+
+    return best
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    parser.add_argument("--sizes", type=int, nargs="+", \
+        default=[10000, 100000, 1000000, 10000000], help="Channel sample counts to time")
+    parser.add_argument("--repeats", type=int, default=5, help="Repetitions for each size")
+
+    args = parser.parse_args()
+
+    print("  Samples   |  float64 [ms] | ns/sample |  float32 [ms] | ns/sample")
+    print("-------------------------------------------------------------------")
+    for num_samples in args.sizes:
+        t_f64 = time_add_channel(num_samples, np.float64, args.repeats)
+        t_f32 = time_add_channel(num_samples, np.float32, args.repeats)
+        print("{:11d} | {:13.3f} | {:9.2f} | {:13.3f} | {:9.2f}".format(num_samples, \
+            1e3 * t_f64, 1e9 * t_f64 / num_samples, 1e3 * t_f32, 1e9 * t_f32 / num_samples))
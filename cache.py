@@ -0,0 +1,292 @@
+import can_decode
+import cantools
+import hashlib
+import numpy as np
+import os
+import pickle
+import tempfile
+
+# Incremented whenever the format of the cached data changes, so older entries are not loaded
+CACHE_VERSION = 3
+
+# Number of bytes read from a file at once when computing its hash
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Default limit on the total size of the cached decoded logs and log indexes [MB]
+DEFAULT_DECODED_CACHE_SIZE = 2048
+
+# Directories of the cache entries which count towards the cache size, with the file extension of
+# their entries. Decode plans are small and are never evicted.
+EVICTED_ENTRIES = (("decoded_logs", ".npz"), ("id_indexes", ".pickle"), ("time_indexes", ".pickle"))
+
+def get_decoded_cache_size():
+    """ Returns the maximum total size of the cached decoded logs and log indexes [bytes].
+
+    This is the MOTEC_LOG_CACHE_SIZE environment variable in MB when set, otherwise
+    DEFAULT_DECODED_CACHE_SIZE.
+    """
+    try:
+        size = float(os.environ.get("MOTEC_LOG_CACHE_SIZE", DEFAULT_DECODED_CACHE_SIZE))
+    except ValueError:
+        size = DEFAULT_DECODED_CACHE_SIZE
+
+    return int(size * 1024 * 1024)
+
+def get_cache_dir():
+    """ Returns the directory to store cached data in.
+
+    This is the MOTEC_LOG_CACHE_DIR environment variable when set, otherwise a directory in the
+    user's cache directory.
+    """
+    cache_dir = os.environ.get("MOTEC_LOG_CACHE_DIR")
+    if cache_dir:
+        return os.path.expanduser(cache_dir)
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join("~", ".cache")
+    return os.path.join(os.path.expanduser(cache_home), "motec_log_generator")
+
+def file_hash(filename):
+    """ Returns the SHA-256 hash of the contents of a file as a hex string. """
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def load_decode_plan(dbc_filename, cache_dir=None):
+    """ Loads the decode plan for a DBC file, using a cached copy when possible.
+
+    Plans are cached by the hash of the DBC file contents, so editing the DBC file automatically
+    creates a new plan. A cached plan holds the frame ids, bit layout, scale, offset, and units of
+    every signal, so the DBC file does not need to be parsed. The DBC file is only loaded if a
+    message needs to be decoded with cantools (e.g. multiplexed messages).
+
+    dbc_filename: Path to the DBC file
+    cache_dir: Directory to cache plans in, defaults to get_cache_dir()
+    returns: can_decode.DecodePlan
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    cache_filename = os.path.join(cache_dir, "decode_plans", \
+        "%s_v%d.pickle" % (file_hash(dbc_filename), CACHE_VERSION))
+
+    messages = read_cache_file(cache_filename)
+    if messages is not None:
+        return can_decode.DecodePlan(messages, dbc_filename=dbc_filename)
+
+    can_db = cantools.database.load_file(dbc_filename)
+    decode_plan = can_decode.DecodePlan.from_database(can_db, dbc_filename)
+    write_cache_file(cache_filename, decode_plan.messages)
+
+    return decode_plan
+
+def decoded_log_filename(log_filename, dbc_hash, log_format, selection="", cache_dir=None):
+    """ Returns the path of the cache entry for the decoded channels of a CAN log.
+
+    The hash of the DBC file, the format of the log, and the selected channels are part of the
+    key, along with the log itself (see log_key()).
+
+    log_filename: Path to the log file
+    dbc_hash: Hash of the DBC file used to decode the log, see file_hash()
+    log_format: Name of the format of the log, see can_readers
+    selection: Key of the channels that were selected, see channel_filter.ChannelFilter.key()
+    cache_dir: Directory the cache is stored in, defaults to get_cache_dir()
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    return os.path.join(cache_dir, "decoded_logs", "%s_v%d.npz" % \
+        (log_key(log_filename, dbc_hash, log_format, selection), CACHE_VERSION))
+
+def time_index_filename(log_filename, cache_dir=None):
+    """ Returns the path of the cache entry for the time index of a log, see log_index.
+
+    log_filename: Path to the log file
+    cache_dir: Directory the cache is stored in, defaults to get_cache_dir()
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    return os.path.join(cache_dir, "time_indexes", "%s_v%d.pickle" % \
+        (log_key(log_filename), CACHE_VERSION))
+
+def id_index_filename(log_filename, cache_dir=None):
+    """ Returns the path of the cache entry for the id index of a log, see log_index.
+
+    log_filename: Path to the log file
+    cache_dir: Directory the cache is stored in, defaults to get_cache_dir()
+    """
+    if cache_dir is None:
+        cache_dir = get_cache_dir()
+
+    return os.path.join(cache_dir, "id_indexes", "%s_v%d.pickle" % \
+        (log_key(log_filename), CACHE_VERSION))
+
+def log_key(log_filename, *parts):
+    """ Returns a key identifying the current contents of a log file, along with any other parts.
+
+    Logs are identified by their path, size, and modification time, so a log which is modified or
+    replaced gets a new key without needing to hash its contents.
+
+    log_filename: Path to the log file
+    parts: Strings to include in the key
+    """
+    log_stat = os.stat(log_filename)
+    key = "\0".join((os.path.realpath(log_filename), str(log_stat.st_size), \
+        str(log_stat.st_mtime_ns)) + parts)
+
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def read_decoded_log(filename):
+    """ Returns the channels stored in a decoded log cache entry, or None if it is missing or can
+    not be read.
+
+    Reading an entry marks it as the most recently used.
+
+    returns: List of (name, units, timestamps, values) tuples
+    """
+    try:
+        with np.load(filename, allow_pickle=False) as entry:
+            names = entry["names"]
+            units = entry["units"]
+            channels = [(str(names[i]), str(units[i]), entry["t%d" % i], entry["v%d" % i]) \
+                for i in range(names.size)]
+        os.utime(filename)
+    except Exception:
+        # Corrupt or incompatible entries are treated as missing, they will be replaced
+        return None
+
+    return channels
+
+def write_decoded_log(filename, channels, max_size=None):
+    """ Stores the decoded channels of a log in a cache entry, then evicts the least recently used
+    entries until the cache fits within max_size.
+
+    Logs which are larger than the cache on their own are not stored.
+
+    filename: Path of the cache entry, see decoded_log_filename()
+    channels: List of (name, units, timestamps, values) tuples
+    max_size: Maximum total size of the entries, defaults to get_decoded_cache_size() [bytes]
+    """
+    if max_size is None:
+        max_size = get_decoded_cache_size()
+
+    if sum(timestamps.nbytes + values.nbytes for _, _, timestamps, values in channels) > max_size:
+        return
+
+    arrays = {
+        "names": np.array([name for name, _, _, _ in channels], dtype=str),
+        "units": np.array([units for _, units, _, _ in channels], dtype=str),
+    }
+    for i, (_, _, timestamps, values) in enumerate(channels):
+        arrays["t%d" % i] = timestamps
+        arrays["v%d" % i] = values
+
+    _write_atomic(filename, lambda f: np.savez(f, **arrays))
+    evict_least_recently_used(_entry_cache_dir(filename), max_size)
+
+def read_log_index(filename):
+    """ Returns the entries stored in a log index cache entry, or None if it is missing or can not
+    be read.
+
+    Reading an entry marks it as the most recently used.
+    """
+    entries = read_cache_file(filename)
+    if entries is not None:
+        try:
+            os.utime(filename)
+        except OSError:
+            pass
+
+    return entries
+
+def write_log_index(filename, entries, max_size=None):
+    """ Stores the entries of a log index in a cache entry, then evicts the least recently used
+    entries until the cache fits within max_size.
+
+    filename: Path of the cache entry, see time_index_filename() and id_index_filename()
+    entries: Tuple of the arrays of the index
+    max_size: Maximum total size of the entries, defaults to get_decoded_cache_size() [bytes]
+    """
+    if max_size is None:
+        max_size = get_decoded_cache_size()
+
+    write_cache_file(filename, entries)
+    evict_least_recently_used(_entry_cache_dir(filename), max_size)
+
+def evict_least_recently_used(cache_dir, max_size):
+    """ Removes the least recently used decoded logs and log indexes until their total size is at
+    most max_size, see EVICTED_ENTRIES.
+
+    Files are ordered by their modification time, which is updated whenever an entry is used.
+
+    cache_dir: Directory the cache is stored in
+    max_size: Maximum total size of the entries [bytes]
+    """
+    entries = []
+    for directory, extension in EVICTED_ENTRIES:
+        try:
+            with os.scandir(os.path.join(cache_dir, directory)) as it:
+                for entry in it:
+                    if entry.name.endswith(extension) and entry.is_file():
+                        entry_stat = entry.stat()
+                        entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+        except OSError:
+            continue
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+
+        try:
+            os.remove(path)
+        except OSError:
+            # Another process may have removed it already
+            pass
+        total_size -= size
+
+def read_cache_file(filename):
+    """ Returns the object stored in a cache file, or None if it is missing or can not be read. """
+    try:
+        with open(filename, "rb") as f:
+            return pickle.load(f)
+    except Exception:
+        # Corrupt or incompatible entries are treated as missing, they will be replaced
+        return None
+
+def write_cache_file(filename, obj):
+    """ Stores an object in a cache file.
+
+    The file is written under a temporary name then renamed, so concurrent processes never read a
+    partially written file. Failing to write to the cache is not an error, the data just won't be
+    cached.
+    """
+    _write_atomic(filename, lambda f: pickle.dump(obj, f, pickle.HIGHEST_PROTOCOL))
+
+def _entry_cache_dir(filename):
+    """ Returns the directory of the cache holding an entry, which is in a directory of its own
+    type of entry.
+    """
+    return os.path.dirname(os.path.dirname(filename))
+
+def _write_atomic(filename, write):
+    """ Writes a cache file under a temporary name then renames it, ignoring any errors.
+
+    write: Function called with the open binary file to write the contents
+    """
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        fd, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+    except OSError:
+        return
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(temp_filename, filename)
+    except OSError:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
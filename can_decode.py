@@ -0,0 +1,306 @@
+import cantools
+import numpy as np
+
+# Signals are extracted from a 64 bit window of the frame data
+WINDOW_BYTES = 8
+
+# Integer signals longer than this can not be exactly represented as a float64 when scaled
+MAX_EXACT_BITS = 52
+
+class SignalPlan(object):
+    """ Describes where a signal is located in the frame data and how to scale it.
+
+    The signal is extracted by taking the 8 bytes of frame data starting at first_byte as a single
+    64 bit integer (little or big endian, matching the signal), shifting it right by shift bits,
+    and masking off length bits.
+    """
+    __slots__ = ("name", "unit", "length", "first_byte", "shift", "big_endian", "is_signed", \
+        "is_float", "scale", "offset")
+
+    def __init__(self, name, unit, length, first_byte, shift, big_endian, is_signed, is_float, \
+        scale, offset):
+        self.name = name
+        self.unit = unit
+        self.length = length
+        self.first_byte = first_byte
+        self.shift = shift
+        self.big_endian = big_endian
+        self.is_signed = is_signed
+        self.is_float = is_float
+        self.scale = scale
+        self.offset = offset
+
+    @classmethod
+    def from_signal(cls, signal):
+        """ Creates a plan from a cantools signal, returns None if the signal can not be decoded
+        with array operations.
+
+        signal: cantools.database.can.Signal
+        """
+        if signal.is_float and signal.length not in (32, 64):
+            return None
+        if not signal.is_float and signal.length > MAX_EXACT_BITS:
+            return None
+
+        if signal.byte_order == "little_endian":
+            first_byte = signal.start // 8
+            shift = signal.start % 8
+            last_bit = shift + signal.length - 1
+        else:
+            # Big endian start bits refer to the most significant bit in the DBC sawtooth
+            # numbering, convert this to a position counting from the MSB of the first byte
+            msb = 8 * (signal.start // 8) + 7 - signal.start % 8
+            first_byte = msb // 8
+            last_bit = msb % 8 + signal.length - 1
+            shift = 8 * WINDOW_BYTES - 1 - last_bit
+
+        if last_bit >= 8 * WINDOW_BYTES:
+            return None
+
+        return cls(signal.name, signal.unit, signal.length, first_byte, \
+            shift, signal.byte_order != "little_endian", signal.is_signed, signal.is_float, \
+            signal.scale, signal.offset)
+
+    def decode(self, data):
+        """ Decodes the signal from every row of frame data.
+
+        data: uint8 matrix of frame data, with at least first_byte + 8 columns
+        returns: float64 array of values
+        """
+        window = np.ascontiguousarray(data[:, self.first_byte:self.first_byte + WINDOW_BYTES])
+        raw = window.view(">u8" if self.big_endian else "<u8").ravel()
+        raw = (raw >> np.uint64(self.shift)) & np.uint64((1 << self.length) - 1)
+
+        if self.is_float:
+            if self.length == 32:
+                raw = raw.astype(np.uint32).view(np.float32)
+            else:
+                raw = raw.view(np.float64)
+        elif self.is_signed:
+            raw = raw.astype(np.int64)
+            raw[raw >= 1 << (self.length - 1)] -= 1 << self.length
+
+        return raw.astype(np.float64) * self.scale + self.offset
+
+class MessagePlan(object):
+    """ Describes how to decode all the signals of a single message.
+
+    Messages containing any signals which can not be decoded with array operations (e.g.
+    multiplexed signals) are decoded frame by frame with cantools.
+    """
+    __slots__ = ("frame_id", "name", "length", "signals", "width", "names", "units", "selected")
+
+    def __init__(self, frame_id, name, length, signals, names, units, selected=None):
+        """ frame_id: Arbitration id of the message
+            name: Name of the message
+            length: Number of data bytes in the message
+            signals: List of SignalPlan for the signals to decode, or None to decode the message
+                with cantools
+            names: Names of every signal in the message, in the order of the database
+            units: Units of every signal in the message, in the order of the database
+            selected: Set of the names of the signals to output when decoding with cantools, or
+                None for all signals
+        """
+        self.frame_id = frame_id
+        self.name = name
+        self.length = length
+        self.signals = signals
+        self.names = names
+        self.units = units
+        self.selected = selected
+
+        if signals:
+            self.width = max(signal.first_byte for signal in signals) + WINDOW_BYTES
+        else:
+            self.width = WINDOW_BYTES
+
+    @classmethod
+    def from_message(cls, message):
+        """ message: cantools.database.can.Message """
+        names = [signal.name for signal in message.signals]
+        units = [signal.unit for signal in message.signals]
+
+        if message.is_multiplexed() or getattr(message, "is_container", False):
+            return cls(message.frame_id, message.name, message.length, None, names, units)
+
+        signals = [SignalPlan.from_signal(signal) for signal in message.signals]
+        if None in signals:
+            return cls(message.frame_id, message.name, message.length, None, names, units)
+
+        return cls(message.frame_id, message.name, message.length, signals, names, units)
+
+    def select(self, channel_filter):
+        """ Returns a plan which only decodes the selected signals, or None when no signals of the
+        message are selected.
+
+        channel_filter: channel_filter.ChannelFilter
+        """
+        if self.signals is not None:
+            signals = [signal for signal in self.signals if channel_filter(signal.name)]
+            if not signals:
+                return None
+            return MessagePlan(self.frame_id, self.name, self.length, signals, self.names, \
+                self.units, set(signal.name for signal in signals))
+
+        # Messages decoded with cantools decode every signal, so the unselected signals are dropped
+        # from the output
+        selected = set(name for name in self.names if channel_filter(name))
+        if self.selected is not None:
+            selected &= self.selected
+        if not selected:
+            return None
+
+        return MessagePlan(self.frame_id, self.name, self.length, None, self.names, self.units, \
+            selected)
+
+    def decode(self, frames, rows, decode_plan, output):
+        """ Decodes the selected frames, adding the values to the output.
+
+        frames: can_log.CanFrames
+        rows: Array of indices of the frames with this message id
+        decode_plan: DecodePlan this message belongs to, its database is used for messages that can
+            not be decoded with array operations
+        output: Dict mapping signal names to [unit, [row arrays], [value arrays]]
+        """
+        # Frames that are too short are left to cantools to handle
+        if self.signals is not None:
+            complete = frames.lengths[rows] >= self.length
+            fallback_rows = rows[~complete]
+            rows = rows[complete]
+        else:
+            fallback_rows = rows
+            rows = rows[:0]
+
+        if rows.size:
+            data = frames.data[rows]
+            if data.shape[1] < self.width:
+                data = np.pad(data, ((0, 0), (0, self.width - data.shape[1])))
+
+            for signal in self.signals:
+                self.__add_output(output, signal.name, signal.unit, rows, signal.decode(data))
+
+        if fallback_rows.size:
+            can_db = decode_plan.can_db
+            units = dict(zip(self.names, self.units))
+            signals = {}
+            for row in fallback_rows.tolist():
+                # Signals with choices are kept as numeric values, since channels can only hold
+                # numbers
+                msg_decoded = can_db.decode_message(self.frame_id, frames.payload(row), \
+                    decode_choices=False)
+
+                # Multiplexed messages only contain the signals for their multiplexer value, so
+                # units are looked up by name
+                for name, value in msg_decoded.items():
+                    if self.selected is not None and name not in self.selected:
+                        continue
+                    unit = units.get(name, "")
+                    if name not in signals:
+                        signals[name] = (unit, [], [])
+                    signals[name][1].append(row)
+                    signals[name][2].append(value)
+
+            for name, (unit, signal_rows, values) in signals.items():
+                self.__add_output(output, name, unit, np.array(signal_rows, np.int64), \
+                    np.array(values, np.float64))
+
+    @staticmethod
+    def __add_output(output, name, unit, rows, values):
+        if name not in output:
+            output[name] = [unit, [], []]
+        output[name][1].append(rows)
+        output[name][2].append(values)
+
+class DecodePlan(object):
+    """ Decodes batches of CAN frames with a CAN database.
+
+    Frames are grouped by arbitration id, then each signal of a message is decoded for every frame
+    of that id at once using bit masks and shifts, followed by the scale and offset of the signal.
+    """
+    def __init__(self, messages, can_db=None, dbc_filename=None):
+        """ messages: Dict mapping frame ids to MessagePlan
+            can_db: cantools.database, used for messages that can not be decoded with array
+                operations
+            dbc_filename: Path to the DBC file to load the database from when it is first needed,
+                if can_db is not provided
+        """
+        self.messages = messages
+        self.dbc_filename = dbc_filename
+        self.frame_ids = np.array(sorted(messages.keys()), np.uint32)
+        self.__can_db = can_db
+
+    @classmethod
+    def from_database(cls, can_db, dbc_filename=None):
+        """ can_db: cantools.database
+            dbc_filename: Path to the DBC file the database was loaded from
+        """
+        messages = {}
+        for message in can_db.messages:
+            messages[message.frame_id] = MessagePlan.from_message(message)
+
+        return cls(messages, can_db, dbc_filename)
+
+    def select(self, channel_filter):
+        """ Returns a plan which only decodes the signals selected by a filter.
+
+        Messages without any selected signals are left out of the plan entirely, so their frames
+        are dropped before being decoded.
+
+        channel_filter: channel_filter.ChannelFilter, or None to select all signals
+        """
+        if channel_filter is None or channel_filter.is_empty():
+            return self
+
+        messages = {}
+        for frame_id, message in self.messages.items():
+            message = message.select(channel_filter)
+            if message is not None:
+                messages[frame_id] = message
+
+        return DecodePlan(messages, self.__can_db, self.dbc_filename)
+
+    @property
+    def can_db(self):
+        """ The database, which is only loaded once a message needs to be decoded by cantools. """
+        if self.__can_db is None:
+            self.__can_db = cantools.database.load_file(self.dbc_filename)
+        return self.__can_db
+
+    def decode(self, frames):
+        """ Decodes a batch of frames, ignoring frames with ids not in the database.
+
+        Signals are returned in the order they first appear in the frames, with the values for each
+        signal in the same order as the frames.
+
+        frames: can_log.CanFrames
+        returns: List of (name, unit, timestamps, values) tuples for each decoded signal
+        """
+        frames = frames.select(np.isin(frames.ids, self.frame_ids))
+        if not len(frames):
+            return []
+
+        # Group the frames by id, keeping the frames for each id in order
+        ids, first_rows, groups = np.unique(frames.ids, return_index=True, return_inverse=True)
+        group_rows = np.argsort(groups, kind="stable")
+        group_bounds = np.zeros(ids.size + 1, np.int64)
+        group_bounds[1:] = np.cumsum(np.bincount(groups, minlength=ids.size))
+
+        output = {}
+        for group in np.argsort(first_rows).tolist():
+            rows = group_rows[group_bounds[group]:group_bounds[group + 1]]
+            self.messages[int(ids[group])].decode(frames, rows, self, output)
+
+        decoded = []
+        for name, (unit, rows, values) in output.items():
+            rows = np.concatenate(rows)
+            values = np.concatenate(values)
+
+            # Signals with the same name in multiple messages need their values put back in order
+            if len(output[name][1]) > 1:
+                order = np.argsort(rows, kind="stable")
+                rows = rows[order]
+                values = values[order]
+
+            decoded.append((name, unit, frames.timestamps[rows], values))
+
+        return decoded
@@ -0,0 +1,392 @@
+import numpy as np
+
+# Minimum width of the payload matrix, the length of a classic CAN frame [bytes]
+MIN_PAYLOAD_WIDTH = 8
+
+# Maximum number of hex digits in an arbitration id
+MAX_ID_DIGITS = 8
+
+# Number of hex digits candump writes standard 11 bit ids with, extended ids are written with
+# MAX_ID_DIGITS
+STANDARD_ID_DIGITS = 3
+
+# Largest standard 11 bit arbitration id
+MAX_STANDARD_ID = 0x7FF
+
+# Flag set on the key of an extended id, so it is kept apart from a standard id with the same value.
+# This is the bit SocketCAN and DBC files mark extended ids with.
+EXTENDED_KEY_FLAG = 0x80000000
+
+# Timestamps are parsed as integers when they have at most this many digits
+MAX_TIMESTAMP_DIGITS = 18
+
+# Lookup table from ASCII characters to their hexadecimal digit value
+_HEX_DIGITS = np.zeros(256, np.uint8)
+for value, char in enumerate(b"0123456789abcdef"):
+    _HEX_DIGITS[char] = value
+    _HEX_DIGITS[ord(chr(char).upper())] = value
+
+# Lookup table from ASCII characters to the type of delimiter they are in a candump line
+_NEWLINE, _CLOSE_PAREN, _HASH, _DOT, _SPACE = range(1, 6)
+_NUM_DELIMITER_TYPES = 5
+_DELIMITERS = np.zeros(256, np.uint8)
+_DELIMITERS[ord("\n")] = _NEWLINE
+_DELIMITERS[ord(")")] = _CLOSE_PAREN
+_DELIMITERS[ord("#")] = _HASH
+_DELIMITERS[ord(".")] = _DOT
+_DELIMITERS[ord(" ")] = _SPACE
+_DELIMITERS[ord("\t")] = _SPACE
+
+class CanFrames(object):
+    """ Columnar batch of CAN frames.
+
+    timestamps: float64 array of frame timestamps [s]
+    buses: Bytes array of the interface each frame was received on
+    ids: uint32 array of arbitration ids
+    lengths: uint8 array with the number of data bytes in each frame
+    data: uint8 matrix of frame data, one row per frame padded with zeros to a fixed width
+    extended: bool array, True for frames with a 29 bit extended id
+    """
+    __slots__ = ("timestamps", "buses", "ids", "lengths", "data", "extended")
+
+    def __init__(self, timestamps, buses, ids, lengths, data, extended):
+        self.timestamps = timestamps
+        self.buses = buses
+        self.ids = ids
+        self.lengths = lengths
+        self.data = data
+        self.extended = extended
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.float64), np.empty(0, "S1"), np.empty(0, np.uint32), \
+            np.empty(0, np.uint8), np.empty((0, MIN_PAYLOAD_WIDTH), np.uint8), np.empty(0, bool))
+
+    @classmethod
+    def from_lists(cls, timestamps, buses, ids, payloads, extended):
+        """ Creates a batch from lists with the fields of each frame.
+
+        timestamps: List of frame timestamps [s]
+        buses: List of interface names as str
+        ids: List of arbitration ids
+        payloads: List of the data of each frame as bytes
+        extended: List of whether each frame has an extended id
+        """
+        if not timestamps:
+            return cls.empty()
+
+        lengths = np.array([len(payload) for payload in payloads], np.uint8)
+        width = max(MIN_PAYLOAD_WIDTH, int(lengths.max()))
+        data = b"".join(payload.ljust(width, b"\0") for payload in payloads)
+
+        return cls(np.array(timestamps, np.float64), np.array(buses, "S"), \
+            np.array(ids, np.uint32), lengths, \
+            np.frombuffer(data, np.uint8).reshape(len(payloads), width).copy(), \
+            np.array(extended, bool))
+
+    def __len__(self):
+        return self.timestamps.size
+
+    def select(self, mask):
+        """ Returns a new batch with only the frames selected by a boolean mask or index array. """
+        return CanFrames(self.timestamps[mask], self.buses[mask], self.ids[mask], \
+            self.lengths[mask], self.data[mask], self.extended[mask])
+
+    def payload(self, index):
+        """ Returns the data of a single frame as bytes. """
+        return self.data[index, :self.lengths[index]].tobytes()
+
+def parse_candump(log_lines, frame_ids=None):
+    """ Parses a batch of candump log lines (recorded with 'candump' with '-l') at once.
+
+    Each line has the format '(<timestamp>) <bus> <id>#<data>', or '<id>##<flags><data>' for CAN
+    FD frames. Ids written with more than STANDARD_ID_DIGITS digits are extended ids, the same as
+    candump does. Rather than splitting each line, the positions of the delimiters are located
+    across the entire batch and every field is extracted with array operations. Lines that are not
+    CAN frames are skipped.
+
+    log_lines: List of lines as str, or a bytes like object containing many lines
+    frame_ids: Array of the arbitration ids to keep, or None to keep every frame. Other frames are
+        dropped before their data is parsed.
+    returns: CanFrames
+    """
+    buf = _as_buffer(log_lines)
+    lines = _locate_frames(buf) if buf.size else None
+    if lines is None:
+        return CanFrames.empty()
+    starts, ends, close_paren, hash_sign, dot, id_start = lines
+
+    # Fields are copied out of a zero padded buffer through fixed width windows, so no window can
+    # run past either end of the buffer. The padding covers the widest field of any line.
+    int_width = int((dot - starts).max()) - 1
+    frac_width = int((close_paren - dot).max()) - 1
+    bus_width = int((id_start - close_paren).max())
+    pad = max(int((ends - hash_sign).max()), 2 * MIN_PAYLOAD_WIDTH, int_width, frac_width, \
+        bus_width, MAX_ID_DIGITS)
+    padded = np.zeros(buf.size + 2 * pad, np.uint8)
+    padded[pad:pad + buf.size] = buf
+    view = _FieldView(padded, pad)
+
+    ids = _parse_ids(view, id_start, hash_sign)
+
+    # Frames with ids that are not needed are dropped before the rest of their fields are parsed
+    if frame_ids is not None:
+        needed = np.isin(ids, frame_ids)
+        if not needed.all():
+            starts, ends, ids = starts[needed], ends[needed], ids[needed]
+            close_paren, hash_sign, dot, id_start = \
+                close_paren[needed], hash_sign[needed], dot[needed], id_start[needed]
+        if not starts.size:
+            return CanFrames.empty()
+        int_width = int((dot - starts).max()) - 1
+        frac_width = int((close_paren - dot).max()) - 1
+        bus_width = int((id_start - close_paren).max())
+
+    extended = _is_extended(id_start, hash_sign, ids)
+
+    # Data follows the '#', or the flags nibble after '##' for CAN FD frames. Trailing whitespace
+    # is excluded.
+    data_start = hash_sign + 1
+    # A frame without data at the very end of the buffer has nothing after its '#'
+    fd = (data_start < buf.size) & (buf[np.minimum(data_start, buf.size - 1)] == ord("#"))
+    data_start[fd] += 2
+    data_end = np.maximum(ends, data_start)
+    while True:
+        trailing = (data_end > data_start) & _is_whitespace(buf[np.maximum(data_end - 1, 0)])
+        if not trailing.any():
+            break
+        data_end[trailing] -= 1
+
+    lengths = ((data_end - data_start) // 2).astype(np.uint8)
+    width = max(MIN_PAYLOAD_WIDTH, int(lengths.max()))
+
+    timestamps = _parse_timestamps(view, starts + 1, dot, close_paren, int_width, frac_width)
+
+    buses = view.left_aligned(close_paren + 1, id_start - 1, bus_width)
+    buses = np.char.strip(buses.view("S%d" % bus_width).ravel())
+
+    data_chars = view.left_aligned(data_start, data_start + 2 * lengths.astype(np.int64), 2 * width)
+    digits = np.take(_HEX_DIGITS, data_chars)
+    data = (digits[:, 0::2] << 4) | digits[:, 1::2]
+
+    return CanFrames(timestamps, buses, ids, lengths, data, extended)
+
+def parse_candump_ids(log_lines):
+    """ Parses only the arbitration id of each frame in a batch of candump log lines, along with
+    the position of its line, e.g. for indexing a log.
+
+    Lines that are not CAN frames are skipped, the same as parse_candump().
+
+    log_lines: List of lines as str, or a bytes like object containing many lines
+    returns: Tuple of the arrays of the start and end offset of the line of each frame within the
+        batch, excluding the newline, the uint32 arbitration id of each frame, and whether each id
+        is extended
+    """
+    buf = _as_buffer(log_lines)
+    lines = _locate_frames(buf) if buf.size else None
+    if lines is None:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.uint32), \
+            np.empty(0, bool)
+    starts, ends, _, hash_sign, _, id_start = lines
+
+    # Ids are right aligned against the '#', so only padding before the buffer is needed
+    padded = np.zeros(buf.size + MAX_ID_DIGITS, np.uint8)
+    padded[MAX_ID_DIGITS:] = buf
+    ids = _parse_ids(_FieldView(padded, MAX_ID_DIGITS), id_start, hash_sign)
+    return starts, ends, ids, _is_extended(id_start, hash_sign, ids)
+
+def id_keys(ids, extended):
+    """ Returns uint32 keys which identify each id along with whether it is extended, so standard
+    and extended ids with the same value have different keys, see EXTENDED_KEY_FLAG.
+
+    ids: Array of arbitration ids
+    extended: bool array, True for extended ids
+    """
+    return np.where(extended, ids | np.uint32(EXTENDED_KEY_FLAG), ids).astype(np.uint32)
+
+def parse_id_key(id):
+    """ Returns the key of an arbitration id written in hex the same as candump, where ids with more
+    than STANDARD_ID_DIGITS digits are extended, see id_keys().
+
+    raises: ValueError if the id is not in hex
+    """
+    digits = id[2:] if id.lower().startswith("0x") else id
+    value = int(digits, 16)
+    return int(id_keys(value, len(digits) > STANDARD_ID_DIGITS or value > MAX_STANDARD_ID))
+
+def format_candump(frames):
+    """ Formats a batch of frames as candump log lines (as recorded with 'candump' with '-l').
+
+    Extended ids are written with MAX_ID_DIGITS digits, and frames with more than 8 bytes of data
+    are written as CAN FD frames.
+
+    frames: CanFrames
+    returns: str containing a line for each frame
+    """
+    lines = []
+    for stamp, bus, id, extended, length, data in zip(frames.timestamps.tolist(), \
+        frames.buses.tolist(), frames.ids.tolist(), frames.extended.tolist(), \
+        frames.lengths.tolist(), frames.data):
+        lines.append("(%.6f) %s %s%s%s\n" % (stamp, bus.decode(), format_id(id, extended), \
+            "#" if length <= 8 else "##0", data[:length].tobytes().hex().upper()))
+
+    return "".join(lines)
+
+def format_id(id, extended):
+    """ Formats an arbitration id as hex the same as candump, with MAX_ID_DIGITS digits for extended
+    ids and STANDARD_ID_DIGITS digits otherwise.
+    """
+    return "%0*X" % (MAX_ID_DIGITS if extended else STANDARD_ID_DIGITS, id)
+
+def parse_candump_line(line):
+    """ Extracts the timestamp, bus, arbitration id, and data from a single line in a can log file
+    recorded with candump -l.
+    """
+    stamp, bus, msg = line.split()
+    stamp = float(stamp[1:-1])
+    id, data = msg.split("#")
+    id = int(id, 16)
+    data = bytearray.fromhex(data)
+
+    return stamp, bus, id, data
+
+def _as_buffer(log_lines):
+    """ Returns a uint8 array of the bytes of a batch of log lines, without copying bytes. """
+    if not isinstance(log_lines, (bytes, bytearray, memoryview)):
+        log_lines = "".join(log_lines).encode()
+
+    return np.frombuffer(log_lines, np.uint8)
+
+def _locate_frames(buf):
+    """ Locates the delimiters of every line in a buffer of candump log lines which is a CAN frame.
+
+    returns: Tuple of the arrays of the positions of the start and end of each line, the ')', the
+        '#', the '.' in the timestamp, and the start of the id, or None when there are no frames
+    """
+    # Find all delimiters in a single pass over the buffer, then split them up by type. All of the
+    # delimiters are below '0' in the ASCII table, so this first finds all of those characters.
+    candidates = np.flatnonzero(buf < ord("0"))
+    delimiter_types = np.take(_DELIMITERS, buf[candidates])
+    delimiters = candidates[delimiter_types != 0]
+    delimiter_types = delimiter_types[delimiter_types != 0]
+    positions = {}
+    for delimiter_type in range(1, _NUM_DELIMITER_TYPES + 1):
+        positions[delimiter_type] = delimiters[delimiter_types == delimiter_type]
+
+    # Locate the start and end of every line
+    ends = positions[_NEWLINE]
+    if ends.size == 0 or ends[-1] != buf.size - 1:
+        ends = np.append(ends, buf.size)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    # Locate the delimiters of each line. Since lines are in order, the first delimiter in a line
+    # is found by searching from the start of that line.
+    close_paren = _first_after(positions[_CLOSE_PAREN], starts, ends)
+    hash_sign = _first_after(positions[_HASH], starts, ends)
+    dot = _first_after(positions[_DOT], starts, close_paren)
+
+    # The id starts after the last space preceding the '#'
+    spaces = positions[_SPACE]
+    if not spaces.size:
+        return None
+    id_space = np.searchsorted(spaces, hash_sign) - 1
+    id_start = np.where(id_space >= 0, spaces[np.maximum(id_space, 0)] + 1, -1)
+
+    valid = (ends > starts) & (buf[np.minimum(starts, buf.size - 1)] == ord("(")) & \
+        (dot > starts) & (close_paren > dot) & (hash_sign > close_paren) & \
+        (id_start > close_paren + 1) & (hash_sign > id_start) & \
+        (hash_sign - id_start <= MAX_ID_DIGITS)
+    if not valid.all():
+        starts, ends = starts[valid], ends[valid]
+        close_paren, hash_sign, dot, id_start = \
+            close_paren[valid], hash_sign[valid], dot[valid], id_start[valid]
+    if not starts.size:
+        return None
+
+    return starts, ends, close_paren, hash_sign, dot, id_start
+
+def _parse_ids(view, id_start, hash_sign):
+    """ Parses the hexadecimal arbitration ids in [id_start, hash_sign) of each line. """
+    id_digits = np.take(_HEX_DIGITS, view.right_aligned(id_start, hash_sign, MAX_ID_DIGITS))
+    return id_digits.astype(np.uint32) @ (16 ** np.arange(MAX_ID_DIGITS - 1, -1, -1, np.uint32))
+
+def _is_extended(id_start, hash_sign, ids):
+    """ Returns whether each id is extended, from the number of digits it is written with. """
+    return (hash_sign - id_start > STANDARD_ID_DIGITS) | (ids > MAX_STANDARD_ID)
+
+def _first_after(positions, starts, ends):
+    """ Returns the first of the sorted positions within [start, end) for each line, or -1 when
+    there is none.
+    """
+    # Usually there is exactly one position in each line, which can be used as is
+    if positions.size == starts.size and \
+        np.all((positions >= starts) & (positions < ends)):
+        return positions
+
+    if not positions.size:
+        return np.full(starts.size, -1, np.int64)
+
+    index = np.searchsorted(positions, starts)
+    found = index < positions.size
+    first = np.where(found, positions[np.minimum(index, positions.size - 1)], -1)
+    first[found & (first >= ends)] = -1
+    return first
+
+class _FieldView(object):
+    """ Extracts fixed width fields from a buffer padded with zeros at both ends. """
+    def __init__(self, padded, pad):
+        self.padded = padded
+        self.pad = pad
+
+    def left_aligned(self, starts, ends, width):
+        """ Returns a matrix with the bytes in [start, end) of each row, followed by zeros. """
+        chars = self.__windows(width)[starts + self.pad]
+        lengths = ends - starts
+        if lengths.min() < width:
+            chars *= np.arange(width) < lengths[:, None]
+        return chars
+
+    def right_aligned(self, starts, ends, width):
+        """ Returns a matrix with the bytes in [start, end) of each row, preceded by zeros. """
+        chars = self.__windows(width)[ends - width + self.pad]
+        lengths = ends - starts
+        if lengths.min() < width:
+            chars *= np.arange(width, 0, -1) <= lengths[:, None]
+        return chars
+
+    def __windows(self, width):
+        return np.lib.stride_tricks.sliding_window_view(self.padded, width)
+
+def _is_whitespace(chars):
+    return (chars == ord(" ")) | (chars == ord("\t")) | (chars == ord("\r"))
+
+def _parse_timestamps(view, starts, dots, ends, int_width, frac_width):
+    """ Parses decimal numbers in [start, end) of each row with a '.' at dots.
+
+    The digits are combined into an exact integer which is then divided by a power of ten. When
+    both are exactly representable as a float the single division gives the same correctly rounded
+    result as float(). Numbers with too many digits for this are converted from strings instead.
+    """
+    timestamps = np.empty(starts.size, np.float64)
+    exact = np.zeros(starts.size, bool)
+
+    num_digits = int_width + frac_width
+    if num_digits <= MAX_TIMESTAMP_DIGITS:
+        digits = np.concatenate((view.right_aligned(starts, dots, int_width), \
+            view.left_aligned(dots + 1, ends, frac_width)), axis=1)
+        digits = np.take(_HEX_DIGITS, digits).astype(np.float64)
+
+        # All the partial sums are integers, so they are exact until reaching 2^53
+        numerators = digits @ (10.0 ** np.arange(num_digits - 1, -1, -1))
+        exact = numerators < 2**53
+        timestamps[exact] = numerators[exact] / 10.0 ** frac_width
+
+    if not exact.all():
+        inexact = ~exact
+        text = view.left_aligned(starts[inexact], ends[inexact], \
+            int((ends[inexact] - starts[inexact]).max()))
+        timestamps[inexact] = text.view("S%d" % text.shape[1]).ravel().astype(np.float64)
+
+    return timestamps
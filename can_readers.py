@@ -0,0 +1,343 @@
+import can_log
+import log_file
+import numpy as np
+import os
+import struct
+
+# Number of frames in each batch yielded by the readers
+BATCH_SIZE = 65536
+
+# Link type of pcap captures of SocketCAN frames
+LINKTYPE_CAN_SOCKETCAN = 227
+
+# Flags in the upper bits of a SocketCAN id
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x7FF
+
+# Size of the SocketCAN header preceding the data of each frame in a capture [bytes]
+SOCKETCAN_HEADER_SIZE = 8
+
+# Registered readers, mapping format names to functions which take a filename and optional array of
+# frame ids to keep, and yield batches of frames as can_log.CanFrames
+READERS = {}
+
+# File extensions of each of the registered formats
+EXTENSIONS = {}
+
+def register_reader(name, extensions=()):
+    """ Decorator registering a CAN log reader for a format.
+
+    The reader is called with the path to a log file and an array of the frame ids to keep (or None
+    to keep every frame), and must yield can_log.CanFrames batches in the order the frames were
+    recorded.
+
+    name: Name of the format
+    extensions: File extensions that are detected as this format, e.g. ".blf"
+    """
+    def register(reader):
+        READERS[name] = reader
+        for extension in extensions:
+            EXTENSIONS[extension.lower()] = name
+        return reader
+
+    return register
+
+def detect_format(filename, default="candump"):
+    """ Returns the name of the format of a log from its file extension. """
+    return EXTENSIONS.get(os.path.splitext(filename)[1].lower(), default)
+
+def read_can_frames(filename, log_format=None, frame_ids=None):
+    """ Yields the frames in a CAN log as batches of can_log.CanFrames.
+
+    filename: Path to the log file
+    log_format: Name of the format of the log, detected from the file extension if not provided
+    frame_ids: Array of the arbitration ids to keep, or None to keep every frame. Candump logs drop
+        other frames before parsing anything but their id, see can_log.parse_candump().
+    """
+    if log_format is None:
+        log_format = detect_format(filename)
+
+    if log_format not in READERS:
+        raise ValueError("Unknown CAN log format '%s', must be one of: %s" % \
+            (log_format, ", ".join(sorted(READERS))))
+
+    return READERS[log_format](filename, frame_ids)
+
+@register_reader("candump", (".log",))
+def read_candump(filename, frame_ids=None):
+    """ Reads a log recorded with 'candump' with the '-l' option. """
+    with log_file.LogFile(filename) as log:
+        for chunk in log.chunks():
+            yield can_log.parse_candump(chunk, frame_ids)
+
+@register_reader("candump_ta")
+def read_candump_ta(filename, frame_ids=None):
+    """ Reads a log recorded with 'candump' with the '-ta' options, which has lines in the format
+    '(<timestamp>) <bus> <id> [<length>] <data bytes>'.
+    """
+    return _select_ids(_read_candump_ta(filename), frame_ids)
+
+def _read_candump_ta(filename):
+    batch = ([], [], [], [], [])
+    with open(filename, "r") as file:
+        for line in file:
+            line_split = line.split()
+            if len(line_split) < 4:
+                continue
+
+            batch[0].append(float(line_split[0][1:-1]))
+            batch[1].append(line_split[1])
+            batch[2].append(int(line_split[2], 16))
+            batch[3].append(bytes.fromhex("".join(line_split[4:])))
+            batch[4].append(len(line_split[2]) > can_log.STANDARD_ID_DIGITS or \
+                batch[2][-1] > can_log.MAX_STANDARD_ID)
+
+            if len(batch[0]) == BATCH_SIZE:
+                yield can_log.CanFrames.from_lists(*batch)
+                batch = ([], [], [], [], [])
+
+    if batch[0]:
+        yield can_log.CanFrames.from_lists(*batch)
+
+def _select_ids(batches, frame_ids):
+    """ Yields batches of frames with only the frames with ids in frame_ids, or every frame when
+    frame_ids is None.
+    """
+    for frames in batches:
+        if frame_ids is not None:
+            frames = frames.select(np.isin(frames.ids, frame_ids))
+        if len(frames):
+            yield frames
+
+def _read_python_can(reader):
+    """ Yields batches of frames from a python-can log reader, skipping error and remote frames. """
+    batch = ([], [], [], [], [])
+    for msg in reader:
+        if msg.is_error_frame or msg.is_remote_frame:
+            continue
+
+        batch[0].append(msg.timestamp)
+        batch[1].append("can%s" % msg.channel if isinstance(msg.channel, int) else \
+            str(msg.channel))
+        batch[2].append(msg.arbitration_id)
+        batch[3].append(bytes(msg.data))
+        batch[4].append(bool(msg.is_extended_id))
+
+        if len(batch[0]) == BATCH_SIZE:
+            yield can_log.CanFrames.from_lists(*batch)
+            batch = ([], [], [], [], [])
+
+    if batch[0]:
+        yield can_log.CanFrames.from_lists(*batch)
+
+def _import_python_can():
+    try:
+        import can
+    except ImportError:
+        raise ImportError("Reading BLF and ASC logs requires python-can (pip install python-can)")
+    return can
+
+@register_reader("blf", (".blf",))
+def read_blf(filename, frame_ids=None):
+    """ Reads a Vector binary logging format (BLF) log with python-can. """
+    can = _import_python_can()
+    reader = can.BLFReader(filename)
+    try:
+        yield from _select_ids(_read_python_can(reader), frame_ids)
+    finally:
+        reader.stop()
+
+@register_reader("asc", (".asc",))
+def read_asc(filename, frame_ids=None):
+    """ Reads a Vector ASCII (ASC) log with python-can. """
+    can = _import_python_can()
+    reader = can.ASCReader(filename, relative_timestamp=False)
+    try:
+        yield from _select_ids(_read_python_can(reader), frame_ids)
+    finally:
+        reader.stop()
+
+@register_reader("pcap", (".pcap", ".pcapng"))
+def read_pcap(filename, frame_ids=None):
+    """ Reads a pcap or pcapng capture of SocketCAN frames (e.g. recorded with tcpdump or Wireshark
+    on a CAN interface).
+    """
+    with log_file.LogFile(filename) as log:
+        buf = log.view()
+        if len(buf) >= 4 and bytes(buf[:4]) == b"\x0a\x0d\x0d\x0a":
+            yield from _select_ids(_read_pcapng(buf), frame_ids)
+        else:
+            yield from _select_ids(_read_pcap(buf), frame_ids)
+
+def _read_pcap(buf):
+    """ Yields batches of frames from a pcap capture.
+
+    Captures of classic CAN frames usually have the same length for every record, in which case the
+    records are viewed as a matrix and decoded with array operations. Otherwise each record is read
+    individually.
+    """
+    magic = bytes(buf[:4])
+    if magic in (b"\xd4\xc3\xb2\xa1", b"\x4d\x3c\xb2\xa1"):
+        endian = "<"
+    elif magic in (b"\xa1\xb2\xc3\xd4", b"\xa1\xb2\x3c\x4d"):
+        endian = ">"
+    else:
+        raise ValueError("Not a pcap or pcapng file")
+    resolution = 1e9 if magic in (b"\x4d\x3c\xb2\xa1", b"\xa1\xb2\x3c\x4d") else 1e6
+
+    link_type = struct.unpack_from(endian + "I", buf, 20)[0] & 0x0FFFFFFF
+    if link_type != LINKTYPE_CAN_SOCKETCAN:
+        raise ValueError("pcap file has link type %d, expected SocketCAN (%d)" % \
+            (link_type, LINKTYPE_CAN_SOCKETCAN))
+
+    offset = 24
+    if len(buf) > offset + 16:
+        record_size = 16 + struct.unpack_from(endian + "I", buf, offset + 8)[0]
+        num_records = (len(buf) - offset) // record_size
+        if (len(buf) - offset) % record_size == 0:
+            records = np.frombuffer(buf, np.uint8, num_records * record_size, offset) \
+                .reshape(num_records, record_size)
+            captured = records[:, 8:12].copy().view(endian + "u4").ravel()
+            if record_size >= 16 + SOCKETCAN_HEADER_SIZE and \
+                np.all(captured == record_size - 16):
+                for start in range(0, num_records, BATCH_SIZE):
+                    yield _socketcan_frames(records[start:start + BATCH_SIZE], endian, resolution)
+                return
+
+    batch = ([], [], [], [], [])
+    while offset + 16 <= len(buf):
+        seconds, fraction, captured, _ = struct.unpack_from(endian + "IIII", buf, offset)
+        frame = _parse_socketcan(buf[offset + 16:offset + 16 + captured])
+        offset += 16 + captured
+        if frame is None:
+            continue
+
+        batch[0].append(_pcap_timestamps(seconds, fraction, resolution))
+        batch[1].append("can0")
+        batch[2].append(frame[0])
+        batch[3].append(frame[1])
+        batch[4].append(frame[2])
+
+        if len(batch[0]) == BATCH_SIZE:
+            yield can_log.CanFrames.from_lists(*batch)
+            batch = ([], [], [], [], [])
+
+    if batch[0]:
+        yield can_log.CanFrames.from_lists(*batch)
+
+def _socketcan_frames(records, endian, resolution):
+    """ Decodes a matrix of fixed size pcap records holding SocketCAN frames. """
+    seconds = records[:, 0:4].copy().view(endian + "u4").ravel()
+    fraction = records[:, 4:8].copy().view(endian + "u4").ravel()
+    timestamps = _pcap_timestamps(seconds.astype(np.int64), fraction.astype(np.int64), resolution)
+
+    # SocketCAN ids are stored in network byte order
+    can_ids = records[:, 16:20].copy().view(">u4").ravel()
+    valid = (can_ids & (CAN_RTR_FLAG | CAN_ERR_FLAG)) == 0
+    extended = (can_ids & CAN_EFF_FLAG) != 0
+    ids = np.where(extended, can_ids & CAN_EFF_MASK, can_ids & CAN_SFF_MASK)
+
+    width = records.shape[1] - 16 - SOCKETCAN_HEADER_SIZE
+    lengths = np.minimum(records[:, 20], width)
+    data = np.zeros((records.shape[0], max(width, can_log.MIN_PAYLOAD_WIDTH)), np.uint8)
+    data[:, :width] = records[:, 16 + SOCKETCAN_HEADER_SIZE:]
+    data[np.arange(data.shape[1]) >= lengths[:, None]] = 0
+
+    frames = can_log.CanFrames(timestamps, np.full(records.shape[0], b"can0", "S4"), \
+        ids.astype(np.uint32), lengths.astype(np.uint8), data, extended)
+    return frames if valid.all() else frames.select(valid)
+
+def _pcap_timestamps(seconds, fraction, resolution):
+    """ Combines the seconds and fractional parts of pcap timestamps [s]. """
+    if resolution == 1e6:
+        # Combining as an integer number of microseconds keeps the division correctly rounded, so
+        # the timestamps match those parsed from a candump log
+        return (seconds * 1000000 + fraction) / 1e6
+    else:
+        return seconds + fraction / resolution
+
+def _parse_socketcan(packet):
+    """ Returns the arbitration id, data, and whether the id is extended of a SocketCAN frame, or
+    None for error and remote frames.
+    """
+    if len(packet) < SOCKETCAN_HEADER_SIZE:
+        return None
+
+    can_id, length = struct.unpack_from(">IB", packet)
+    if can_id & (CAN_RTR_FLAG | CAN_ERR_FLAG):
+        return None
+
+    extended = bool(can_id & CAN_EFF_FLAG)
+    id = can_id & CAN_EFF_MASK if extended else can_id & CAN_SFF_MASK
+    return id, bytes(packet[SOCKETCAN_HEADER_SIZE:SOCKETCAN_HEADER_SIZE + length]), extended
+
+def _read_pcapng(buf):
+    """ Yields batches of frames from a pcapng capture. """
+    endian = "<"
+    interfaces = []
+    batch = ([], [], [], [], [])
+
+    offset = 0
+    while offset + 12 <= len(buf):
+        if bytes(buf[offset:offset + 4]) == b"\x0a\x0d\x0d\x0a":
+            # Section header, which sets the byte order of the following blocks
+            endian = "<" if bytes(buf[offset + 8:offset + 12]) == b"\x4d\x3c\x2b\x1a" else ">"
+            interfaces = []
+
+        block_type, block_length = struct.unpack_from(endian + "II", buf, offset)
+        if block_length < 12:
+            raise ValueError("Invalid pcapng block length %d" % block_length)
+
+        if block_type == 1:
+            interfaces.append(_parse_pcapng_interface(buf, offset, block_length, endian, \
+                len(interfaces)))
+        elif block_type == 6:
+            interface, high, low, captured = struct.unpack_from(endian + "IIII", buf, offset + 8)
+            link_type, name, resolution = interfaces[interface]
+            frame = None
+            if link_type == LINKTYPE_CAN_SOCKETCAN:
+                frame = _parse_socketcan(buf[offset + 28:offset + 28 + captured])
+
+            if frame is not None:
+                batch[0].append(((high << 32) | low) / resolution)
+                batch[1].append(name)
+                batch[2].append(frame[0])
+                batch[3].append(frame[1])
+                batch[4].append(frame[2])
+
+                if len(batch[0]) == BATCH_SIZE:
+                    yield can_log.CanFrames.from_lists(*batch)
+                    batch = ([], [], [], [], [])
+
+        offset += block_length
+
+    if batch[0]:
+        yield can_log.CanFrames.from_lists(*batch)
+
+def _parse_pcapng_interface(buf, offset, block_length, endian, index):
+    """ Returns the link type, name, and timestamp resolution of a pcapng interface description
+    block.
+    """
+    link_type = struct.unpack_from(endian + "H", buf, offset + 8)[0]
+    name = "can%d" % index
+    resolution = 1e6
+
+    option = offset + 16
+    end = offset + block_length - 4
+    while option + 4 <= end:
+        code, length = struct.unpack_from(endian + "HH", buf, option)
+        if code == 0:
+            break
+
+        value = bytes(buf[option + 4:option + 4 + length])
+        if code == 2:
+            name = value.rstrip(b"\0").decode("utf-8", errors="replace")
+        elif code == 9:
+            resolution = 2.0 ** (value[0] & 0x7F) if value[0] & 0x80 else 10.0 ** value[0]
+
+        option += 4 + (length + 3) // 4 * 4
+
+    return link_type, name, resolution
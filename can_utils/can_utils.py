@@ -1,5 +1,20 @@
 #!/usr/bin/env python3
 
+import concurrent.futures
+import itertools
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can_log
+import can_readers
+import log_file
+
+# Number of lines parsed at once when computing statistics from an iterable of lines
+LINE_CHUNK_SIZE = 65536
+
 class CanByteStats():
     def __init__(self, initial_val: int = 0):
         self.min: int = initial_val
@@ -13,51 +28,169 @@ class CanByteStats():
 
 
 class CanFrameStats():
-    def __init__(self, id: str, start_time: float, data: str):
-        n_bytes = int(len(data) / 2)
-
+    """ Statistics of a single CAN id, see CanIdStats. """
+    def __init__(self, id: str, msgs: int, bytes_min: int, bytes_max: int, start_time: float, \
+        end_time: float, byte_stats: list):
         self.id = id
-        self.msgs: int = 0
-        self.bytes_min: int = n_bytes
-        self.bytes_max: int = n_bytes
+        self.msgs: int = msgs
+        self.bytes_min: int = bytes_min
+        self.bytes_max: int = bytes_max
         self.start_time: float = start_time
-        self.end_time: float = start_time
-        self.byte_stats: list[CanByteStats] = []
-
-        self._update_byte_stats(data)
-
-    def update(self, stamp: float, data: str):
-        n_bytes = int(len(data) / 2)
-
-        self.msgs += 1
-        self.end_time = stamp
-        self.bytes_min = min(n_bytes, self.bytes_min)
-        self.bytes_max = max(n_bytes, self.bytes_max)
-
-        self._update_byte_stats(data)
+        self.end_time: float = end_time
+        self.byte_stats: list[CanByteStats] = byte_stats
 
     def avg_frequency(self):
-        if self.msgs > 1:
-            return self.msgs / (self.end_time - self.start_time)
+        # The count includes the first frame, so there is one interval fewer than frames
+        if self.msgs > 1 and self.end_time > self.start_time:
+            return (self.msgs - 1) / (self.end_time - self.start_time)
         else:
             return 0.0
 
-    def _update_byte_stats(self, data: str):
-        n_bytes = int(len(data) / 2)
-
-        for i in range(n_bytes):
-            name = f"byte_{str(i)}"
-            val = int(f"0x{data[2*i:2*i + 2]}", 16)
-
-            if i + 1 > len(self.byte_stats):
-                self.byte_stats.append(CanByteStats(val))
-            else:
-                self.byte_stats[i].update(val)
-
     def __str__(self):
         return "{:10} | {:9} |  {:6.2f}".format(self.id, self.msgs, self.avg_frequency())
 
 
+class CanIdStats():
+    """ Accumulates the statistics of every CAN id in a log from batches of frames.
+
+    The statistics are held in NumPy arrays with a row for each id, sorted by id with the standard
+    ids first, and each batch of frames is reduced with array operations rather than one frame at a
+    time. Standard and extended ids with the same value are kept apart. Statistics gathered
+    separately (e.g. from shards of a log processed in parallel) are combined with merge().
+
+    ids: uint32 array of the arbitration ids
+    extended: bool array, True for extended ids
+    msgs: Number of frames with each id
+    start_times, end_times: Timestamp of the first and last frame with each id [s]
+    bytes_min, bytes_max: Minimum and maximum number of data bytes in the frames with each id
+    byte_min, byte_max: uint8 matrices of the minimum and maximum value of each data byte, with a
+        column for each byte. Bytes beyond the longest frame of an id are 255 and 0 respectively.
+    """
+    def __init__(self):
+        self.ids = np.empty(0, np.uint32)
+        self.extended = np.empty(0, bool)
+        self.msgs = np.empty(0, np.int64)
+        self.start_times = np.empty(0, np.float64)
+        self.end_times = np.empty(0, np.float64)
+        self.bytes_min = np.empty(0, np.uint8)
+        self.bytes_max = np.empty(0, np.uint8)
+        self.byte_min = np.empty((0, can_log.MIN_PAYLOAD_WIDTH), np.uint8)
+        self.byte_max = np.empty((0, can_log.MIN_PAYLOAD_WIDTH), np.uint8)
+
+    def __len__(self):
+        return self.ids.size
+
+    def update(self, frames):
+        """ Adds a batch of frames to the statistics.
+
+        frames: can_log.CanFrames
+        """
+        if not len(frames):
+            return
+
+        # Bytes beyond the length of a frame are padding, they must not affect the byte ranges
+        present = np.arange(frames.data.shape[1]) < frames.lengths[:, None]
+        byte_min = np.where(present, frames.data, np.uint8(255))
+        byte_max = np.where(present, frames.data, np.uint8(0))
+
+        batch = CanIdStats()
+        batch.__set(*_reduce_by_id(can_log.id_keys(frames.ids, frames.extended), \
+            np.ones(len(frames), np.int64), frames.timestamps, frames.timestamps, frames.lengths, \
+            frames.lengths, byte_min, byte_max))
+        self.merge(batch)
+
+    def merge(self, other):
+        """ Adds the statistics gathered by another CanIdStats. """
+        if not len(other):
+            return
+        if not len(self):
+            self.__set(can_log.id_keys(other.ids, other.extended), other.msgs, other.start_times, \
+                other.end_times, other.bytes_min, other.bytes_max, other.byte_min, other.byte_max)
+            return
+
+        width = max(self.byte_min.shape[1], other.byte_min.shape[1])
+        self.__set(*_reduce_by_id(np.concatenate((can_log.id_keys(self.ids, self.extended), \
+            can_log.id_keys(other.ids, other.extended))), \
+            np.concatenate((self.msgs, other.msgs)), \
+            np.concatenate((self.start_times, other.start_times)), \
+            np.concatenate((self.end_times, other.end_times)), \
+            np.concatenate((self.bytes_min, other.bytes_min)), \
+            np.concatenate((self.bytes_max, other.bytes_max)), \
+            np.concatenate((_pad(self.byte_min, width, 255), _pad(other.byte_min, width, 255))), \
+            np.concatenate((_pad(self.byte_max, width, 0), _pad(other.byte_max, width, 0)))))
+
+    def frame_stats(self):
+        """ Returns a dict mapping each id, as a hex string formatted the same as candump, to the
+        CanFrameStats for that id.
+        """
+        id_stats = {}
+        for i, (id, extended) in enumerate(zip(self.ids.tolist(), self.extended.tolist())):
+            id_str = can_log.format_id(id, extended)
+
+            byte_stats = []
+            for byte_min, byte_max in zip(self.byte_min[i, :self.bytes_max[i]].tolist(), \
+                self.byte_max[i, :self.bytes_max[i]].tolist()):
+                byte_stats.append(CanByteStats(byte_min))
+                byte_stats[-1].update(byte_max)
+
+            id_stats[id_str] = CanFrameStats(id_str, int(self.msgs[i]), int(self.bytes_min[i]), \
+                int(self.bytes_max[i]), float(self.start_times[i]), float(self.end_times[i]), \
+                byte_stats)
+
+        return id_stats
+
+    def __set(self, keys, msgs, start_times, end_times, bytes_min, bytes_max, byte_min, byte_max):
+        self.ids = keys & np.uint32(can_readers.CAN_EFF_MASK)
+        self.extended = keys >= can_log.EXTENDED_KEY_FLAG
+        self.msgs = msgs
+        self.start_times = start_times
+        self.end_times = end_times
+        self.bytes_min = bytes_min
+        self.bytes_max = bytes_max
+        self.byte_min = byte_min
+        self.byte_max = byte_max
+
+
+def _reduce_by_id(ids, msgs, start_times, end_times, bytes_min, bytes_max, byte_min, byte_max):
+    """ Combines the rows of the statistics arrays which have the same id.
+
+    returns: Tuple of the reduced arrays, in the same order as the arguments and sorted by id
+    """
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+
+    # Rows are grouped by id so each statistic can be reduced over contiguous slices at once
+    order = np.argsort(inverse, kind="stable")
+    groups = np.concatenate(([0], np.cumsum(np.bincount(inverse))[:-1]))
+
+    return unique_ids, np.add.reduceat(msgs[order], groups), \
+        np.minimum.reduceat(start_times[order], groups), \
+        np.maximum.reduceat(end_times[order], groups), \
+        np.minimum.reduceat(bytes_min[order], groups), \
+        np.maximum.reduceat(bytes_max[order], groups), \
+        np.minimum.reduceat(byte_min[order], groups, axis=0), \
+        np.maximum.reduceat(byte_max[order], groups, axis=0)
+
+
+def _pad(matrix, width, fill):
+    """ Pads the columns of a matrix up to width with a fill value. """
+    if matrix.shape[1] >= width:
+        return matrix
+
+    padded = np.full((matrix.shape[0], width), fill, matrix.dtype)
+    padded[:, :matrix.shape[1]] = matrix
+    return padded
+
+
+def _shard_id_stats(filename, start, end):
+    """ Computes the statistics of the CAN ids in a byte range of a candump log. """
+    stats = CanIdStats()
+    with log_file.LogFile(filename) as log:
+        for chunk in log.chunks(start, end):
+            stats.update(can_log.parse_candump(chunk))
+
+    return stats
+
+
 def parse_can_line(line):
     stamp, bus, msg = line.split()
     stamp = float(stamp[1:-1])
@@ -67,14 +200,50 @@ def parse_can_line(line):
 
 
 def get_id_stats_from_lines(lines):
-    id_stats = {}
-    for line in lines:
-        stamp, id, data = parse_can_line(line)
-        bytes = int(len(data) / 2)
-
-        if id not in id_stats:
-            id_stats[id] = CanFrameStats(id, float(stamp), data)
-        else:
-            id_stats[id].update(float(stamp), data)
-
-    return id_stats
+    """ Computes the statistics for every CAN id present in a candump log.
+
+    Lines are parsed in batches, so any iterable of lines can be provided (e.g. an open file) and
+    memory use does not depend on the size of the log.
+
+    returns: Dict mapping each id as a hex string to its CanFrameStats
+    """
+    stats = CanIdStats()
+    lines = iter(lines)
+    while True:
+        chunk = list(itertools.islice(lines, LINE_CHUNK_SIZE))
+        if not chunk:
+            break
+        stats.update(can_log.parse_candump(chunk))
+
+    return stats.frame_stats()
+
+
+def get_id_stats_from_file(filename, log_format=None, jobs=1):
+    """ Computes the statistics for every CAN id present in a CAN log.
+
+    The log is streamed in batches of frames, so memory use does not depend on the size of the log.
+    Candump logs can be split between multiple processes, each gathering the statistics of its own
+    portion of the log before they are merged.
+
+    filename: Path to the CAN log
+    log_format: Format of the log, detected from the file extension if not provided, see
+        can_readers
+    jobs: Number of processes to use for candump logs
+    returns: Dict mapping each id as a hex string to its CanFrameStats
+    """
+    log_format = log_format or can_readers.detect_format(filename)
+
+    stats = CanIdStats()
+    if log_format == "candump" and jobs > 1:
+        with log_file.LogFile(filename) as log:
+            shards = log.split(jobs)
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            for shard_stats in executor.map(_shard_id_stats, [filename] * len(shards), \
+                *zip(*shards)):
+                stats.merge(shard_stats)
+    else:
+        for frames in can_readers.read_can_frames(filename, log_format):
+            stats.update(frames)
+
+    return stats.frame_stats()
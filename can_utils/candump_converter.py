@@ -2,14 +2,23 @@
 
 import argparse
 import os
+import sys
 
-DESCRIPTION = """Convertes a candump recorded with options '-ta' for human
- readable format to one recorded with '-l' which can be replayed with canplayer"""
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can_log
+import can_readers
+
+DESCRIPTION = """Convertes a CAN log to the format recorded by candump with '-l' which can be
+ replayed with canplayer. By default the log is expected to be a candump recorded with options '-ta'
+ for human readable format, BLF, ASC, and pcap logs are detected from their file extension."""
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=DESCRIPTION)
     parser.add_argument("log", type=str, help="Path to logfile")
     parser.add_argument("--output", type=str, help="New file to write to, defaults to 'log'.converted")
+    parser.add_argument("--format", type=str, choices=sorted(can_readers.READERS), \
+        help="Format of the log, detected from the file extension by default")
 
     args = parser.parse_args()
 
@@ -24,16 +33,12 @@ if __name__ == '__main__':
     if not args.output:
         args.output = args.log + ".converted"
 
-    with open(args.log, "r") as file:
-        lines = file.readlines()
-
-    with open(args.output, "w") as file:
-        for line in lines:
-            line_split = line.split()
-            stamp = line_split[0]
-            bus = line_split[1]
-            id = line_split[2]
-            msg = "".join(line_split[4:])
+    # Text logs are expected to be recorded with '-ta' unless another format is given
+    log_format = args.format or can_readers.detect_format(args.log)
+    if not args.format and log_format == "candump":
+        log_format = "candump_ta"
 
-            new_line = "{} {} {}#{}\n".format(stamp, bus, id, msg)
-            file.write(new_line)
+    # Frames are read and written in batches, so the log is never held in memory
+    with open(args.output, "w") as out_file:
+        for frames in can_readers.read_can_frames(args.log, log_format):
+            out_file.write(can_log.format_candump(frames))
@@ -2,7 +2,14 @@
 
 import argparse
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can_log
+import can_readers
 import can_utils
+import signal_discovery
 
 DESCRIPTION = """Generates a DBC file with individual signals for every byte from every CAN id
 present in a log file."""
@@ -44,6 +51,13 @@ BS_:
 BU_: TODO
 """
 
+# Descriptions of the kinds of discovered signals, for the comments in the DBC file
+DISCOVERED_KINDS = {
+    "counter": "Counter, increments by one in each frame",
+    "checksum_xor": "Checksum, XOR of the other bytes",
+    "checksum_sum": "Checksum, sum of the other bytes",
+}
+
 def get_dbc_message_def(id, bytes):
     """ Generates a DBC file message definition for a particular CAN id with one signal for each
     byte present.
@@ -58,12 +72,7 @@ def get_dbc_message_def(id, bytes):
     :bytes: Number of bytes of data from this id
     """
     id_hex = id.lstrip("0")
-    id_field = int(id_hex, 16)
-    if id_field > 2047:
-        # This is an extended frame. The DBC file spec does not provide a flag
-        # to indicate this, instead a single bit in the id field is used instead
-        # so we have to set that manually.
-        id_field += 0x80000000
+    id_field = get_dbc_id_field(id)
 
     msg_def = "BO_ " + str(id_field) + " ID_" + id_hex + ": " + str(max(bytes) + 1) + " TODO\n"
     for i in bytes:
@@ -71,6 +80,43 @@ def get_dbc_message_def(id, bytes):
 
     return msg_def
 
+def get_dbc_discovered_message_def(id, num_bytes, signals):
+    """ Generates a DBC file message definition for a particular CAN id with the signals inferred
+    from its data.
+
+    Example, for the CAN id 0x002 with a 16 bit big endian value in the first two bytes and a
+    counter in the low nibble of the third byte the following would be produced:
+        BO_ 2 ID_2: 3 TODO
+            SG_ ID_2_B1_B2_BE: 7|16@0+ (1, 0) [0|65535] "" TODO
+            SG_ ID_2_B3_0_3_COUNTER: 16|4@1+ (1, 0) [0|15] "" TODO
+
+    :id: CAN id in hex
+    :num_bytes: Number of bytes of data from this id
+    :signals: List of signal_discovery.DiscoveredSignal
+    """
+    id_hex = id.lstrip("0")
+
+    msg_def = "BO_ %d ID_%s: %d TODO\n" % (get_dbc_id_field(id), id_hex, num_bytes)
+    for signal in signals:
+        msg_def += "    SG_ ID_%s_%s: %d|%d@%d+ (1, 0) [0|%d] \"\" TODO\n" % (id_hex, signal.name, \
+            signal.start_bit, signal.length, 0 if signal.big_endian else 1, \
+            2**signal.length - 1)
+
+    return msg_def
+
+def get_dbc_id_field(id):
+    """ Returns the value of the id field of a DBC file message definition for a CAN id in hex,
+    formatted the same as candump so extended ids have more than can_log.STANDARD_ID_DIGITS digits.
+    """
+    id_field = int(id, 16)
+    if len(id) > can_log.STANDARD_ID_DIGITS or id_field > can_log.MAX_STANDARD_ID:
+        # This is an extended frame. The DBC file spec does not provide a flag
+        # to indicate this, instead a single bit in the id field is used instead
+        # so we have to set that manually.
+        id_field += 0x80000000
+
+    return id_field
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=DESCRIPTION)
     parser.add_argument("log", type=str, help="Path to CAN log")
@@ -83,6 +129,13 @@ if __name__ == '__main__':
         help="Minimum frequency, below which an ID is ignore")
     parser.add_argument("--max_frequency", type=float, default=None, \
         help="Maximum frequency, below which an ID is ignore")
+    parser.add_argument("--format", type=str, choices=sorted(can_readers.READERS), \
+        help="Format of the log, detected from the file extension by default")
+    parser.add_argument("--jobs", type=int, default=1, \
+        help="Number of processes to read candump logs with")
+    parser.add_argument("--discover", action="store_true", \
+        help="Infer signals from the bits of each id (counters, checksums, 16 bit values, and " \
+        "runs of changing bits) rather than creating a signal for every byte")
 
     args = parser.parse_args()
 
@@ -94,13 +147,28 @@ if __name__ == '__main__':
         print("ERROR: CAN log '%s' does not exist" % args.log)
         exit(1)
 
+    if args.jobs < 1:
+        print("ERROR: Number of jobs must be at least 1")
+        exit(1)
+
     if not args.output:
         args.output = os.path.splitext(args.log)[0] + ".dbc"
 
-    with open(args.log, "r") as file:
-        lines = file.readlines()
-
-    id_stats = can_utils.get_id_stats_from_lines(lines)
+    discovery = None
+    if args.discover:
+        # The bits are compared between consecutive frames of each id, so the log is read in order
+        # by a single process. The statistics are gathered in the same pass.
+        if args.jobs > 1:
+            print("WARNING: Signals are discovered with a single process")
+
+        stats = can_utils.CanIdStats()
+        discovery = signal_discovery.SignalDiscovery()
+        for frames in can_readers.read_can_frames(args.log, args.format):
+            stats.update(frames)
+            discovery.update(frames)
+        id_stats = stats.frame_stats()
+    else:
+        id_stats = can_utils.get_id_stats_from_file(args.log, args.format, args.jobs)
 
     if not id_stats:
         print("ERROR: No CAN data found in log!")
@@ -109,6 +177,8 @@ if __name__ == '__main__':
     with open(args.output, "w") as file:
         file.write(DBC_HEADER)
 
+        comments = []
+
         for id, stats in sorted(id_stats.items()):
             # Prune based on frequency
             avg_hz = stats.avg_frequency()
@@ -119,6 +189,15 @@ if __name__ == '__main__':
 
             # Filter which bytes to select
             max_byte_num = stats.bytes_min if args.use_min_bytes else stats.bytes_max
+            if discovery:
+                # Bits which never change are always left out of discovered signals
+                signals = discovery.signals(can_log.parse_id_key(id), max_byte_num)
+                if signals:
+                    file.write("\n")
+                    file.write(get_dbc_discovered_message_def(id, max_byte_num, signals))
+                    comments += [(id, signal) for signal in signals if signal.kind != "value"]
+                continue
+
             if args.ignore_constant:
                 bytes = []
                 for i in range(max_byte_num):
@@ -134,4 +213,11 @@ if __name__ == '__main__':
             file.write("\n")
             file.write(msg_def)
 
+        # Describe the counters and checksums that were found
+        if comments:
+            file.write("\n")
+        for id, signal in comments:
+            file.write("CM_ SG_ %d ID_%s_%s \"%s\";\n" % (get_dbc_id_field(id), id.lstrip("0"), \
+                signal.name, DISCOVERED_KINDS[signal.kind]))
+
     print("Done!")
@@ -2,28 +2,59 @@
 
 import argparse
 import os
+import sys
 import can_utils
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import cache
+import can_readers
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument("log", type=str, help="Path to logfile")
+    parser.add_argument("--dbc", type=str, \
+        help="Path to DBC file, to show the message name for each id")
+    parser.add_argument("--format", type=str, choices=sorted(can_readers.READERS), \
+        help="Format of the log, detected from the file extension by default")
+    parser.add_argument("--jobs", type=int, default=1, \
+        help="Number of processes to read candump logs with")
 
     args = parser.parse_args()
 
     if args.log:
         args.log = os.path.expanduser(args.log)
+    if args.dbc:
+        args.dbc = os.path.expanduser(args.dbc)
 
     # Make sure our input files are valid
     if not os.path.isfile(args.log):
         print("ERROR: log file %s does not exist" % args.log)
         exit(1)
 
-    with open(args.log, "r") as file:
-        lines = file.readlines()
+    if args.dbc and not os.path.isfile(args.dbc):
+        print("ERROR: DBC file %s does not exist" % args.dbc)
+        exit(1)
+
+    if args.jobs < 1:
+        print("ERROR: Number of jobs must be at least 1")
+        exit(1)
+
+    # Only the message names are needed, which the cached decode plan for the DBC holds
+    messages = cache.load_decode_plan(args.dbc).messages if args.dbc else None
+
+    id_stats = can_utils.get_id_stats_from_file(args.log, args.format, args.jobs)
 
-    id_stats = can_utils.get_id_stats_from_lines(lines)
+    if messages is None:
+        print("    ID     | Msg Count | Avg. Frequency")
+        print("---------------------------------------")
+    else:
+        print("    ID     | Msg Count | Avg. Frequency | Message")
+        print("-------------------------------------------------")
 
-    print("    ID     | Msg Count | Avg. Frequency")
-    print("---------------------------------------")
     for id, stats in sorted(id_stats.items()):
-        print(stats)
+        if messages is None:
+            print(stats)
+        else:
+            message = messages.get(int(id, 16))
+            print("%s | %s" % (stats, message.name if message else "-"))
@@ -2,13 +2,27 @@
 
 import argparse
 import os
-import textwrap
-import can_utils
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can_log
+import log_index
+from log_file import LogFile
+
+DESCRIPTION = """Lists the messages of one or more CAN ids in a candump log (recorded with '-l').
+An index of the lines of every id is built the first time a log is listed and then cached, so later
+runs only read the lines of the requested ids."""
 
 if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
     parser.add_argument("log", type=str, help="Path to logfile")
-    parser.add_argument("id", type=str, help="CAN id")
+    parser.add_argument("id", type=str, nargs="+", \
+        help="CAN id in hex as written in the log, with 8 digits for extended ids, can be repeated")
+    parser.add_argument("--start", type=float, \
+        help="Only list messages from this time onwards, relative to the start of the log [s]")
+    parser.add_argument("--end", type=float, \
+        help="Only list messages up to this time, relative to the start of the log [s]")
 
     args = parser.parse_args()
 
@@ -20,13 +34,27 @@ if __name__ == '__main__':
         print("ERROR: log file %s does not exist" % args.log)
         exit(1)
 
-    with open(args.log, "r") as file:
-        lines = file.readlines()
-
-    for line in lines:
-        stamp, id, data = can_utils.parse_can_line(line)
+    try:
+        # Ids written with 8 digits are extended, the same as in the log
+        frame_ids = [can_log.parse_id_key(id) for id in args.id]
+    except ValueError:
+        print("ERROR: CAN ids must be in hex")
+        exit(1)
 
-        if id == args.id:
-            data_bytes = textwrap.wrap(data, 2)
-            data_bytes = ' '.join(data_bytes)
-            print("%f - %s" % (stamp, data_bytes))
+    with LogFile(args.log) as log:
+        # The time window is relative to the first frame in the log
+        start_time, end_time = args.start, args.end
+        if start_time is not None or end_time is not None:
+            log_start = log_index.load_time_index(log).start_time() or 0.0
+            start_time = None if start_time is None else log_start + start_time
+            end_time = None if end_time is None else log_start + end_time
+
+        for frames in log_index.read_indexed_frames(log, frame_ids, start_time, end_time):
+            for stamp, id, extended, length, data in zip(frames.timestamps.tolist(), \
+                frames.ids.tolist(), frames.extended.tolist(), frames.lengths.tolist(), \
+                frames.data):
+                data_bytes = " ".join("%02X" % byte for byte in data[:length].tolist())
+                if len(frame_ids) > 1:
+                    print("%f - %s - %s" % (stamp, can_log.format_id(id, extended), data_bytes))
+                else:
+                    print("%f - %s" % (stamp, data_bytes))
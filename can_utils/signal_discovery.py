@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can_log
+
+# Minimum number of consecutive frame pairs of an id needed to classify counters and checksums
+MIN_TRANSITIONS = 16
+
+# Fraction of frames (or frame pairs) that must match for a byte to be a counter or checksum
+MATCH_FRACTION = 0.9
+
+# Fraction of frame pairs in which a byte must change for it to be considered a checksum
+CHECKSUM_CHANGE_FRACTION = 0.25
+
+# Minimum number of carries between two bytes needed to join them into a 16 bit signal
+MIN_CARRIES = 3
+
+# Fraction of the changes of the high byte of a pair which must be carries from the low byte
+CARRY_FRACTION = 0.8
+
+class DiscoveredSignal():
+    """ A signal inferred from the frames of a CAN id.
+
+    start_bit: Bit the signal starts at, as numbered in a DBC file. This is the least significant
+        bit for little endian signals, and the most significant bit for big endian signals.
+    length: Number of bits in the signal
+    big_endian: Whether the bytes of the signal are in big endian (Motorola) order
+    kind: One of 'value', 'counter', 'checksum_xor', or 'checksum_sum'
+    name: Name of the signal, without the id
+    """
+    def __init__(self, start_bit: int, length: int, big_endian: bool, kind: str, name: str):
+        self.start_bit = start_bit
+        self.length = length
+        self.big_endian = big_endian
+        self.kind = kind
+        self.name = name
+
+    def __str__(self):
+        return "{} ({}, {} bits)".format(self.name, self.kind, self.length)
+
+
+class IdBitStats():
+    """ Accumulates statistics of the payload bits of a single CAN id, from batches of its frames.
+
+    Every statistic is computed on the whole payload matrix of a batch at once, and consecutive
+    frames are compared across batches using the last payload of the previous batch.
+
+    frames: Number of frames
+    transitions: Number of pairs of consecutive frames
+    byte_changes: Number of times each byte changed between consecutive frames
+    toggles: Number of times each bit changed between consecutive frames, indexed by
+        byte * 8 + bit with bit 0 as the least significant bit
+    byte_steps, low_nibble_steps, high_nibble_steps: Number of times each byte, or nibble of each
+        byte, increased by exactly one (wrapping around) between consecutive frames
+    high_changes, carries: Number of times the first byte of each pair of adjacent bytes changed,
+        and the number of those changes which were a carry from the second byte. Indexed by
+        [endianness, pair], where endianness 0 has the high byte first (big endian).
+    xor_residuals, sum_residuals: Histograms of the XOR and the difference modulo 256 between
+        each byte and the XOR or sum of the other bytes in the frame, one row per byte
+    """
+    def __init__(self, width: int):
+        self.width = 0
+        self.frames = 0
+        self.transitions = 0
+        self.last_payload = None
+        self.toggles = np.zeros(0, np.int64)
+        self.byte_changes = np.zeros(0, np.int64)
+        self.byte_steps = np.zeros(0, np.int64)
+        self.low_nibble_steps = np.zeros(0, np.int64)
+        self.high_nibble_steps = np.zeros(0, np.int64)
+        self.high_changes = np.zeros((2, 0), np.int64)
+        self.carries = np.zeros((2, 0), np.int64)
+        self.xor_residuals = np.zeros((0, 256), np.int64)
+        self.sum_residuals = np.zeros((0, 256), np.int64)
+        self._grow(width)
+
+    def update(self, payloads):
+        """ Adds a batch of frames to the statistics.
+
+        payloads: uint8 matrix with the data of each frame in a row, in the order they were received
+        """
+        if payloads.shape[1] > self.width:
+            self._grow(payloads.shape[1])
+        elif payloads.shape[1] < self.width:
+            payloads = np.pad(payloads, ((0, 0), (0, self.width - payloads.shape[1])))
+
+        self.frames += payloads.shape[0]
+        self.__update_checksums(payloads)
+
+        # Consecutive frames are compared including the last frame of the previous batch
+        if self.last_payload is not None:
+            payloads = np.vstack((self.last_payload, payloads))
+        self.last_payload = payloads[-1:].copy()
+        if payloads.shape[0] < 2:
+            return
+
+        previous, current = payloads[:-1], payloads[1:]
+        self.transitions += current.shape[0]
+
+        changed = np.unpackbits(previous ^ current, axis=1, bitorder="little")
+        self.toggles += changed.sum(axis=0, dtype=np.int64)
+        self.byte_changes += (previous != current).sum(axis=0)
+
+        self.byte_steps += ((current - previous) == 1).sum(axis=0)
+        self.low_nibble_steps += ((((current & 0x0F) - (previous & 0x0F)) & 0x0F) == 1).sum(axis=0)
+        self.high_nibble_steps += ((((current >> 4) - (previous >> 4)) & 0x0F) == 1).sum(axis=0)
+
+        # A carry changes the high byte by one in the opposite direction to a large jump of the low
+        # byte, e.g. 0x01FF -> 0x0200
+        deltas = current.astype(np.int16) - previous.astype(np.int16)
+        for endianness, (high, low) in enumerate(((deltas[:, :-1], deltas[:, 1:]), \
+            (deltas[:, 1:], deltas[:, :-1]))):
+            self.high_changes[endianness] += (high != 0).sum(axis=0)
+            self.carries[endianness] += ((np.abs(high) == 1) & (np.abs(low) >= 128) & \
+                (np.sign(high) != np.sign(low))).sum(axis=0)
+
+    def signals(self, num_bytes: int):
+        """ Infers the signals in the first num_bytes bytes of the payload.
+
+        Checksums and counters are found first, followed by pairs of bytes holding 16 bit values.
+        The remaining bits which changed are split into a signal for each contiguous run within a
+        byte, bits which never changed are left out.
+
+        returns: List of DiscoveredSignal ordered by their position in the payload
+        """
+        num_bytes = min(num_bytes, self.width)
+        claimed = np.zeros(num_bytes * 8, bool)
+        signals = []
+
+        def claim(start, length, big_endian, kind, name):
+            claimed[start:start + length] = True
+            signals.append((start, DiscoveredSignal(start, length, big_endian, kind, name)))
+
+        changing = self.toggles[:num_bytes * 8] > 0
+        byte_changing = changing.reshape(num_bytes, 8).any(axis=1)
+
+        if self.transitions >= MIN_TRANSITIONS:
+            checksums = self.__find_checksums(np.flatnonzero(byte_changing))
+            for i in np.flatnonzero(byte_changing):
+                if i in checksums:
+                    claim(i * 8, 8, False, checksums[i], "B%d_CHECKSUM" % (i + 1))
+                elif self.byte_steps[i] >= MATCH_FRACTION * self.transitions and \
+                    self.high_nibble_steps[i] >= self.transitions / 32:
+                    # The high nibble of an 8 bit counter steps once every 16 frames, otherwise
+                    # this is a 4 bit counter next to bits which rarely change
+                    claim(i * 8, 8, False, "counter", "B%d_COUNTER" % (i + 1))
+                else:
+                    for nibble, steps in ((0, self.low_nibble_steps), (4, self.high_nibble_steps)):
+                        if steps[i] >= MATCH_FRACTION * self.transitions:
+                            claim(i * 8 + nibble, 4, False, "counter", \
+                                "B%d_%d_%d_COUNTER" % (i + 1, nibble, nibble + 3))
+
+        # Pairs of bytes are joined in order of how consistently they carry
+        pairs = []
+        for endianness in range(2):
+            for i in range(num_bytes - 1):
+                changes = self.high_changes[endianness, i]
+                carries = self.carries[endianness, i]
+                if carries >= MIN_CARRIES and carries >= CARRY_FRACTION * changes:
+                    pairs.append((carries / changes, endianness, i))
+
+        for _, endianness, i in sorted(pairs, reverse=True):
+            if claimed[i * 8:(i + 2) * 8].any():
+                continue
+
+            if endianness == 0:
+                # The most significant bit is the top bit of the first byte
+                claimed[i * 8:(i + 2) * 8] = True
+                signals.append((i * 8, DiscoveredSignal(i * 8 + 7, 16, True, "value", \
+                    "B%d_B%d_BE" % (i + 1, i + 2))))
+            else:
+                claim(i * 8, 16, False, "value", "B%d_B%d_LE" % (i + 1, i + 2))
+
+        # Split the rest of each byte into runs of bits which changed
+        free = changing & ~claimed
+        for i in range(num_bytes):
+            bits = free[i * 8:(i + 1) * 8]
+            bit = 0
+            while bit < 8:
+                if not bits[bit]:
+                    bit += 1
+                    continue
+
+                end = bit
+                while end < 8 and bits[end]:
+                    end += 1
+
+                if end - bit == 8:
+                    name = "B%d" % (i + 1)
+                elif end - bit == 1:
+                    name = "B%d_%d" % (i + 1, bit)
+                else:
+                    name = "B%d_%d_%d" % (i + 1, bit, end - 1)
+                claim(i * 8 + bit, end - bit, False, "value", name)
+                bit = end
+
+        return [signal for _, signal in sorted(signals, key=lambda entry: entry[0])]
+
+    def _grow(self, width: int):
+        """ Widens the statistics to cover payloads of width bytes. """
+        extra = width - self.width
+        if extra <= 0:
+            return
+
+        self.toggles = np.concatenate((self.toggles, np.zeros(extra * 8, np.int64)))
+        self.byte_changes = np.concatenate((self.byte_changes, np.zeros(extra, np.int64)))
+        self.byte_steps = np.concatenate((self.byte_steps, np.zeros(extra, np.int64)))
+        self.low_nibble_steps = np.concatenate((self.low_nibble_steps, np.zeros(extra, np.int64)))
+        self.high_nibble_steps = np.concatenate((self.high_nibble_steps, np.zeros(extra, np.int64)))
+        pair_extra = width - 1 - max(self.width - 1, 0)
+        self.high_changes = np.pad(self.high_changes, ((0, 0), (0, pair_extra)))
+        self.carries = np.pad(self.carries, ((0, 0), (0, pair_extra)))
+        self.xor_residuals = np.pad(self.xor_residuals, ((0, extra), (0, 0)))
+        self.sum_residuals = np.pad(self.sum_residuals, ((0, extra), (0, 0)))
+        if self.last_payload is not None:
+            self.last_payload = np.pad(self.last_payload, ((0, 0), (0, extra)))
+
+        self.width = width
+
+    def __update_checksums(self, payloads):
+        """ Adds the residuals of every byte against the XOR and sum of the other bytes. """
+        rows = np.arange(self.width) * 256
+
+        others_xor = np.bitwise_xor.reduce(payloads, axis=1)[:, None] ^ payloads
+        residuals = payloads ^ others_xor
+        self.xor_residuals += np.bincount((residuals + rows).ravel(), \
+            minlength=self.width * 256).reshape(self.width, 256)
+
+        others_sum = payloads.sum(axis=1, dtype=np.int64)[:, None] - payloads
+        residuals = (payloads - others_sum) & 0xFF
+        self.sum_residuals += np.bincount((residuals + rows).ravel(), \
+            minlength=self.width * 256).reshape(self.width, 256)
+
+    def __find_checksums(self, candidates):
+        """ Finds the bytes which are checksums of the other bytes in the payload.
+
+        A byte is a checksum when it is the XOR or sum of the other bytes, plus a constant, in
+        nearly every frame, and it changes often enough that this is not a coincidence. When the
+        XOR of the whole payload is constant every byte is the XOR of the others, so only the last
+        of them is taken as the checksum.
+
+        candidates: Indices of the bytes which change
+        returns: Dict mapping the index of each checksum byte to its kind
+        """
+        checksums = {}
+        for i in candidates.tolist():
+            if self.byte_changes[i] < CHECKSUM_CHANGE_FRACTION * self.transitions:
+                continue
+
+            if self.sum_residuals[i].max() >= MATCH_FRACTION * self.frames:
+                checksums[i] = "checksum_sum"
+            elif self.xor_residuals[i].max() >= MATCH_FRACTION * self.frames:
+                checksums = {j: kind for j, kind in checksums.items() if kind != "checksum_xor"}
+                checksums[i] = "checksum_xor"
+
+        return checksums
+
+
+class SignalDiscovery():
+    """ Infers the signals of every CAN id in a log from the bits of their payloads.
+
+    Frames are added in batches, which are split by id and reduced with array operations on the
+    payload matrix of each id, so the log is never held in memory. Ids are kept by their key, see
+    can_log.id_keys(), so standard and extended ids with the same value are analysed separately.
+    """
+    def __init__(self):
+        self.id_stats: dict[int, IdBitStats] = {}
+
+    def update(self, frames):
+        """ Adds a batch of frames, see can_log.CanFrames. """
+        if not len(frames):
+            return
+
+        # Group the frames by id while keeping the order they were received in
+        keys = can_log.id_keys(frames.ids, frames.extended)
+        order = np.argsort(keys, kind="stable")
+        unique_keys, starts = np.unique(keys[order], return_index=True)
+        ends = np.append(starts[1:], order.size)
+
+        for key, start, end in zip(unique_keys.tolist(), starts, ends):
+            rows = order[start:end]
+            width = int(frames.lengths[rows].max())
+            if key not in self.id_stats:
+                self.id_stats[key] = IdBitStats(max(width, 1))
+            self.id_stats[key].update(frames.data[rows, :max(width, 1)])
+
+    def signals(self, key: int, num_bytes: int):
+        """ Returns the list of DiscoveredSignal for the key of an id, see can_log.id_keys() and
+        IdBitStats.signals().
+        """
+        if key not in self.id_stats:
+            return []
+
+        return self.id_stats[key].signals(num_bytes)
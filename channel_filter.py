@@ -0,0 +1,69 @@
+import fnmatch
+import re
+
+# Prefix of patterns which are regular expressions rather than glob patterns
+REGEX_PREFIX = "re:"
+
+class ChannelFilter(object):
+    """ Selects channels by name from lists of patterns to include and exclude.
+
+    Patterns are case sensitive glob patterns (e.g. 'WS_*'), or regular expressions when prefixed
+    with 're:' (e.g. 're:WS_F[LR]'), which must match the entire name. A channel is selected when
+    it matches any of the include patterns, or there are no include patterns, and it does not match
+    any of the exclude patterns.
+    """
+    def __init__(self, include=None, exclude=None):
+        """ include: List of patterns of the channels to select, None or empty to select all
+            exclude: List of patterns of the channels to leave out
+        """
+        self.include = list(include) if include else []
+        self.exclude = list(exclude) if exclude else []
+
+        self.__include = [_compile_pattern(pattern) for pattern in self.include]
+        self.__exclude = [_compile_pattern(pattern) for pattern in self.exclude]
+
+    def __call__(self, name):
+        """ Returns whether a channel is selected. """
+        if self.__include and not any(regex.fullmatch(name) for regex in self.__include):
+            return False
+
+        return not any(regex.fullmatch(name) for regex in self.__exclude)
+
+    def is_empty(self):
+        """ Returns whether the filter selects every channel. """
+        return not self.include and not self.exclude
+
+    def key(self):
+        """ Returns a string identifying the selection, e.g. for use in cache keys. """
+        return "\0".join(["+" + pattern for pattern in self.include] + \
+            ["-" + pattern for pattern in self.exclude])
+
+def read_channel_file(filename):
+    """ Reads a file with a channel pattern on each line.
+
+    Blank lines and lines starting with '#' are ignored. Lines starting with '!' are patterns of
+    channels to exclude.
+
+    returns: Tuple of the lists of include and exclude patterns
+    """
+    include = []
+    exclude = []
+    with open(filename, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            if line.startswith("!"):
+                exclude.append(line[1:].strip())
+            else:
+                include.append(line)
+
+    return include, exclude
+
+def _compile_pattern(pattern):
+    """ Compiles a glob or regular expression pattern, see ChannelFilter. """
+    if pattern.startswith(REGEX_PREFIX):
+        return re.compile(pattern[len(REGEX_PREFIX):])
+
+    return re.compile(fnmatch.translate(pattern))
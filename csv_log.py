@@ -0,0 +1,119 @@
+import numpy as np
+
+class CsvColumns(object):
+    """ Numeric columns parsed from a batch of CSV rows.
+
+    values: List of float64 arrays for each requested column, or None for columns which contain
+        non numeric data
+    decimals: List with the most decimal places present in each requested column
+    """
+    __slots__ = ("values", "decimals")
+
+    def __init__(self, values, decimals):
+        self.values = values
+        self.decimals = decimals
+
+def parse_csv(log_lines, num_columns, columns):
+    """ Parses selected columns from a batch of CSV rows at once.
+
+    Rather than splitting each line, the positions of the commas and newlines are located across
+    the entire batch. Each requested column is then copied into a fixed width byte string array
+    which is converted to floats in a single operation. Rows with fewer than num_columns cells,
+    including blank lines, are skipped. Any cells beyond num_columns are ignored.
+
+    log_lines: List of lines as str, or a bytes like object containing many lines
+    num_columns: Number of columns in the CSV file
+    columns: List of the indices of the columns to parse
+    returns: CsvColumns
+    """
+    if not isinstance(log_lines, (bytes, bytearray, memoryview)):
+        log_lines = "".join(log_lines).encode()
+
+    buf = np.frombuffer(log_lines, np.uint8)
+    if not buf.size:
+        return CsvColumns([np.empty(0) for column in columns], [0 for column in columns])
+
+    # Locate the start and end of every line, excluding any carriage return
+    ends = np.flatnonzero(buf == ord("\n"))
+    if ends.size == 0 or ends[-1] != buf.size - 1:
+        ends = np.append(ends, buf.size)
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+    cr = buf[np.maximum(ends - 1, 0)] == ord("\r")
+    ends[cr & (ends > starts)] -= 1
+
+    # Find the commas within each line, rows without enough cells are skipped
+    commas = np.flatnonzero(buf == ord(","))
+    first_comma = np.searchsorted(commas, starts)
+    num_commas = np.searchsorted(commas, ends) - first_comma
+    valid = (num_commas >= num_columns - 1) & (ends > starts)
+    if not valid.all():
+        starts, ends = starts[valid], ends[valid]
+        first_comma, num_commas = first_comma[valid], num_commas[valid]
+
+    # Each cell ends at the next comma, the last cell ends at the end of the line or at the comma
+    # preceding any extra cells
+    commas = np.append(commas, buf.size)
+    last_end = np.where(num_commas >= num_columns, commas[first_comma + num_columns - 1], ends)
+
+    cells = []
+    for column in columns:
+        if column == 0:
+            cell_starts = starts
+        else:
+            cell_starts = commas[first_comma + column - 1] + 1
+
+        if column == num_columns - 1:
+            cell_ends = last_end
+        else:
+            cell_ends = commas[first_comma + column]
+
+        cells.append((cell_starts, cell_ends))
+
+    # The buffer is padded once, by the widest cell of any column, so a window of any column's
+    # width can be taken from the start of each of its cells
+    width = max([int((cell_ends - cell_starts).max()) for cell_starts, cell_ends in cells \
+        if cell_starts.size] + [1])
+    padded = np.zeros(buf.size + width, np.uint8)
+    padded[:buf.size] = buf
+
+    values = []
+    decimals = []
+    for cell_starts, cell_ends in cells:
+        column_values, column_decimals = _parse_cells(padded, cell_starts, cell_ends)
+        values.append(column_values)
+        decimals.append(column_decimals)
+
+    return CsvColumns(values, decimals)
+
+def _parse_cells(padded, starts, ends):
+    """ Converts the cells in [start, end) of the buffer to floats.
+
+    padded: Buffer followed by at least as many zeros as the widest cell
+
+    returns: Tuple of the float64 array of values, or None if any cell is not numeric, and the
+        most decimal places of any cell
+    """
+    if not starts.size:
+        return np.empty(0), 0
+
+    lengths = ends - starts
+    width = max(int(lengths.max()), 1)
+    chars = np.lib.stride_tricks.sliding_window_view(padded, width)[starts]
+    if lengths.min() < width:
+        chars *= np.arange(width) < lengths[:, None]
+
+    try:
+        values = chars.view("S%d" % width).ravel().astype(np.float64)
+    except ValueError:
+        return None, 0
+
+    # Decimal places are the characters following the '.'
+    dots = chars == ord(".")
+    has_dot = dots.any(axis=1)
+    if not has_dot.any():
+        return values, 0
+
+    column_decimals = np.where(has_dot, lengths - dots.argmax(axis=1) - 1, 0)
+    return values, int(column_decimals.max())
@@ -1,5 +1,12 @@
-import cantools
+import cache
+import can_decode
+import can_log
+import concurrent.futures
+import csv_log
+import itertools
+import log_file
 import math
+import numpy as np
 
 class DataLog(object):
     """ Container for storing log data which contains a set of channels with time series data."""
@@ -13,6 +20,7 @@ class DataLog(object):
     def add_channel(self, name, units, data_type, decimals, initial_message=None):
         msg = [] if not initial_message else [initial_message]
         self.channels[name] = Channel(name, units, data_type, decimals, msg)
+        return self.channels[name]
 
     def start(self):
         """ Returns the earliest timestamp from all existing channels [s]. """
@@ -37,15 +45,122 @@ class DataLog(object):
         """ Returns the duration of the log [s]. """
         return self.end() - self.start()
 
-    def resample(self, frequency):
+    def slice(self, start_time=None, end_time=None):
+        """ Removes all messages outside of a time window, along with any channels left empty.
+
+        start_time: Start of the window, None to keep the start of the log [s]
+        end_time: End of the window, None to keep the end of the log [s]
+        """
+        for name in list(self.channels.keys()):
+            channel = self.channels[name]
+            keep = np.ones(len(channel), bool)
+            if start_time is not None:
+                keep &= channel.timestamps >= start_time
+            if end_time is not None:
+                keep &= channel.timestamps <= end_time
+
+            if not keep.any():
+                del self.channels[name]
+            elif not keep.all():
+                channel.set_data(channel.timestamps[keep], channel.values[keep])
+
+    def window(self, start_time, end_time):
+        """ Returns a new data log with the messages from start_time to end_time inclusive, leaving
+        this log unmodified.
+
+        The channels of the new log are views of the data in this log rather than copies, so many
+        windows can be taken from a large log cheaply. Channels without any messages in the window
+        are left out.
+
+        start_time: Start of the window [s]
+        end_time: End of the window [s]
+        """
+        data_log = DataLog(self.name)
+        for name, channel in self.channels.items():
+            first = np.searchsorted(channel.timestamps, start_time, "left")
+            last = np.searchsorted(channel.timestamps, end_time, "right")
+            if first < last:
+                data_log.add_channel(name, channel.units, channel.data_type, channel.decimals) \
+                    .set_data(channel.timestamps[first:last], channel.values[first:last])
+
+        return data_log
+
+    def merge(self, other, offset=0.0, prefix=""):
+        """ Adds the channels of another data log to this log, e.g. one loaded from another logger
+        recording the same session.
+
+        The channels of the other log are not copied, their timestamps are shifted into a new
+        array and the values are shared. Channels whose names are already in this log have the
+        prefix added to their name.
+
+        other: DataLog to add the channels of
+        offset: Time added to the timestamps of the other log, to line it up with this log [s]
+        prefix: Prefix added to the names of channels which are already in this log
+        returns: Dict mapping the original names of any renamed channels to their new name
+        raises: ValueError if a renamed channel is also already in this log
+        """
+        renamed = {}
+        for name, channel in other.channels.items():
+            if not len(channel):
+                continue
+
+            merged_name = name
+            if name in self.channels:
+                merged_name = prefix + name
+                if merged_name in self.channels:
+                    raise ValueError("Channel %s is already in the log, use another prefix" % \
+                        merged_name)
+                renamed[name] = merged_name
+
+            self.add_channel(merged_name, channel.units, channel.data_type, channel.decimals) \
+                .set_data(channel.timestamps + offset, channel.values)
+
+        return renamed
+
+    def resample(self, frequency, channel_frequencies=None):
         """ Resamples all channels such that all messages occur at a fixed frequency.
 
-        See the resample method of the Channel class for more details.
+        All channels sharing a frequency are resampled against a single set of sample times. See
+        the resample method of the Channel class for more details.
+
+        frequency: Frequency to resample channels at [Hz]
+        channel_frequencies: Optional dict, mapping channel names to a frequency to use for that
+            channel instead of the global frequency [Hz]
         """
+        for channel, times, values in self.__resampled_data(frequency, channel_frequencies):
+            channel.set_data(times, values)
+
+    def iter_resampled(self, frequency, channel_frequencies=None):
+        """ Yields a resampled copy of each channel, one channel at a time.
+
+        This leaves the log unmodified and only creates the resampled data for a channel when it is
+        requested, so the resampled data for all channels never needs to be held at once.
+
+        See the resample method for a description of the arguments.
+        """
+        for channel, times, values in self.__resampled_data(frequency, channel_frequencies):
+            yield Channel(channel.name, channel.units, channel.data_type, channel.decimals, \
+                timestamps=times, values=values)
+
+    def __resampled_data(self, frequency, channel_frequencies):
+        """ Yields the channel, sample times, and sample values for each non empty channel. """
+        channel_frequencies = channel_frequencies if channel_frequencies else {}
         start = self.start()
         end = self.end()
-        for channel_name in self.channels:
-            self.channels[channel_name].resample(start, end, frequency)
+
+        times = {}
+        for channel_name, channel in self.channels.items():
+            if not len(channel):
+                continue
+
+            channel_frequency = channel_frequencies.get(channel_name, frequency)
+            if channel_frequency not in times:
+                times[channel_frequency] = resample_times(start, end, channel_frequency)
+
+            channel_times = times[channel_frequency]
+            values = zero_order_hold(channel.timestamps, channel.values, channel_times, \
+                1.0 / channel_frequency)
+            yield channel, channel_times, values
 
     def from_can_log(self, log_lines, can_db):
         """ Creates channels populated with messages from a candump file and can database.
@@ -53,132 +168,194 @@ class DataLog(object):
         This will create a channel for each entry in the database that has messages present in the
         log.
 
-        log_lines: List, containing candump log lines (recorded with 'candump' with '-l')
-        can_db: cantools.database
+        log_lines: Iterable of candump log lines (recorded with 'candump' with '-l'), e.g. a list of
+            lines or an open file, or a log_file.LogFile
+        can_db: cantools.database, or a can_decode.DecodePlan already created for the database
         """
         self.clear()
 
-        # Cache all the frame ids in the database for quick lookups
-        known_ids = set()
-        for msg in can_db.messages:
-            known_ids.add(msg.frame_id)
+        if isinstance(can_db, can_decode.DecodePlan):
+            decode_plan = can_db
+        else:
+            decode_plan = can_decode.DecodePlan.from_database(can_db)
+        self.append_can_chunks(iter_chunks(log_lines), decode_plan)
+
+    def from_can_log_file(self, filename, dbc_filename, jobs=1, channel_filter=None, start=0, \
+        end=None):
+        """ Creates channels populated with messages from a candump file and can database, decoding
+        the file with multiple processes.
+
+        The file is split on line boundaries into a byte range for each process, and each process
+        loads its own copy of the database. The channels decoded from each range are then joined in
+        file order, so the result is identical to from_can_log().
+
+        filename: Path to a candump log file (recorded with 'candump' with '-l')
+        dbc_filename: Path to the DBC file for the log
+        jobs: Number of processes to use
+        channel_filter: Optional channel_filter.ChannelFilter selecting the signals to decode
+        start: Offset of the line to start decoding from, e.g. from log_index.TimeIndex [bytes]
+        end: Offset to stop decoding at, None for the end of the file [bytes]
+        """
+        self.clear()
 
-        for line in log_lines:
-            stamp, bus, id, data = self.__parse_can_log_line(line)
+        with log_file.LogFile(filename) as log:
+            shards = log.split(jobs, start, end)
 
-            if id not in known_ids:
-                continue
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, \
+            initializer=_init_can_worker, initargs=(dbc_filename, channel_filter)) as executor:
+            futures = [executor.submit(_decode_can_shard, filename, start, end) \
+                for start, end in shards]
 
-            db_msg = can_db.get_message_by_frame_id(id)
-            msg_decoded = can_db.decode_message(id, data)
+            # Shards are merged in file order so each channel remains in timestamp order
+            for future in futures:
+                for name, unit, timestamps, values in future.result():
+                    if name not in self.channels:
+                        self.add_channel(name, unit, float, 3)
+                    self.channels[name].extend(timestamps, values)
 
-            for msg, signal in zip(msg_decoded.items(), db_msg.signals):
-                name = msg[0]
-                value = msg[1]
+    def append_can_chunks(self, chunks, decode_plan):
+        """ Parses and decodes chunks of candump log lines, appending the messages to the channels.
 
-                if name in self.channels:
-                    self.channels[name].messages.append(Message(stamp, value))
-                else:
-                    self.add_channel(name, signal.unit, float, 3, Message(stamp, value))
+        Unlike from_can_log() this keeps any existing channels, new channels are created as needed.
+
+        chunks: Iterable of lists of lines or bytes like blocks containing many lines
+        decode_plan: can_decode.DecodePlan
+        """
+        # Lines are parsed in batches, then the frames in each batch are decoded together. Frames
+        # with ids that the plan does not decode are dropped before their data is parsed.
+        self.append_can_frames((can_log.parse_candump(chunk, decode_plan.frame_ids) \
+            for chunk in chunks), decode_plan)
 
-    def from_csv_log(self, log_lines):
+    def from_can_frames(self, frame_batches, can_db):
+        """ Creates channels populated with messages from batches of CAN frames and a can database.
+
+        This is used for CAN logs in formats other than candump, see can_readers.read_can_frames().
+
+        frame_batches: Iterable of can_log.CanFrames
+        can_db: cantools.database, or a can_decode.DecodePlan already created for the database
+        """
+        self.clear()
+
+        if isinstance(can_db, can_decode.DecodePlan):
+            decode_plan = can_db
+        else:
+            decode_plan = can_decode.DecodePlan.from_database(can_db)
+        self.append_can_frames(frame_batches, decode_plan)
+
+    def append_can_frames(self, frame_batches, decode_plan):
+        """ Decodes batches of CAN frames, appending the messages to the channels.
+
+        frame_batches: Iterable of can_log.CanFrames
+        decode_plan: can_decode.DecodePlan
+        """
+        # The frames in each batch are decoded grouped by id, which drops any frames with ids not
+        # in the database
+        for frames in frame_batches:
+            for name, unit, timestamps, values in decode_plan.decode(frames):
+                if name not in self.channels:
+                    self.add_channel(name, unit, float, 3)
+                self.channels[name].extend(timestamps, values)
+
+    def from_csv_log(self, log_lines, channel_filter=None):
         """ Creates channels populated with messages from a CSV log file.
 
         This will create a channel for each column in the CSV file, with the name of that channel
         taken from the CSV header. All channels will be created without any units. Any non numeric data
         will be ignored, and that channel will be removed. The first column of data must be time
 
-        log_lines: List, containing CSV log lines
+        log_lines: Iterable of CSV log lines, e.g. a list of lines or an open file, or a
+            log_file.LogFile
+        channel_filter: Optional channel_filter.ChannelFilter selecting the columns to load
         """
         self.clear()
 
-        if not log_lines:
+        header, chunks = read_header(log_lines)
+        if not header:
             return
 
         # Get the channel names, ignore the first column as it is assumed to be time
-        header = log_lines[0]
-        channel_names = header.split(",")[1:]
+        column_names = header.rstrip("\r\n").split(",")
+        channel_names = column_names[1:]
 
-        # We'll keep a map of names and column numbers for easy channel lookups when parsing rows
-        i = 0
-        channel_dict = {}
-        for name in channel_names:
-            self.add_channel(name, "", float, 0)
-
-            channel_dict[name] = i
-            i += 1
-
-        # Go through each line grabbing all the channel values
-        for line in log_lines[1:]:
-            line = line.strip("\n")
-            values = line.split(",")
-
-            # Timestamp is the first element
-            t = float(values[0])
-
-            # Grab each remaining channel value. We keep a map of all the channel names and column
-            # numbers we are retrieving, so we will look at that to determine which columns to read.
-            # If we fail to read an entry in any column, we will delete that channel entirely.
-            invalid_channels = []
-            for name, i in channel_dict.items():
-                # We'll only parse numeric data
-                try:
-                    val = float(values[i + 1])
-                    message = Message(t, val)
-                    self.channels[name].messages.append(message)
-
-                    val_text_split = values[i + 1].split(".")
-                    decimals_present = 0 if len(val_text_split) == 1 else len(val_text_split[1])
-                    self.channels[name].decimals = max(decimals_present, self.channels[name].decimals)
-                except ValueError:
-                    print("WARNING: Found non numeric values for channel %s, removing channel" % \
-                        name)
-                    invalid_channels.append(name)
-
-            for name in invalid_channels:
-                del channel_dict[name]
-                del self.channels[name]
+        self.__load_csv_columns(chunks, len(column_names), channel_names, \
+            [""] * len(channel_names), channel_filter)
 
-    def from_accessport_log(self, log_lines):
+    def from_accessport_log(self, log_lines, channel_filter=None):
         """ Creates channels populated with messages from a COBB Accessport CSV log file.
 
         This will create a channel for each column in the CSV file, with the name and units of that
         channel taken from the CSV header. Any non numeric data will be ignored, and that channel
         will be removed.
 
-        log_lines: List, containing CSV log lines
+        log_lines: Iterable of CSV log lines, e.g. a list of lines or an open file, or a
+            log_file.LogFile
+        channel_filter: Optional channel_filter.ChannelFilter selecting the columns to load
         """
+        self.clear()
 
-        self.from_csv_log(log_lines)
+        header, chunks = read_header(log_lines)
+        if not header:
+            return
 
-        # Accessport logs have a column for AP info which is not of any value so we'll delete it
-        for key in self.channels.keys():
-            if "AP Info" in key:
-                del self.channels[key]
-                break
+        # Channels have the format "Name (Units)". Accessport logs also have a column for AP info
+        # which is not of any value, so it is not loaded.
+        column_names = header.rstrip("\r\n").split(",")
+        channel_names = []
+        channel_units = []
+        for column_name in column_names[1:]:
+            if "AP Info" in column_name:
+                channel_names.append(None)
+                channel_units.append(None)
+                continue
 
-        # Update all the channel names and units
-        for channel_name, channel in self.channels.items():
-            # Channels have the format "Name (Units)"
-            print(channel_name)
-            name, units = channel_name.split(" (")
-            units = units[:-1]
-
-            channel.name = name
-            channel.units = units
-
-    @staticmethod
-    def __parse_can_log_line(line):
-        """ Extracts the timestamp, bus, arbitration id, and data from a single line in a can log file
-        recorded with candump -l.
-        """
-        stamp, bus, msg = line.split()
-        stamp = float(stamp[1:-1])
-        id, data = msg.split("#")
-        id = int(id, 16)
-        data = bytearray.fromhex(data)
+            name, _, units = column_name.partition(" (")
+            channel_names.append(name)
+            channel_units.append(units[:-1])
 
-        return stamp, bus, id, data
+        self.__load_csv_columns(chunks, len(column_names), channel_names, channel_units, \
+            channel_filter)
+
+    def __load_csv_columns(self, chunks, num_columns, channel_names, channel_units, \
+        channel_filter=None):
+        """ Creates a channel for each column of a CSV log after the time column.
+
+        The column types are determined from the first chunk of rows, and columns with non numeric
+        data are dropped before the rest of the log is parsed. A column which has non numeric data
+        later in the log is also removed.
+
+        chunks: Iterable of lists of lines or bytes like blocks containing many lines, following the
+            header
+        num_columns: Number of columns in the CSV log
+        channel_names: Channel names for each column after time, None to skip a column
+        channel_units: Channel units for each column after time
+        channel_filter: Optional channel_filter.ChannelFilter, columns which are not selected are
+            never parsed
+        """
+        # We'll keep a map of names and column numbers for easy channel lookups when parsing rows
+        channel_columns = {}
+        for i, (name, units) in enumerate(zip(channel_names, channel_units)):
+            if name is not None and (channel_filter is None or channel_filter(name)):
+                self.add_channel(name, units, float, 0)
+                channel_columns[name] = i + 1
+
+        # Each chunk is parsed a column at a time, the timestamp is the first column
+        for chunk in chunks:
+            names = list(channel_columns.keys())
+            columns = csv_log.parse_csv(chunk, num_columns, [0] + list(channel_columns.values()))
+            timestamps = columns.values[0]
+            if timestamps is None:
+                raise ValueError("Found non numeric timestamps in CSV log")
+
+            for name, values, decimals in zip(names, columns.values[1:], columns.decimals[1:]):
+                if values is None:
+                    print("WARNING: Found non numeric values for channel %s, removing " \
+                        "channel" % name)
+                    del channel_columns[name]
+                    del self.channels[name]
+                    continue
+
+                self.channels[name].extend(timestamps, values)
+                self.channels[name].decimals = max(decimals, self.channels[name].decimals)
 
     def __str__(self):
         output = "Log: %s, Duration: %f s" % (self.name, (self.end() - self.start()))
@@ -186,36 +363,233 @@ class DataLog(object):
             output += "\n\t%s" % channel_data
         return output
 
+# Number of lines processed at once by the log loaders
+LINE_CHUNK_SIZE = 65536
+
+def iter_line_chunks(log_lines, chunk_size=LINE_CHUNK_SIZE):
+    """ Yields lists of at most chunk_size consecutive lines.
+
+    log_lines: Iterable of lines, e.g. a list of lines, a generator, or an open file
+    """
+    log_lines = iter(log_lines)
+    while True:
+        chunk = list(itertools.islice(log_lines, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+def iter_chunks(log_lines):
+    """ Yields chunks of a log for the batch parsers.
+
+    Memory mapped log files are split into blocks of bytes which are passed to the parsers without
+    being copied or decoded, any other iterable of lines is split into lists of lines.
+
+    log_lines: log_file.LogFile, or an iterable of lines
+    """
+    if isinstance(log_lines, log_file.LogFile):
+        return log_lines.chunks()
+    else:
+        return iter_line_chunks(log_lines)
+
+def read_header(log_lines):
+    """ Reads the first line of a log.
+
+    log_lines: log_file.LogFile, or an iterable of lines
+    returns: Tuple of the header line, or None for an empty log, and an iterator over chunks of the
+        remaining lines
+    """
+    if isinstance(log_lines, log_file.LogFile):
+        header, end = log_lines.readline()
+        header = header.decode("utf-8", errors="replace") if header else None
+        return header, log_lines.chunks(end)
+
+    log_lines = iter(log_lines)
+    header = next(log_lines, None)
+    return header, iter_line_chunks(log_lines)
+
+# Decode plan for the database loaded in a worker process
+_worker_decode_plan = None
+
+def _init_can_worker(dbc_filename, channel_filter=None):
+    """ Loads the decode plan for the database once in each worker process. """
+    global _worker_decode_plan
+    _worker_decode_plan = cache.load_decode_plan(dbc_filename).select(channel_filter)
+
+def _decode_can_shard(filename, start, end):
+    """ Decodes a byte range of a candump file in a worker process.
+
+    returns: List of (name, units, timestamps, values) tuples for each channel
+    """
+    data_log = DataLog()
+    with log_file.LogFile(filename) as log:
+        data_log.append_can_chunks(log.chunks(start, end), _worker_decode_plan)
+
+    return [(channel.name, channel.units, channel.timestamps, channel.values) \
+        for channel in data_log.channels.values()]
+
+def resample_times(start_time, end_time, frequency):
+    """ Returns the fixed frequency sample times spanning [start_time, end_time).
+
+    The times are accumulated from start_time one step at a time, so they are identical to
+    repeatedly adding the sample period to the start time.
+    """
+    num_msgs = max(math.floor(frequency * (end_time - start_time)), 0)
+
+    steps = np.full(num_msgs, 1.0 / frequency)
+    if num_msgs:
+        steps[0] = start_time
+
+    return np.cumsum(steps)
+
+def zero_order_hold(timestamps, values, times, dt_step):
+    """ Samples a time series at the provided times, holding the latest value.
+
+    Each sample time takes the value of the latest message with a timestamp before the middle of
+    the following interval (i.e. t + 0.5 * dt_step). Messages are consumed in order, so a message
+    is never used once a later message has been. Sample times before the first message are 0.
+
+    timestamps: Array of message timestamps [s]
+    values: Array of message values
+    times: Array of increasing sample times [s]
+    dt_step: Interval between sample times [s]
+    """
+    if not timestamps.size:
+        return np.zeros(times.size, np.float64)
+
+    # Searching the running maximum of the timestamps reproduces consuming messages in order, even
+    # when the timestamps are not perfectly sorted
+    latest_stamps = np.maximum.accumulate(timestamps)
+    num_consumed = np.searchsorted(latest_stamps, times + 0.5 * dt_step, side="left")
+
+    held_values = np.empty(values.size + 1, np.float64)
+    held_values[0] = 0
+    held_values[1:] = values
+
+    return held_values[num_consumed]
+
 class Channel(object):
-    """ Represents a singe channel of data containing a time series of values."""
-    def __init__(self, name, units, data_type, decimals, messages=None):
+    """ Represents a singe channel of data containing a time series of values.
+
+    Samples are stored in a pair of contiguous float64 arrays (timestamps and values) which grow
+    geometrically as samples are appended, so no per sample objects are ever created. The
+    messages property provides a lazy view of Message objects for compatibility.
+    """
+    __slots__ = ("name", "units", "data_type", "decimals", "_timestamps", "_values", "_size")
+
+    # Initial number of samples allocated when a channel first receives data
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, name, units, data_type, decimals, messages=None, timestamps=None, \
+        values=None):
         self.name = str(name)
         self.units = str(units)
         self.data_type = data_type
         self.decimals = decimals
+
+        self._timestamps = np.empty(0, np.float64)
+        self._values = np.empty(0, np.float64)
+        self._size = 0
+
         if messages:
             self.messages = messages
-        else:
-            self.messages = []
+        elif timestamps is not None:
+            self.set_data(timestamps, values)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def timestamps(self):
+        """ Array of sample timestamps [s], this is a view of the internal buffer. """
+        return self._timestamps[:self._size]
+
+    @property
+    def values(self):
+        """ Array of sample values, this is a view of the internal buffer. """
+        return self._values[:self._size]
+
+    @property
+    def messages(self):
+        return MessageView(self)
+
+    @messages.setter
+    def messages(self, messages):
+        self.set_data([msg.timestamp for msg in messages], [msg.value for msg in messages])
+
+    def set_data(self, timestamps, values):
+        """ Replaces all samples in the channel with the provided timestamps and values.
+
+        Arrays are used directly without being copied when possible. Values that are float32 or
+        int32 arrays keep their type, so they can be handed to a MotecLog without any conversion.
+        """
+        self._timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+        values = np.asarray(values)
+        if values.dtype != np.float32 and values.dtype != np.int32:
+            values = values.astype(np.float64, copy=False)
+        self._values = values.ravel()
+        if self._timestamps.size != self._values.size:
+            raise ValueError("Channel %s has %d timestamps but %d values" % \
+                (self.name, self._timestamps.size, self._values.size))
+        self._size = self._timestamps.size
+
+    def append(self, timestamp, value):
+        """ Appends a single sample to the end of the channel. """
+        if self._size == self._timestamps.size:
+            self._reserve(self._size + 1)
+
+        self._timestamps[self._size] = timestamp
+        self._values[self._size] = value
+        self._size += 1
+
+    def extend(self, timestamps, values):
+        """ Appends an array of samples to the end of the channel. """
+        timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+        values = np.asarray(values).ravel()
+        if timestamps.size != values.size:
+            raise ValueError("Channel %s extended with %d timestamps but %d values" % \
+                (self.name, timestamps.size, values.size))
+
+        n = timestamps.size
+        if self._size + n > self._timestamps.size:
+            self._reserve(self._size + n)
+
+        self._timestamps[self._size:self._size + n] = timestamps
+        self._values[self._size:self._size + n] = values
+        self._size += n
+
+    def _reserve(self, capacity):
+        """ Grows the internal buffers to hold at least capacity samples.
+
+        The buffers at least double in size each time so appending is amortized constant time.
+        """
+        capacity = max(capacity, 2 * self._timestamps.size, self.INITIAL_CAPACITY)
+
+        timestamps = np.empty(capacity, np.float64)
+        values = np.empty(capacity, self._values.dtype)
+        timestamps[:self._size] = self._timestamps[:self._size]
+        values[:self._size] = self._values[:self._size]
+
+        self._timestamps = timestamps
+        self._values = values
 
     def start(self):
-        if self.messages:
-            return self.messages[0].timestamp
+        if self._size:
+            return float(self._timestamps[0])
         else:
             return 0
 
     def end(self):
-        if self.messages:
-            return self.messages[-1].timestamp
+        if self._size:
+            return float(self._timestamps[self._size - 1])
         else:
             return 0
 
     def avg_frequency(self):
         """ Computes the average frequency from the samples based on the duration of the channel
         and the number of messages"""
-        if len(self.messages) >= 2:
+        if self._size >= 2:
             dt = self.end() - self.start()
-            return len(self.messages) / dt
+            return self._size / dt
         else:
             return 0
 
@@ -227,45 +601,57 @@ class Channel(object):
         the most recent value will be retained. If no existing message is present within the first
         new time interval, then the first message will be initialized at 0.
         """
-        if not self.messages:
+        if not self._size:
             return
 
-        # Determine how many messages this channel should have,
-        num_msgs = math.floor(frequency * (end_time - start_time))
-        dt_step = 1.0 / frequency
-
-        # Create a new message at each time new time point based on the frequency. As we step
-        # through the new sample points we'll find the latest pre existing message to insert there,
-        # and will hold that value until we find another message.
-        value = 0
-        t = start_time
-        current_msgs_index = 0
-        new_msgs = []
-        for i in range(num_msgs):
-            # Grab the latest message that falls in this time window, if there is one, and update
-            # the current channel value
-            while current_msgs_index < len(self.messages):
-                msg_stamp = self.messages[current_msgs_index].timestamp
-
-                if msg_stamp < t + 0.5 * dt_step:
-                    # This message falls in the time window
-                    value = self.messages[current_msgs_index].value
-                    current_msgs_index += 1
-                else:
-                    # This messages belongs in a future window
-                    break
-
-            new_msgs.append(Message(t, value))
-            t += dt_step
-
-        self.messages = new_msgs
+        times = resample_times(start_time, end_time, frequency)
+        self._values = zero_order_hold(self.timestamps, self.values, times, 1.0 / frequency)
+        self._timestamps = times
+        self._size = times.size
 
     def __str__(self):
         return "Channel: %s, Units: %s, Decimals: %d, Messages: %d, Frequency: %.2f Hz" % \
-        (self.name, self.units, self.decimals, len(self.messages), self.avg_frequency())
+        (self.name, self.units, self.decimals, len(self), self.avg_frequency())
+
+class MessageView(object):
+    """ Read only sequence of Message objects backed by the sample arrays of a Channel.
+
+    Message objects are only created when an element is accessed. Appending a Message to the view
+    appends its sample to the underlying channel.
+    """
+    __slots__ = ("_channel",)
+
+    def __init__(self, channel):
+        self._channel = channel
+
+    def __len__(self):
+        return len(self._channel)
+
+    def __bool__(self):
+        return len(self._channel) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("message index out of range")
+
+        return Message(self._channel.timestamps[index], self._channel.values[index])
+
+    def __iter__(self):
+        for t, value in zip(self._channel.timestamps.tolist(), self._channel.values.tolist()):
+            yield Message(t, value)
+
+    def append(self, message):
+        self._channel.append(message.timestamp, message.value)
 
 class Message(object):
     """ A single message in a time series of data. """
+    __slots__ = ("timestamp", "value")
+
     def __init__(self, timestamp=0, value=0):
         self.timestamp = float(timestamp)
         self.value = float(value)
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+
+import argparse
+import channel_filter
+import concurrent.futures
+import datetime
+import motec_log_generator
+import numpy as np
+import os
+import re
+import struct
+
+from log_file import LogFile
+from motec_log import MotecLog
+from ldparser.ldparser import ldHead, ldChan
+
+DESCRIPTION = """Reads MoTeC .ld files, either listing the header and channels of a file or
+ verifying generated files against the logs they were generated from"""
+
+# Data types of the channel data, keyed by the type code and size in the channel meta data
+DTYPES = {
+    (0x07, 2): np.float16,
+    (0x07, 4): np.float32,
+    (0x00, 2): np.int16,
+    (0x00, 4): np.int32,
+    (0x03, 2): np.int16,
+    (0x03, 4): np.int32,
+    (0x05, 2): np.int16,
+    (0x05, 4): np.int32,
+}
+
+HEADER_SIZE = struct.calcsize(ldHead.fmt)
+
+class LdChannel(object):
+    """ A channel of an .ld file.
+
+    Only the meta data is read when the file is opened. The samples are exposed as a NumPy array
+    which is a view of the memory mapped file, so they are not read from disc until they are used
+    and are never copied.
+    """
+    def __init__(self, ld_file, meta_ptr, fields):
+        """ ld_file: LdFile the channel is in
+            meta_ptr: Offset of the channel meta data in the file
+            fields: Tuple of the channel meta data fields unpacked with ldChan.fmt
+        """
+        self.ld_file = ld_file
+        self.meta_ptr = meta_ptr
+
+        self.prev_meta_ptr, self.next_meta_ptr, self.data_ptr, self.data_len, _, \
+            type_code, type_size, self.freq, self.shift, self.multiplier, self.scale, \
+            self.decimals = fields[:12]
+        self.name, self.short_name, self.units = (_decode_string(field) for field in fields[12:15])
+
+        self.dtype = DTYPES.get((type_code, type_size))
+        if self.dtype is None:
+            raise ValueError("Channel %s has an unknown data type (0x%x, %d bytes)" % \
+                (self.name, type_code, type_size))
+
+    def __len__(self):
+        return self.data_len
+
+    @property
+    def raw(self):
+        """ Array of the samples as stored in the file, this is a read only view of the file. """
+        return self.ld_file.array(self.data_ptr, self.dtype, self.data_len)
+
+    def values(self):
+        """ Returns the samples converted to their physical values.
+
+        Channels stored without any conversion, which includes all channels written by MotecLog,
+        return the raw view without copying it.
+        """
+        if self.shift == 0 and self.multiplier == 1 and self.scale == 1 and self.decimals == 0:
+            return self.raw
+
+        return (self.raw / self.scale * 10.0 ** -self.decimals + self.shift) * self.multiplier
+
+    def timestamps(self):
+        """ Returns the time of each sample, relative to the start of the log [s]. """
+        return np.arange(self.data_len) / self.freq if self.freq else np.zeros(self.data_len)
+
+    def __str__(self):
+        return "Channel: %s, Units: %s, Samples: %d, Frequency: %d Hz, Type: %s" % \
+            (self.name, self.units, self.data_len, self.freq, np.dtype(self.dtype).name)
+
+class LdFile(object):
+    """ Read only, memory mapped MoTeC .ld file.
+
+    The header and the chain of channel meta data starting at MotecLog.HEADER_PTR are read when the
+    file is opened. Channel data is only read when it is accessed, see LdChannel.
+    """
+    def __init__(self, filename):
+        """ filename: Path to the .ld file
+            raises: ValueError if the file is not a valid .ld file
+        """
+        self.filename = filename
+        self.file = LogFile(filename)
+
+        try:
+            self.__read_header()
+            self.channels = {}
+            for channel in self.__read_channels():
+                self.channels[channel.name] = channel
+        except (ValueError, struct.error) as e:
+            self.close()
+            raise ValueError("%s is not a valid .ld file: %s" % (filename, e))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """ Unmaps the file, any channel data which is still referenced keeps the mapping open. """
+        self.file.close()
+
+    def array(self, offset, dtype, count):
+        """ Returns a read only array view of count values of a type starting at offset. """
+        if offset + count * np.dtype(dtype).itemsize > len(self.file):
+            raise ValueError("Data at %d is past the end of %s" % (offset, self.filename))
+
+        return np.frombuffer(self.file.view(offset, offset + count * np.dtype(dtype).itemsize), \
+            dtype, count)
+
+    def __read_header(self):
+        fields = struct.unpack(ldHead.fmt, self.file.view(0, HEADER_SIZE))
+        _, self.meta_ptr, self.data_ptr, self.event_ptr = fields[:4]
+        self.num_channels = fields[11]
+
+        date, time, self.driver, self.vehicle_id, self.venue_name = \
+            (_decode_string(field) for field in fields[12:17])
+        self.short_comment, self.event_name, self.event_session = \
+            (_decode_string(field) for field in fields[18:21])
+
+        try:
+            self.datetime = datetime.datetime.strptime(date + " " + time, "%d/%m/%Y %H:%M:%S")
+        except ValueError:
+            self.datetime = None
+
+    def __read_channels(self):
+        """ Yields each channel by following the chain of channel meta data. """
+        meta_ptr = self.meta_ptr if self.num_channels else 0
+        visited = set()
+        while meta_ptr:
+            if meta_ptr in visited:
+                raise ValueError("Channel meta data at %d forms a loop" % meta_ptr)
+            if meta_ptr + MotecLog.CHANNEL_HEADER_SIZE > len(self.file):
+                raise ValueError("Channel meta data at %d is past the end of the file" % meta_ptr)
+            visited.add(meta_ptr)
+
+            fields = struct.unpack(ldChan.fmt, \
+                self.file.view(meta_ptr, meta_ptr + MotecLog.CHANNEL_HEADER_SIZE))
+            channel = LdChannel(self, meta_ptr, fields)
+            yield channel
+            meta_ptr = channel.next_meta_ptr
+
+        if len(visited) != self.num_channels:
+            raise ValueError("Header has %d channels but %d were found" % \
+                (self.num_channels, len(visited)))
+
+def verify(ld_filename, data_log, frequency, channel_frequencies=None):
+    """ Checks that an .ld file holds the data of a DataLog, as saved by the generator.
+
+    The data log is resampled one channel at a time and compared against the channel of the same
+    name in the file, so neither the data log nor the file are ever held in memory resampled.
+
+    ld_filename: Path to the .ld file
+    data_log: DataLog the file was generated from
+    frequency: Frequency the channels were resampled at [Hz]
+    channel_frequencies: Dict mapping channel names to the frequency they were resampled at instead
+    returns: List of strings describing each difference, empty when the file matches
+    """
+    try:
+        ld_file = LdFile(ld_filename)
+    except (OSError, ValueError) as e:
+        return [str(e)]
+
+    errors = []
+    with ld_file:
+        names = list(ld_file.channels.keys())
+        expected_names = [name for name, channel in data_log.channels.items() if len(channel)]
+        if names != expected_names:
+            errors.append("Channels %s do not match %s" % (names, expected_names))
+
+        for channel in data_log.iter_resampled(frequency, channel_frequencies):
+            ld_channel = ld_file.channels.get(channel.name)
+            if ld_channel is None:
+                continue
+
+            expected = MotecLog.create_ld_channel(channel.name, channel.units, \
+                channel.data_type, int(channel.avg_frequency()), len(channel))
+            if ld_channel.units != expected.unit:
+                errors.append("%s: units '%s' do not match '%s'" % \
+                    (channel.name, ld_channel.units, expected.unit))
+            if ld_channel.freq != expected.freq:
+                errors.append("%s: frequency %d Hz does not match %d Hz" % \
+                    (channel.name, ld_channel.freq, expected.freq))
+            if ld_channel.dtype != expected.dtype:
+                errors.append("%s: type %s does not match %s" % (channel.name, \
+                    np.dtype(ld_channel.dtype).name, np.dtype(expected.dtype).name))
+            elif len(ld_channel) != len(channel):
+                errors.append("%s: %d samples do not match %d" % \
+                    (channel.name, len(ld_channel), len(channel)))
+            else:
+                try:
+                    raw = ld_channel.raw
+                except ValueError as e:
+                    errors.append("%s: %s" % (channel.name, e))
+                    continue
+
+                # Samples are compared bit for bit, so NaN values compare equal
+                mismatched = np.flatnonzero(raw.view(np.uint8).reshape(-1, raw.itemsize) != \
+                    np.asarray(channel.values, dtype=expected.dtype).view(np.uint8) \
+                    .reshape(-1, raw.itemsize)) // raw.itemsize
+                if mismatched.size:
+                    errors.append("%s: %d samples differ, starting at sample %d" % \
+                        (channel.name, np.unique(mismatched).size, mismatched[0]))
+
+    return errors
+
+def _verify_log(log_filename, ld_filename, log_type, decode_plan, can_format, frequency, \
+    channel_frequencies, selected_channels, time_window):
+    """ Loads a log the same way the generator does and verifies the .ld file generated from it,
+    in a worker process.
+
+    returns: List of strings describing each difference
+    """
+    data_log = motec_log_generator.load_data_log(log_filename, log_type, decode_plan, can_format, \
+        selected_channels, time_window)
+    return verify(ld_filename, data_log, frequency, channel_frequencies)
+
+def _decode_string(field):
+    return field.rstrip(b"\0").decode("ascii", "replace")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    info_parser = subparsers.add_parser("info", help="List the header and channels of .ld files")
+    info_parser.add_argument("ld", type=str, nargs="+", help="Path to .ld file")
+
+    verify_parser = subparsers.add_parser("verify", \
+        help="Check generated .ld files against the logs they were generated from")
+    verify_parser.add_argument("log", type=str, \
+        help="Path to logfile, or a directory or glob pattern of logfiles to verify in batch mode")
+    verify_parser.add_argument("log_type", type=str, help="Type of log", \
+        choices=["CAN", "CSV", "ACCESSPORT"])
+    verify_parser.add_argument("--output", type=str, \
+        help="Name of the .ld file, defaults to the same filename as 'log'. In batch mode this " \
+        "is the directory of the .ld files.")
+    verify_parser.add_argument("--frequency", type=float, default=20.0, \
+        help="Frequency the channels were resampled at")
+    verify_parser.add_argument("--channel_frequency", type=str, action="append", default=[], \
+        metavar="NAME=FREQUENCY", help="Frequency a single channel was resampled at")
+    verify_parser.add_argument("--dbc", type=str, help="Path to DBC file, required if log type CAN")
+    verify_parser.add_argument("--can_format", type=str, \
+        choices=sorted(motec_log_generator.can_readers.READERS), \
+        help="Format of CAN logs, detected from the file extension by default")
+    verify_parser.add_argument("--channels", type=str, action="append", default=[], \
+        metavar="PATTERN", help="Only channels matching a pattern were converted, can be repeated")
+    verify_parser.add_argument("--exclude", type=str, action="append", default=[], \
+        metavar="PATTERN", help="Channels matching a pattern were left out, can be repeated")
+    verify_parser.add_argument("--start", type=float, \
+        help="Start of the converted data, relative to the start of the log [s]")
+    verify_parser.add_argument("--end", type=float, \
+        help="End of the converted data, relative to the start of the log [s]")
+    verify_parser.add_argument("--jobs", type=int, default=1, \
+        help="Number of logs to verify at once")
+    args = parser.parse_args()
+
+    if args.command == "info":
+        for ld_filename in args.ld:
+            try:
+                with LdFile(os.path.expanduser(ld_filename)) as ld_file:
+                    print("%s:" % ld_filename)
+                    print("\tDate: %s, Driver: %s, Vehicle: %s, Venue: %s, Event: %s, " \
+                        "Session: %s" % (ld_file.datetime, ld_file.driver, ld_file.vehicle_id, \
+                        ld_file.venue_name, ld_file.event_name, ld_file.event_session))
+                    for channel in ld_file.channels.values():
+                        print("\t%s" % channel)
+            except (OSError, ValueError) as e:
+                print("ERROR: %s" % e)
+                exit(1)
+        exit(0)
+
+    args.log = os.path.expanduser(args.log)
+    if args.dbc:
+        args.dbc = os.path.expanduser(args.dbc)
+    if args.output:
+        args.output = os.path.expanduser(args.output)
+
+    channel_frequencies = {}
+    for entry in args.channel_frequency:
+        name, _, frequency = entry.rpartition("=")
+        try:
+            channel_frequencies[name] = float(frequency)
+        except ValueError:
+            name = ""
+
+        if not name or channel_frequencies[name] <= 0:
+            print("ERROR: Invalid channel frequency '%s', must be NAME=FREQUENCY" % entry)
+            exit(1)
+
+    if args.log_type == "CAN" and not (args.dbc and os.path.isfile(args.dbc)):
+        print("ERROR: DBC file %s does not exist" % args.dbc)
+        exit(1)
+
+    if args.jobs < 1:
+        print("ERROR: Number of jobs must be at least 1")
+        exit(1)
+
+    time_window = None
+    if args.start is not None or args.end is not None:
+        time_window = (args.start, args.end)
+
+    try:
+        selected_channels = channel_filter.ChannelFilter(args.channels, args.exclude)
+    except re.error as e:
+        print("ERROR: Invalid channel pattern: %s" % e)
+        exit(1)
+
+    decode_plan = None
+    if args.log_type == "CAN":
+        try:
+            decode_plan = motec_log_generator.load_selected_decode_plan(args.dbc, \
+                selected_channels)
+        except ValueError as e:
+            print("ERROR: %s" % e)
+            exit(1)
+
+    # The .ld files are found the same way the generator names them
+    if os.path.isfile(args.log):
+        log_filenames = [args.log]
+        ld_filenames = [motec_log_generator.get_ld_filename(args.log, args.output)]
+    else:
+        log_filenames = motec_log_generator.find_logs(args.log, args.log_type)
+        if not log_filenames:
+            print("ERROR: log file %s does not exist" % args.log)
+            exit(1)
+        try:
+            ld_filenames = motec_log_generator.get_batch_ld_filenames(log_filenames, \
+                args.output)
+        except ValueError as e:
+            print("ERROR: %s" % e)
+            exit(1)
+
+    failed = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(_verify_log, log_filename, ld_filename, args.log_type, \
+            decode_plan, args.can_format, args.frequency, channel_frequencies, selected_channels, \
+            time_window) \
+            for log_filename, ld_filename in zip(log_filenames, ld_filenames)]
+
+        for ld_filename, future in zip(ld_filenames, futures):
+            try:
+                errors = future.result()
+            except Exception as e:
+                errors = ["Failed to load log: %s" % e]
+
+            if errors:
+                failed += 1
+                print("%s: FAILED" % ld_filename)
+                for error in errors:
+                    print("\t%s" % error)
+            else:
+                print("%s: OK" % ld_filename)
+
+    print("\nVerified %d of %d files" % (len(ld_filenames) - failed, len(ld_filenames)))
+    if failed:
+        exit(1)
@@ -0,0 +1,609 @@
+import cache
+import can_log
+import datetime
+import hashlib
+import json
+import log_file
+import math
+import numpy as np
+import os
+import queue
+import stat
+import threading
+import time
+
+from data_log import DataLog, resample_times, zero_order_hold
+from motec_log import MotecLog
+
+# Incremented whenever the format of the checkpoint changes, so older checkpoints are not used
+CHECKPOINT_VERSION = 2
+
+# Number of bytes at the start of the log used to recognize it, so a log which has been replaced
+# is converted from scratch
+LOG_ID_SIZE = 4096
+
+# Duration of samples reserved after the data of each channel, so later updates can be written in
+# place [s]
+RESERVE_DURATION = 600.0
+
+# Size of each sample in the MoTeC log, channels are stored as float32 [bytes]
+SAMPLE_SIZE = 4
+
+# Interval between checks for new data at the end of a followed file [s]
+POLL_INTERVAL = 0.1
+
+# Maximum number of blocks read from a followed log which are waiting to be decoded
+MAX_PENDING_BLOCKS = 16
+
+class LiveLog(object):
+    """ Incrementally converts a candump log which is still being recorded to a MoTeC log.
+
+    Each update only parses the lines appended to the log since the previous update, then extends
+    the data of each channel in the existing .ld file. Progress is stored in a checkpoint file next
+    to the .ld file, holding:
+        -The byte offset of the first line not yet parsed
+        -The start and end time of the log
+        -For each channel: its location in the .ld file, the number of samples which are final,
+         the time of the last final sample, and the messages which can still change the later
+         samples
+
+    A resampled sample takes the value of the latest message before the middle of the following
+    interval, so only the last few samples of each channel can change as more messages arrive.
+    These are rewritten on the next update, so the .ld file is always the same as converting the
+    entire log at once. This relies on lines being appended to the log in time order, as they are
+    by candump. If the checkpoint does not match the log, DBC, settings, or .ld file the log is
+    converted from scratch.
+
+    The .ld file reserves space after the data of each channel, so most updates only write the new
+    samples and patch the channel headers. A channel which outgrows its space is moved to the end
+    of the file, and channels which first appear in later updates are added to the end of the file.
+    """
+    def __init__(self, log_filename, ld_filename, dbc_filename, frequency, \
+        channel_frequencies=None, metadata=None, channel_filter=None):
+        """ log_filename: Path to the candump log (recorded with 'candump' with '-l')
+            ld_filename: Path of the .ld file to create and update
+            dbc_filename: Path to the DBC file for the log
+            frequency: Frequency to resample all channels at
+            channel_frequencies: Dict mapping channel names to the frequency to resample them at
+                instead
+            metadata: Dict mapping MoTeC log metadata field names to their values
+            channel_filter: Optional channel_filter.ChannelFilter selecting the signals to decode
+        """
+        self.log_filename = log_filename
+        self.ld_filename = ld_filename
+        self.dbc_filename = dbc_filename
+        self.frequency = frequency
+        self.channel_frequencies = channel_frequencies if channel_frequencies else {}
+        self.metadata = metadata if metadata else {}
+        self.checkpoint_filename = ld_filename + ".checkpoint"
+
+        self.decode_plan = cache.load_decode_plan(dbc_filename).select(channel_filter)
+        self.dbc_hash = cache.file_hash(dbc_filename)
+        self.selection = channel_filter.key() if channel_filter else ""
+
+        # Contents of the checkpoint after the last update
+        self.state = None
+
+    def update(self):
+        """ Parses any lines appended to the log and updates the MoTeC log.
+
+        returns: Tuple of the number of bytes of the log that were parsed, and whether the MoTeC
+            log was created from scratch
+        """
+        with log_file.LogFile(self.log_filename) as log:
+            state = self.__load_checkpoint(log)
+            rebuild = state is None
+            if rebuild:
+                state = self.__new_state()
+
+            # A partially written final line is left for the next update
+            end = log.last_line_end()
+            new_log = DataLog()
+            new_log.append_can_chunks(log.chunks(state["offset"], end), self.decode_plan)
+
+            if not rebuild and not self.__is_continuation(state, new_log):
+                state = self.__new_state()
+                rebuild = True
+                new_log = DataLog()
+                new_log.append_can_chunks(log.chunks(0, end), self.decode_plan)
+
+            num_bytes = end - state["offset"]
+            state["offset"] = end
+            state["log_id"] = _log_id(log, end)
+
+        self.__update_channels(state, new_log, rebuild)
+        self.__save_checkpoint(state)
+        self.state = state
+
+        return num_bytes, rebuild
+
+    def num_channels(self):
+        """ Returns the number of channels in the MoTeC log after the last update. """
+        return len(self.state["channels"]) if self.state else 0
+
+    def duration(self):
+        """ Returns the duration of the MoTeC log after the last update [s]. """
+        if not self.state or self.state["start"] is None:
+            return 0.0
+        return self.state["end"] - self.state["start"]
+
+    def __new_state(self):
+        return {
+            "version": CHECKPOINT_VERSION,
+            "offset": 0,
+            "log_id": None,
+            "dbc_hash": self.dbc_hash,
+            "selection": self.selection,
+            "frequency": self.frequency,
+            "channel_frequencies": self.channel_frequencies,
+            "datetime": datetime.datetime.now().isoformat(),
+            "start": None,
+            "end": None,
+            "ld_end": MotecLog.HEADER_PTR,
+            "ld_size": None,
+            "ld_mtime": None,
+            "channels": [],
+        }
+
+    def __read_checkpoint(self):
+        try:
+            with open(self.checkpoint_filename, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def __load_checkpoint(self, log):
+        """ Loads the checkpoint, returns None when it does not exist or does not match the log,
+        settings, or .ld file.
+        """
+        state = self.__read_checkpoint()
+        if not state or state.get("version") != CHECKPOINT_VERSION:
+            return None
+
+        if state["dbc_hash"] != self.dbc_hash or state["selection"] != self.selection or \
+            state["frequency"] != self.frequency or \
+            state["channel_frequencies"] != self.channel_frequencies:
+            return None
+
+        # The log must still start with the same data, and not have been truncated
+        if len(log) < state["offset"] or _log_id(log, state["offset"]) != state["log_id"]:
+            return None
+
+        # The .ld file must not have been modified since the last update
+        try:
+            ld_stat = os.stat(self.ld_filename)
+        except OSError:
+            return None
+        if ld_stat.st_size != state["ld_size"] or ld_stat.st_mtime_ns != state["ld_mtime"]:
+            return None
+
+        return state
+
+    def __save_checkpoint(self, state):
+        ld_stat = os.stat(self.ld_filename)
+        state["ld_size"] = ld_stat.st_size
+        state["ld_mtime"] = ld_stat.st_mtime_ns
+
+        temp_filename = self.checkpoint_filename + ".tmp"
+        with open(temp_filename, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_filename, self.checkpoint_filename)
+
+    @staticmethod
+    def __is_continuation(state, new_log):
+        """ Checks that the new messages follow the messages already converted, so the start time
+        and the final samples of the log are unchanged.
+        """
+        if state["start"] is None:
+            return True
+
+        # Samples before the end of the log are final, so no new message may precede it
+        for log_channel in new_log.channels.values():
+            if len(log_channel) and log_channel.start() < state["end"]:
+                return False
+
+        return True
+
+    def __update_channels(self, state, new_log, rebuild):
+        """ Resamples the new messages of each channel and writes them to the .ld file. """
+        if state["start"] is None and new_log.channels:
+            state["start"] = new_log.start()
+
+        # Channels which first appear in this update are added to the end
+        channels = {channel["name"]: channel for channel in state["channels"]}
+        for name, log_channel in new_log.channels.items():
+            if name not in channels and len(log_channel):
+                channels[name] = {
+                    "name": name,
+                    "units": log_channel.units,
+                    "meta_ptr": None,
+                    "data_ptr": None,
+                    "capacity": 0,
+                    "num_samples": 0,
+                    "num_final": 0,
+                    "last_final_time": None,
+                    "last_time": None,
+                    "last_message": None,
+                    "pending_timestamps": [],
+                    "pending_values": [],
+                }
+                state["channels"].append(channels[name])
+
+        for name, log_channel in new_log.channels.items():
+            if len(log_channel):
+                channels[name]["last_message"] = log_channel.end()
+
+        if not state["channels"]:
+            self.__write(state, {}, rebuild)
+            return
+
+        # The end of the log is the latest message of any channel
+        start = state["start"]
+        end = max(channel["last_message"] for channel in state["channels"])
+        state["end"] = end
+
+        updates = {}
+        for channel in state["channels"]:
+            name = channel["name"]
+            frequency = self.channel_frequencies.get(name, self.frequency)
+            dt_step = 1.0 / frequency
+
+            # Continue the sample times from the last final sample, accumulating them in the same
+            # way as resample_times() so they are identical to resampling the whole log
+            num_samples = max(math.floor(frequency * (end - start)), 0)
+            num_final = channel["num_final"]
+            if num_final:
+                steps = np.full(num_samples - num_final + 1, dt_step)
+                steps[0] = channel["last_final_time"]
+                times = np.cumsum(steps)[1:]
+            else:
+                times = resample_times(start, end, frequency)
+
+            timestamps = np.array(channel["pending_timestamps"], np.float64)
+            values = np.array(channel["pending_values"], np.float64)
+            if name in new_log.channels:
+                timestamps = np.concatenate((timestamps, new_log.channels[name].timestamps))
+                values = np.concatenate((values, new_log.channels[name].values))
+            samples = zero_order_hold(timestamps, values, times, dt_step)
+
+            # Samples are final once no later message can be consumed by them
+            new_final = int(np.searchsorted(times + 0.5 * dt_step, end, side="right"))
+            if new_final:
+                channel["last_final_time"] = float(times[new_final - 1])
+            channel["num_final"] = num_final + new_final
+            if times.size:
+                channel["last_time"] = float(times[-1])
+            channel["num_samples"] = num_samples
+
+            # Keep the messages which can still be consumed by the samples that are not final,
+            # along with the message held before them
+            if channel["num_final"]:
+                next_time = channel["last_final_time"] + dt_step
+            else:
+                next_time = start
+            latest_stamps = np.maximum.accumulate(timestamps) if timestamps.size else timestamps
+            first_pending = max(int(np.searchsorted(latest_stamps, next_time + 0.5 * dt_step, \
+                side="left")) - 1, 0)
+            channel["pending_timestamps"] = latest_stamps[first_pending:].tolist()
+            channel["pending_values"] = values[first_pending:].tolist()
+
+            updates[name] = (num_final, samples)
+
+        self.__write(state, updates, rebuild)
+
+    def __write(self, state, updates, rebuild):
+        """ Writes the new samples of each channel to the .ld file, then patches the channel and
+        file headers.
+
+        updates: Dict mapping channel names to a tuple of the index of the first sample to write,
+            and the samples
+        """
+        motec_log = MotecLog()
+        for field, value in self.metadata.items():
+            setattr(motec_log, field, value)
+        motec_log.datetime = datetime.datetime.fromisoformat(state["datetime"])
+        motec_log.initialize()
+
+        with open(self.ld_filename, "w+b" if rebuild else "r+b") as f:
+            channels = state["channels"]
+            for channel in channels:
+                if channel["name"] not in updates:
+                    continue
+                first_sample, samples = updates[channel["name"]]
+                self.__write_samples(f, state, channel, first_sample, samples)
+
+            # Link all the channels together, in the order they were created
+            ld_channels = []
+            for i, channel in enumerate(channels):
+                num_samples = channel["num_samples"]
+                duration = channel["last_time"] - state["start"] if num_samples >= 2 else 0
+                freq = int(num_samples / duration) if duration > 0 else 0
+
+                ld_channel = MotecLog.create_ld_channel(channel["name"], channel["units"], float, \
+                    freq, num_samples)
+                ld_channel.meta_ptr = channel["meta_ptr"]
+                ld_channel.data_ptr = channel["data_ptr"]
+                ld_channel.prev_meta_ptr = channels[i - 1]["meta_ptr"] if i > 0 else 0
+                ld_channel.next_meta_ptr = channels[i + 1]["meta_ptr"] if i < len(channels) - 1 \
+                    else 0
+                ld_channel.write(f, i)
+                ld_channels.append(ld_channel)
+
+            if ld_channels:
+                motec_log.ld_header.meta_ptr = ld_channels[0].meta_ptr
+                motec_log.ld_header.data_ptr = ld_channels[0].data_ptr
+            else:
+                motec_log.ld_header.meta_ptr = MotecLog.HEADER_PTR
+                motec_log.ld_header.data_ptr = MotecLog.HEADER_PTR
+
+            f.seek(0)
+            motec_log.ld_header.write(f, len(ld_channels))
+
+            # Reserved space at the end of the file is filled with zeros
+            f.truncate(max(state["ld_end"], f.seek(0, os.SEEK_END)))
+
+    def __write_samples(self, f, state, channel, first_sample, samples):
+        """ Writes samples to a channel starting at an index, moving the channel to the end of the
+        file when its reserved space is too small.
+        """
+        num_samples = first_sample + samples.size
+        if channel["data_ptr"] is None or num_samples > channel["capacity"]:
+            frequency = self.channel_frequencies.get(channel["name"], self.frequency)
+            capacity = max(2 * num_samples, num_samples + int(frequency * RESERVE_DURATION))
+
+            # Copy over the existing samples which are not being replaced
+            existing = b""
+            if channel["data_ptr"] is not None and first_sample:
+                f.seek(channel["data_ptr"])
+                existing = f.read(first_sample * SAMPLE_SIZE)
+
+            # New channels have their header placed in front of their data
+            if channel["meta_ptr"] is None:
+                channel["meta_ptr"] = state["ld_end"]
+                state["ld_end"] += MotecLog.CHANNEL_HEADER_SIZE
+
+            channel["data_ptr"] = state["ld_end"]
+            channel["capacity"] = capacity
+            state["ld_end"] += capacity * SAMPLE_SIZE
+
+            f.seek(channel["data_ptr"])
+            f.write(existing)
+
+        f.seek(channel["data_ptr"] + first_sample * SAMPLE_SIZE)
+        f.write(samples.astype(np.float32).tobytes())
+
+class MessageRing(object):
+    """ Ring buffer holding the messages of a single channel in time order.
+
+    New messages are written after the newest message, and old messages are dropped by advancing
+    the position of the oldest message, so neither requires moving the retained messages. The
+    buffers only grow when more messages need to be retained than they can hold.
+    """
+    __slots__ = ("name", "units", "_timestamps", "_values", "_start", "_size")
+
+    # Initial number of messages allocated for a channel
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, name, units):
+        self.name = name
+        self.units = units
+
+        self._timestamps = np.empty(self.INITIAL_CAPACITY, np.float64)
+        self._values = np.empty(self.INITIAL_CAPACITY, np.float64)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def extend(self, timestamps, values):
+        """ Appends arrays of messages after the newest message. """
+        n = timestamps.size
+        if self._size + n > self._timestamps.size:
+            self.__grow(self._size + n)
+
+        positions = (self._start + self._size + np.arange(n)) % self._timestamps.size
+        self._timestamps[positions] = timestamps
+        self._values[positions] = values
+        self._size += n
+
+    def drop_before(self, timestamp):
+        """ Drops the messages older than a timestamp. """
+        first, second = self.__segments(self._timestamps)
+        count = int(np.searchsorted(first, timestamp, side="left"))
+        if count == first.size:
+            count += int(np.searchsorted(second, timestamp, side="left"))
+
+        self._start = (self._start + count) % self._timestamps.size
+        self._size -= count
+
+    def timestamps(self):
+        """ Returns a copy of the message timestamps in time order [s]. """
+        return np.concatenate(self.__segments(self._timestamps))
+
+    def values(self):
+        """ Returns a copy of the message values in time order. """
+        return np.concatenate(self.__segments(self._values))
+
+    def __segments(self, array):
+        """ Returns the oldest and newest parts of the messages in a buffer, split where the buffer
+        wraps around.
+        """
+        end = self._start + self._size
+        if end <= array.size:
+            return array[self._start:end], array[:0]
+        return array[self._start:], array[:end - array.size]
+
+    def __grow(self, capacity):
+        capacity = max(capacity, 2 * self._timestamps.size)
+
+        timestamps = np.empty(capacity, np.float64)
+        values = np.empty(capacity, np.float64)
+        timestamps[:self._size] = self.timestamps()
+        values[:self._size] = self.values()
+
+        self._timestamps = timestamps
+        self._values = values
+        self._start = 0
+
+class FollowLog(object):
+    """ Continuously converts a candump log while it is being recorded, publishing snapshots of
+    the most recent data as a MoTeC log.
+
+    Blocks of the log are decoded as they are read, and the messages of each channel are stored in
+    a MessageRing. When a window is given, messages more than window seconds older than the latest
+    message are dropped, so memory use is bounded by the duration of the window rather than the
+    duration of the log.
+
+    Each snapshot resamples the retained messages and writes them to a temporary file, which then
+    replaces the .ld file. The .ld file is replaced atomically, so a program reading it always sees
+    a complete log. A snapshot is identical to converting the lines of the log covered by the
+    window.
+    """
+    def __init__(self, ld_filename, decode_plan, frequency, channel_frequencies=None, \
+        metadata=None, window=None):
+        """ ld_filename: Path of the .ld file to publish snapshots to
+            decode_plan: can_decode.DecodePlan for the DBC file of the log
+            frequency: Frequency to resample all channels at
+            channel_frequencies: Dict mapping channel names to the frequency to resample them at
+                instead
+            metadata: Dict mapping MoTeC log metadata field names to their values
+            window: Duration of the most recent messages to keep, or None to keep all messages [s]
+        """
+        self.ld_filename = ld_filename
+        self.decode_plan = decode_plan
+        self.frequency = frequency
+        self.channel_frequencies = channel_frequencies if channel_frequencies else {}
+        self.metadata = metadata if metadata else {}
+        self.window = window
+
+        self.rings = {}
+        self.end = None
+        self.changed = False
+
+        # A partially received line, which is completed by the next block
+        self.__partial = b""
+
+    def feed(self, data):
+        """ Decodes a block of the log, which may start and end part way through a line. """
+        data = self.__partial + bytes(data)
+        end = data.rfind(b"\n") + 1
+        self.__partial = data[end:]
+        if not end:
+            return
+
+        frames = can_log.parse_candump(memoryview(data)[:end])
+        for name, units, timestamps, values in self.decode_plan.decode(frames):
+            if name not in self.rings:
+                self.rings[name] = MessageRing(name, units)
+            self.rings[name].extend(timestamps, values)
+
+            if self.end is None or timestamps[-1] > self.end:
+                self.end = float(timestamps[-1])
+            self.changed = True
+
+        if self.window is not None and self.end is not None:
+            for ring in self.rings.values():
+                ring.drop_before(self.end - self.window)
+
+    def flush(self):
+        """ Decodes a final line which was not terminated by a newline. """
+        if self.__partial:
+            self.feed(b"\n")
+
+    def snapshot(self):
+        """ Resamples the retained messages and atomically replaces the .ld file with them.
+
+        returns: DataLog of the messages in the snapshot
+        """
+        data_log = DataLog()
+        for name, ring in self.rings.items():
+            if len(ring):
+                data_log.add_channel(name, ring.units, float, 3).set_data(ring.timestamps(), \
+                    ring.values())
+
+        motec_log = MotecLog()
+        for field, value in self.metadata.items():
+            setattr(motec_log, field, value)
+
+        # The window moves as the log grows, so the log is dated from its first message
+        if data_log.channels:
+            motec_log.datetime = datetime.datetime.fromtimestamp(data_log.start())
+        motec_log.initialize()
+
+        # The temporary file is in the same directory so it can be renamed over the .ld file
+        temp_filename = self.ld_filename + ".tmp"
+        motec_log.write_streaming(temp_filename, \
+            data_log.iter_resampled(self.frequency, self.channel_frequencies), \
+            len(data_log.channels))
+        os.replace(temp_filename, self.ld_filename)
+
+        self.changed = False
+        return data_log
+
+    def follow(self, stream, interval, on_snapshot=None):
+        """ Decodes a log as it is written, publishing a snapshot every interval seconds when new
+        messages have been received.
+
+        A regular file is followed indefinitely, waiting for more data to be written at its end.
+        Other streams, e.g. a pipe from candump, are read until they are closed. Following stops
+        at the end of the stream or on a keyboard interrupt, after which a final snapshot is
+        published.
+
+        stream: Binary file object to read the log from
+        interval: Time between snapshots [s]
+        on_snapshot: Optional function called with the DataLog of each snapshot
+        """
+        # The stream is read on a separate thread so snapshots are published on time while
+        # waiting for data. The queue is bounded so a slow decode applies back pressure.
+        blocks = queue.Queue(maxsize=MAX_PENDING_BLOCKS)
+        wait_at_end = stat.S_ISREG(os.fstat(stream.fileno()).st_mode)
+        reader = threading.Thread(target=_read_blocks, args=(stream, blocks, wait_at_end), \
+            daemon=True)
+        reader.start()
+
+        try:
+            next_snapshot = time.monotonic() + interval
+            while True:
+                try:
+                    block = blocks.get(timeout=max(next_snapshot - time.monotonic(), 0))
+                except queue.Empty:
+                    block = b""
+
+                if block is None:
+                    break
+                self.feed(block)
+
+                if time.monotonic() >= next_snapshot:
+                    if self.changed:
+                        data_log = self.snapshot()
+                        if on_snapshot:
+                            on_snapshot(data_log)
+                    next_snapshot = time.monotonic() + interval
+        except KeyboardInterrupt:
+            pass
+
+        self.flush()
+        data_log = self.snapshot()
+        if on_snapshot:
+            on_snapshot(data_log)
+
+def _read_blocks(stream, blocks, wait_at_end):
+    """ Reads blocks from a stream into a queue, followed by None at the end of the stream.
+
+    wait_at_end: Wait for more data at the end of the stream rather than ending, for following a
+        regular file
+    """
+    while True:
+        block = stream.read1(log_file.CHUNK_SIZE)
+        if block:
+            blocks.put(block)
+        elif wait_at_end:
+            time.sleep(POLL_INTERVAL)
+        else:
+            blocks.put(None)
+            return
+
+def _log_id(log, end):
+    """ Returns a hash of the start of a log, up to LOG_ID_SIZE bytes before an offset. """
+    return hashlib.sha256(log.view(0, min(end, LOG_ID_SIZE))).hexdigest()
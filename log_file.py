@@ -0,0 +1,132 @@
+import mmap
+
+# Number of bytes processed at once when iterating over a log file in chunks
+CHUNK_SIZE = 2 * 1024 * 1024
+
+class LogFile(object):
+    """ Read only, memory mapped view of a log file.
+
+    The contents of the file are exposed as a bytes like buffer without being read into memory or
+    decoded to strings. Slices of the file are memoryviews into the mapping, so they can be handed
+    to the batch parsers (e.g. can_log.parse_candump) without copying. The operating system shares
+    the mapped pages between every process that maps the same file, so parallel workers can each
+    open the file and process their own byte range without duplicating it in memory.
+    """
+    def __init__(self, filename):
+        """ filename: Path to the log file """
+        self.filename = filename
+
+        with open(filename, "rb") as f:
+            f.seek(0, 2)
+            self.size = f.tell()
+
+            # Empty files can not be mapped
+            if self.size:
+                self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.__map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        """ Unmaps the file.
+
+        If any views of the file are still referenced the mapping is left for the garbage collector
+        to close once they are released.
+        """
+        if self.__map is not None:
+            try:
+                self.__map.close()
+            except BufferError:
+                pass
+            self.__map = None
+
+    def view(self, start=0, end=None):
+        """ Returns a memoryview of the bytes in [start, end) without copying them. """
+        end = self.size if end is None else min(end, self.size)
+        if self.__map is None or start >= end:
+            return memoryview(b"")
+
+        return memoryview(self.__map)[start:end]
+
+    def line_end(self, offset):
+        """ Returns the offset of the start of the line following the one containing offset. """
+        if self.__map is None or offset >= self.size:
+            return self.size
+
+        newline = self.__map.find(b"\n", offset)
+        return self.size if newline < 0 else newline + 1
+
+    def last_line_end(self):
+        """ Returns the offset following the last newline in the file, so a partially written final
+        line is excluded.
+        """
+        if self.__map is None:
+            return 0
+
+        return self.__map.rfind(b"\n") + 1
+
+    def readline(self, start=0):
+        """ Returns the line starting at an offset, including the newline, and the offset of the
+        next line.
+        """
+        end = self.line_end(start)
+        return bytes(self.view(start, end)), end
+
+    def split(self, num_shards, start=0, end=None):
+        """ Splits the range [start, end) of the file into byte ranges of roughly equal size that
+        start and end on line boundaries.
+
+        The range should start on a line boundary, it covers the entire file by default.
+
+        returns: List of (start, end) byte offsets
+        """
+        end = self.size if end is None else min(end, self.size)
+
+        bounds = [start]
+        for i in range(1, num_shards):
+            # Move to the start of the line following the nominal boundary
+            boundary = start + (end - start) * i // num_shards
+            bounds.append(min(self.line_end(max(boundary, bounds[-1])), end))
+        bounds.append(end)
+
+        return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+    def chunks(self, start=0, end=None, chunk_size=CHUNK_SIZE):
+        """ Yields memoryviews of consecutive blocks of the range [start, end), each ending on a
+        line boundary.
+
+        Blocks are around chunk_size bytes, but will be longer to fit a line which does not fit in
+        a single chunk. The range should start on a line boundary, e.g. as returned by split().
+
+        Once a block has been processed its pages are released from this process, so the resident
+        memory stays around the size of a chunk regardless of the size of the file.
+        """
+        end = self.size if end is None else min(end, self.size)
+
+        while start < end:
+            stop = min(start + chunk_size, end)
+            if stop < end:
+                newline = self.__map.rfind(b"\n", start, stop)
+                stop = newline + 1 if newline >= 0 else min(self.line_end(stop), end)
+
+            yield self.view(start, stop)
+            self.__release(start, stop)
+            start = stop
+
+    def __release(self, start, end):
+        """ Tells the operating system the pages fully within [start, end) are no longer needed. """
+        if not hasattr(mmap, "MADV_DONTNEED") or self.__map is None:
+            return
+
+        start = -(-start // mmap.PAGESIZE) * mmap.PAGESIZE
+        end = end // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > start:
+            self.__map.madvise(mmap.MADV_DONTNEED, start, end - start)
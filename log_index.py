@@ -0,0 +1,290 @@
+import bisect
+import cache
+import can_log
+import numpy as np
+
+# Distance between the entries of a time index [bytes]
+INDEX_INTERVAL = 1024 * 1024
+
+# Number of bytes searched for a CAN frame at each entry of a time index
+INDEX_SEARCH_SIZE = 4096
+
+# Number of frames read from a log at once through an id index
+INDEX_READ_FRAMES = 65536
+
+class TimeIndex(object):
+    """ Sparse index from timestamps to byte offsets in a candump log.
+
+    An entry is recorded roughly every INDEX_INTERVAL bytes with the offset of a line and the
+    timestamp of the first frame at or after it. Since candump writes frames in time order, the
+    byte range holding the frames in a time window can be found from the index without parsing the
+    rest of the log. Building the index only parses a few lines at each entry, rather than the
+    entire log.
+    """
+    def __init__(self, offsets, timestamps, size):
+        """ offsets: List of the byte offsets of each entry
+            timestamps: List of the timestamp at each entry [s]
+            size: Size of the log file [bytes]
+        """
+        self.offsets = offsets
+        self.timestamps = timestamps
+        self.size = size
+
+    @classmethod
+    def build(cls, log, interval=INDEX_INTERVAL):
+        """ Builds the index for a log.
+
+        log: log_file.LogFile of the candump log
+        interval: Distance between entries [bytes]
+        """
+        offsets = []
+        timestamps = []
+
+        offset = 0
+        while offset < len(log):
+            # Lines which are not CAN frames are skipped, until a frame is found
+            block_end = log.line_end(min(offset + INDEX_SEARCH_SIZE, len(log)))
+            frames = can_log.parse_candump(log.view(offset, block_end))
+            if len(frames):
+                offsets.append(offset)
+                timestamps.append(float(frames.timestamps[0]))
+                offset = log.line_end(offset + interval)
+            else:
+                offset = block_end
+
+        return cls(offsets, timestamps, len(log))
+
+    def start_time(self):
+        """ Returns the timestamp of the first frame in the log, or None for a log without any
+        frames [s].
+        """
+        return self.timestamps[0] if self.timestamps else None
+
+    def byte_range(self, start_time=None, end_time=None):
+        """ Returns the byte range of the log holding the frames in a time window.
+
+        The range starts and ends on line boundaries, and extends one entry past the window on
+        each side so frames which are slightly out of order are not missed. The range can contain
+        frames outside of the window, which need to be removed once parsed.
+
+        start_time: Start of the window, None for the start of the log [s]
+        end_time: End of the window, None for the end of the log [s]
+        returns: Tuple of the start and end offsets [bytes]
+        """
+        start = 0
+        if start_time is not None:
+            entry = bisect.bisect_left(self.timestamps, start_time) - 2
+            if entry > 0:
+                start = self.offsets[entry]
+
+        end = self.size
+        if end_time is not None:
+            entry = bisect.bisect_right(self.timestamps, end_time) + 1
+            if entry < len(self.offsets):
+                end = self.offsets[entry]
+
+        return start, end
+
+class IdIndex(object):
+    """ Index from each arbitration id in a candump log to the lines of its frames.
+
+    Ids are looked up by their key, see can_log.id_keys(), so standard and extended ids with the
+    same value have separate entries.
+
+    The offset and length of the line of every frame are stored grouped by id, in the order they
+    appear in the log. The frames with a few ids can then be read straight from their lines,
+    rather than parsing the entire log. Building the index is a single pass over the log which
+    only parses the id of each frame.
+
+    The index has an entry for every frame, so the offsets are stored as uint32 and the lengths as
+    uint16 whenever the log is small enough and its lines short enough for them to fit.
+    """
+    def __init__(self, ids, pointers, offsets, lengths):
+        """ ids: Sorted uint32 array of the keys of the ids in the log
+            pointers: Array where the frames with ids[i] are in entries pointers[i] to
+                pointers[i + 1]
+            offsets: Array of the byte offset of the line of each frame, grouped by id, see
+                offset_dtype()
+            lengths: Array of the length of the line of each frame, excluding the newline, see
+                length_dtype()
+        """
+        self.ids = ids
+        self.pointers = pointers
+        self.offsets = offsets
+        self.lengths = lengths
+
+    @classmethod
+    def build(cls, log):
+        """ Builds the index for a log.
+
+        log: log_file.LogFile of the candump log
+        """
+        ids = []
+        offsets = []
+        lengths = []
+
+        offset = 0
+        for chunk in log.chunks():
+            starts, ends, chunk_ids, extended = can_log.parse_candump_ids(chunk)
+            ids.append(can_log.id_keys(chunk_ids, extended))
+            offsets.append(starts + offset)
+            lengths.append(ends - starts)
+            offset += len(chunk)
+
+        offset_dtype = cls.offset_dtype(len(log))
+        if not ids:
+            return cls(np.empty(0, np.uint32), np.zeros(1, np.int64), np.empty(0, offset_dtype), \
+                np.empty(0, np.uint16))
+
+        # A stable sort keeps the frames of each id in log order
+        ids = np.concatenate(ids)
+        order = np.argsort(ids, kind="stable")
+        unique_ids, counts = np.unique(ids, return_counts=True)
+        pointers = np.concatenate(([0], np.cumsum(counts)))
+
+        lengths = np.concatenate(lengths)
+        length_dtype = cls.length_dtype(int(lengths.max()) if lengths.size else 0)
+        return cls(unique_ids, pointers, np.concatenate(offsets)[order].astype(offset_dtype), \
+            lengths[order].astype(length_dtype))
+
+    @staticmethod
+    def offset_dtype(size):
+        """ Returns the smallest type holding every byte offset in a log of a size [bytes]. """
+        return np.uint32 if size <= np.iinfo(np.uint32).max else np.int64
+
+    @staticmethod
+    def length_dtype(max_length):
+        """ Returns the smallest type holding line lengths up to max_length [bytes]. """
+        return np.uint16 if max_length <= np.iinfo(np.uint16).max else np.uint32
+
+    def count(self, frame_id):
+        """ Returns the number of frames with the key of an id, see can_log.id_keys(). """
+        i = np.searchsorted(self.ids, frame_id)
+        if i < self.ids.size and self.ids[i] == frame_id:
+            return int(self.pointers[i + 1] - self.pointers[i])
+
+        return 0
+
+    def lines(self, frame_ids, start=0, end=None):
+        """ Returns the lines of the frames with any of the ids which start within [start, end).
+
+        frame_ids: Iterable of the keys of arbitration ids, see can_log.id_keys()
+        start: Offset of the start of the range [bytes]
+        end: Offset of the end of the range, None for the end of the log [bytes]
+        returns: Tuple of arrays of the offset and length of each line, in log order
+        """
+        offsets = []
+        lengths = []
+        for frame_id in set(frame_ids):
+            i = np.searchsorted(self.ids, frame_id)
+            if i >= self.ids.size or self.ids[i] != frame_id:
+                continue
+
+            # The lines of each id are in log order, so the range is a single slice
+            id_offsets = self.offsets[self.pointers[i]:self.pointers[i + 1]]
+            first = self.pointers[i] + np.searchsorted(id_offsets, start)
+            last = self.pointers[i] + (id_offsets.size if end is None else \
+                np.searchsorted(id_offsets, end))
+            offsets.append(self.offsets[first:last])
+            lengths.append(self.lengths[first:last])
+
+        if not offsets:
+            return np.empty(0, np.int64), np.empty(0, np.int64)
+
+        # The stored offsets and lengths are widened, so lines can be located without overflowing
+        offsets = np.concatenate(offsets).astype(np.int64)
+        order = np.argsort(offsets, kind="stable")
+        return offsets[order], np.concatenate(lengths)[order].astype(np.int64)
+
+    def iter_frames(self, log, frame_ids, start=0, end=None, batch_size=INDEX_READ_FRAMES):
+        """ Yields batches of the frames with any of the ids, in log order, reading only their
+        lines from the log.
+
+        log: log_file.LogFile of the candump log the index was built for
+        frame_ids: Iterable of the keys of arbitration ids, see can_log.id_keys()
+        start: Offset of the start of the range of the log to read from [bytes]
+        end: Offset of the end of the range, None for the end of the log [bytes]
+        batch_size: Maximum number of frames in each batch
+        """
+        offsets, lengths = self.lines(frame_ids, start, end)
+        if not offsets.size:
+            return
+
+        buf = np.frombuffer(log.view(), np.uint8)
+        for i in range(0, offsets.size, batch_size):
+            batch_offsets = offsets[i:i + batch_size]
+            batch_lengths = lengths[i:i + batch_size]
+
+            # The lines are gathered into a single block, each followed by a newline
+            sizes = batch_lengths + 1
+            line_starts = np.cumsum(sizes) - sizes
+            positions = np.repeat(batch_offsets - line_starts, sizes) + np.arange(sizes.sum())
+            block = buf[np.minimum(positions, buf.size - 1)]
+            block[line_starts + batch_lengths] = ord("\n")
+
+            yield can_log.parse_candump(memoryview(block))
+
+def read_indexed_frames(log, frame_ids, start_time=None, end_time=None, cache_dir=None):
+    """ Yields batches of the frames with any of the ids in a time window of a candump log.
+
+    Only the lines of those frames are read using the id index of the log, and the time index
+    limits them to the part of the log holding the window. Both are built on the first use and
+    then cached.
+
+    log: log_file.LogFile of the candump log
+    frame_ids: Iterable of the keys of arbitration ids, see can_log.id_keys()
+    start_time: Start of the window, None for the start of the log [s]
+    end_time: End of the window, None for the end of the log [s]
+    cache_dir: Directory the cache is stored in, defaults to cache.get_cache_dir()
+    """
+    start, end = 0, None
+    if start_time is not None or end_time is not None:
+        start, end = load_time_index(log, cache_dir).byte_range(start_time, end_time)
+
+    for frames in load_id_index(log, cache_dir).iter_frames(log, frame_ids, start, end):
+        # The byte range can hold frames just outside of the window
+        in_window = np.ones(len(frames), bool)
+        if start_time is not None:
+            in_window &= frames.timestamps >= start_time
+        if end_time is not None:
+            in_window &= frames.timestamps <= end_time
+
+        if in_window.all():
+            yield frames
+        elif in_window.any():
+            yield frames.select(in_window)
+
+def load_time_index(log, cache_dir=None):
+    """ Loads the time index of a log, building it and storing it in the cache when it has not been
+    built before.
+
+    log: log_file.LogFile of the candump log
+    cache_dir: Directory the cache is stored in, defaults to cache.get_cache_dir()
+    returns: TimeIndex
+    """
+    cache_filename = cache.time_index_filename(log.filename, cache_dir)
+    entries = cache.read_log_index(cache_filename)
+    if entries is not None:
+        return TimeIndex(entries[0], entries[1], len(log))
+
+    index = TimeIndex.build(log)
+    cache.write_log_index(cache_filename, (index.offsets, index.timestamps))
+    return index
+
+def load_id_index(log, cache_dir=None):
+    """ Loads the id index of a log, building it and storing it in the cache when it has not been
+    built before.
+
+    log: log_file.LogFile of the candump log
+    cache_dir: Directory the cache is stored in, defaults to cache.get_cache_dir()
+    returns: IdIndex
+    """
+    cache_filename = cache.id_index_filename(log.filename, cache_dir)
+    entries = cache.read_log_index(cache_filename)
+    if entries is not None:
+        return IdIndex(*entries)
+
+    index = IdIndex.build(log)
+    cache.write_log_index(cache_filename, (index.ids, index.pointers, index.offsets, \
+        index.lengths))
+    return index
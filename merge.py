@@ -0,0 +1,215 @@
+import numpy as np
+import os
+
+from data_log import resample_times
+
+# Frequency the channels used to line up two logs are sampled at, which sets the resolution of
+# the estimated offset before it is refined between samples [Hz]
+ALIGN_FREQUENCY = 50.0
+
+# Minimum fraction of the shorter channel that must overlap the other channel for an offset to be
+# considered, so a few samples lining up at the very ends of the logs can not be chosen
+MIN_ALIGN_OVERLAP = 0.5
+
+# Types of logs that can be merged
+SOURCE_TYPES = ("CAN", "CSV", "ACCESSPORT")
+
+# Options which can follow the path of a source, e.g. 'CSV:gps.csv,prefix=GPS_,offset=1.5'
+SOURCE_OPTIONS = ("prefix", "offset", "align", "dbc", "format")
+
+class LogSource(object):
+    """ Log from another logger recording the same session, which is merged into the main log. """
+    def __init__(self, filename, log_type, prefix=None, offset=None, align_channel=None, \
+        dbc_filename=None, can_format=None):
+        """ filename: Path to the log file
+            log_type: One of SOURCE_TYPES
+            prefix: Prefix added to channels whose names are already in the log, defaults to the
+                name of the log file followed by '_'
+            offset: Time added to the timestamps of the log, None to estimate it from the align
+                channel [s]
+            align_channel: Name of the channel in this log used to estimate the offset, defaults
+                to the align channel of the main log
+            dbc_filename: Path to the DBC file for CAN logs, defaults to the DBC file of the main
+                log
+            can_format: Format of a CAN log, detected from the file extension if not provided
+        """
+        self.filename = filename
+        self.log_type = log_type
+        self.prefix = prefix
+        self.offset = offset
+        self.align_channel = align_channel
+        self.dbc_filename = dbc_filename
+        self.can_format = can_format
+
+        if self.prefix is None:
+            self.prefix = os.path.splitext(os.path.basename(filename))[0] + "_"
+
+    @classmethod
+    def parse(cls, source):
+        """ Parses a source in the form TYPE:PATH, optionally followed by any of the
+        SOURCE_OPTIONS as ',option=value', e.g. 'ACCESSPORT:ap.csv,prefix=AP_,align=RPM'.
+
+        raises: ValueError if the source is not valid
+        """
+        log_type, _, path = source.partition(":")
+        if log_type not in SOURCE_TYPES or not path:
+            raise ValueError("Invalid merge source '%s', must be in the form TYPE:PATH with a " \
+                "type of %s" % (source, ", ".join(SOURCE_TYPES)))
+
+        # Options are taken from the end, so a path containing commas is left intact
+        options = {}
+        parts = path.split(",")
+        while len(parts) > 1:
+            option, equals, value = parts[-1].partition("=")
+            if not equals or option.strip() not in SOURCE_OPTIONS:
+                break
+            options[option.strip()] = value
+            parts.pop()
+        filename = os.path.expanduser(",".join(parts))
+
+        offset = None
+        if "offset" in options:
+            try:
+                offset = float(options["offset"])
+            except ValueError:
+                raise ValueError("Invalid offset '%s' for merge source %s" % \
+                    (options["offset"], filename))
+
+        dbc_filename = os.path.expanduser(options["dbc"]) if "dbc" in options else None
+        return cls(filename, log_type, options.get("prefix"), offset, options.get("align"), \
+            dbc_filename, options.get("format"))
+
+    def __str__(self):
+        return "%s:%s" % (self.log_type, self.filename)
+
+def estimate_offset(reference, channel, frequency=ALIGN_FREQUENCY):
+    """ Estimates the time offset between two channels recording the same quantity, e.g. the
+    engine RPM logged by two loggers, by cross correlating them.
+
+    Both channels are interpolated at a fixed frequency from their own start time, so logs with
+    unrelated clocks (e.g. a CSV log starting at zero) can be lined up. The correlation is computed
+    for every offset at once with FFTs, and the offset with the highest correlation coefficient is
+    refined between samples with a parabola fitted around the peak.
+
+    reference: data_log.Channel the other channel is lined up with
+    channel: data_log.Channel to line up
+    frequency: Frequency the channels are sampled at for the correlation [Hz]
+    returns: Time to add to the timestamps of channel to line it up with reference [s]
+    raises: ValueError if either channel is constant, or they do not overlap enough to be lined up
+    """
+    reference_samples = _align_samples(reference, frequency)
+    channel_samples = _align_samples(channel, frequency)
+
+    # Correlate through the FFT, zero padded so the correlation is not circular. Offsets run from
+    # the channel ending at the first reference sample to starting at the last.
+    num_reference = reference_samples.size
+    num_channel = channel_samples.size
+    fft_size = 1 << (num_reference + num_channel - 2).bit_length()
+    correlation = np.fft.irfft(np.fft.rfft(reference_samples, fft_size) * \
+        np.conj(np.fft.rfft(channel_samples, fft_size)), fft_size)
+    correlation = np.concatenate((correlation[fft_size - num_channel + 1:], \
+        correlation[:num_reference]))
+    lags = np.arange(-(num_channel - 1), num_reference)
+
+    # The correlation coefficient over the overlapping samples of each offset, using the mean and
+    # variance of just those samples, so a short channel is matched by shape rather than being
+    # drawn to where the longer channel has its largest values. Offsets where the channels barely
+    # overlap are ignored.
+    first = np.maximum(0, -lags)
+    last = np.minimum(num_channel, num_reference - lags)
+    overlap = last - first
+    min_overlap = max(int(MIN_ALIGN_OVERLAP * min(num_reference, num_channel)), 2)
+    valid = overlap >= min_overlap
+
+    reference_sum, reference_squares = _overlap_sums(reference_samples, first + lags, last + lags)
+    channel_sum, channel_squares = _overlap_sums(channel_samples, first, last)
+    overlap = np.maximum(overlap, 1)
+    covariance = correlation - reference_sum * channel_sum / overlap
+    variance = (reference_squares - reference_sum ** 2 / overlap) * \
+        (channel_squares - channel_sum ** 2 / overlap)
+    valid &= variance > 0
+
+    scores = np.full(lags.size, -np.inf)
+    scores[valid] = covariance[valid] / np.sqrt(variance[valid])
+
+    best = int(np.argmax(scores))
+    if not np.isfinite(scores[best]):
+        raise ValueError("Channels %s and %s do not overlap enough to be lined up" % \
+            (reference.name, channel.name))
+
+    lag = float(lags[best])
+    if 0 < best < scores.size - 1 and np.isfinite(scores[best - 1]) and \
+        np.isfinite(scores[best + 1]):
+        before, peak, after = scores[best - 1:best + 2]
+        curvature = before - 2 * peak + after
+        if curvature < 0:
+            lag += 0.5 * (before - after) / curvature
+
+    return reference.start() - channel.start() + lag / frequency
+
+def merge_sources(data_log, sources, source_logs, align_channel=None, \
+    align_frequency=ALIGN_FREQUENCY):
+    """ Merges the logs of other loggers into a data log, lining up each of them in time.
+
+    Sources without an offset have it estimated by cross correlating their align channel with the
+    align channel of the data log, see estimate_offset(). Channels whose names are already in the
+    log are renamed with the prefix of their source.
+
+    data_log: data_log.DataLog to merge the sources into
+    sources: List of LogSource for each log
+    source_logs: List of the data_log.DataLog loaded from each source
+    align_channel: Name of the channel in data_log used to estimate offsets
+    align_frequency: Frequency the align channels are sampled at [Hz]
+    returns: List of (offset, renamed) tuples for each source, with the offset applied [s] and a
+        dict mapping the original names of renamed channels to their new name
+    raises: ValueError if an offset can not be estimated or channel names still collide
+    """
+    # Offsets are estimated against the data log before anything is merged into it
+    offsets = []
+    for source, source_log in zip(sources, source_logs):
+        if source.offset is not None:
+            offsets.append(source.offset)
+            continue
+
+        if not align_channel:
+            raise ValueError("An align channel or offset is required to merge %s" % source)
+
+        source_align_channel = source.align_channel or align_channel
+        if align_channel not in data_log.channels:
+            raise ValueError("Align channel %s is not in the log" % align_channel)
+        if source_align_channel not in source_log.channels:
+            raise ValueError("Align channel %s is not in %s" % (source_align_channel, source))
+
+        offsets.append(estimate_offset(data_log.channels[align_channel], \
+            source_log.channels[source_align_channel], align_frequency))
+
+    merged = []
+    for source, source_log, offset in zip(sources, source_logs, offsets):
+        merged.append((offset, data_log.merge(source_log, offset, source.prefix)))
+
+    return merged
+
+def _overlap_sums(samples, first, last):
+    """ Returns the sums of the samples and of their squares over each range [first, last). """
+    sums = np.concatenate(([0.0], np.cumsum(samples)))
+    squares = np.concatenate(([0.0], np.cumsum(samples ** 2)))
+    return sums[last] - sums[first], squares[last] - squares[first]
+
+def _align_samples(channel, frequency):
+    """ Returns a channel interpolated at a fixed frequency, normalized to zero mean and unit
+    variance.
+
+    raises: ValueError if the channel does not have enough samples or is constant
+    """
+    times = resample_times(channel.start(), channel.end(), frequency)
+    if times.size < 2:
+        raise ValueError("Channel %s is too short to line up" % channel.name)
+
+    # Interpolating rather than holding the latest value keeps channels logged at different rates
+    # from appearing delayed by a fraction of their sample period
+    samples = np.interp(times, channel.timestamps, channel.values)
+    deviation = samples.std()
+    if not deviation > 0:
+        raise ValueError("Channel %s is constant, so it can not be lined up" % channel.name)
+
+    return (samples - samples.mean()) / deviation
@@ -1,3 +1,4 @@
+import concurrent.futures
 import datetime
 import numpy as np
 import struct
@@ -57,51 +58,12 @@ class MotecLog(object):
     def add_channel(self, log_channel):
         """ Adds a single channel of data to the motec log.
 
+        The file pointers of the channel are not determined until the log is written, see
+        plan_layout().
+
         log_channel: data_log.Channel
         """
-        # Advance the header data pointer
-        self.ld_header.data_ptr += self.CHANNEL_HEADER_SIZE
-
-        # Advance the data pointers of all previous channels
-        for ld_channel in self.ld_channels:
-            ld_channel.data_ptr += self.CHANNEL_HEADER_SIZE
-
-        # Determine our file pointers
-        if self.ld_channels:
-            meta_ptr = self.ld_channels[-1].next_meta_ptr
-            prev_meta_ptr = self.ld_channels[-1].meta_ptr
-            data_ptr = self.ld_channels[-1].data_ptr + self.ld_channels[-1]._data.nbytes
-        else:
-            # First channel needs the previous pointer zero'd out
-            meta_ptr = self.HEADER_PTR
-            prev_meta_ptr = 0
-            data_ptr = self.ld_header.data_ptr
-        next_meta_ptr = meta_ptr + self.CHANNEL_HEADER_SIZE
-
-        # Channel specs
-        data_len = len(log_channel.messages)
-        data_type = np.float32 if log_channel.data_type is float else np.int32
-        freq = int(log_channel.avg_frequency())
-        shift = 0
-        multiplier = 1
-        scale = 1
-
-        # Decimal places must be hard coded to zero, the ldparser library doesn't properly
-        # handle non zero values, consequently all channels will have zero decimal places
-        # decimals = log_channel.decimals
-        decimals = 0
-
-        ld_channel = ldChan(None, meta_ptr, prev_meta_ptr, next_meta_ptr, data_ptr, data_len, \
-            data_type, freq, shift, multiplier, scale, decimals, log_channel.name, "", \
-            log_channel.units)
-
-        # Add in the channel data
-        ld_channel._data = np.array([], data_type)
-        for msg in log_channel.messages:
-            ld_channel._data = np.append(ld_channel._data, data_type(msg.value))
-
-        # Add the ld channel and advance the file pointers
-        self.ld_channels.append(ld_channel)
+        self.ld_channels.append(self.__create_ld_channel(log_channel))
 
     def add_all_channels(self, data_log):
         """ Adds all channels from a DataLog to the motec log.
@@ -111,17 +73,149 @@ class MotecLog(object):
         for channel_name, channel in data_log.channels.items():
             self.add_channel(channel)
 
+    def plan_layout(self):
+        """ Computes the file pointers of the header and all channels in a single pass.
+
+        The channel headers are stored back to back starting at HEADER_PTR, forming a linked list,
+        and are followed by the data of each channel in the same order.
+        """
+        num_channels = len(self.ld_channels)
+        self.ld_header.meta_ptr = self.HEADER_PTR
+        self.ld_header.data_ptr = self.HEADER_PTR + num_channels * self.CHANNEL_HEADER_SIZE
+
+        data_ptr = self.ld_header.data_ptr
+        for i, ld_channel in enumerate(self.ld_channels):
+            ld_channel.meta_ptr = self.HEADER_PTR + i * self.CHANNEL_HEADER_SIZE
+            ld_channel.data_ptr = data_ptr
+
+            # The first and last channels need their previous and next pointers zero'd out
+            if i > 0:
+                ld_channel.prev_meta_ptr = ld_channel.meta_ptr - self.CHANNEL_HEADER_SIZE
+            else:
+                ld_channel.prev_meta_ptr = 0
+            if i < num_channels - 1:
+                ld_channel.next_meta_ptr = ld_channel.meta_ptr + self.CHANNEL_HEADER_SIZE
+            else:
+                ld_channel.next_meta_ptr = 0
+
+            data_ptr += ld_channel._data.nbytes
+
     def write(self, filename):
         """ Writes the motec log data to disc. """
+        self.plan_layout()
+
         # Check for the presence of any channels, since the ldData write() method doesn't
         # gracefully handle zero channels
         if self.ld_channels:
             ld_data = ldData(self.ld_header, self.ld_channels)
-
-            # Need to zero out the final channel pointer
-            ld_data.channs[-1].next_meta_ptr = 0
-
             ld_data.write(filename)
         else:
             with open(filename, "wb") as f:
                 self.ld_header.write(f, 0)
+
+    def write_streaming(self, filename, log_channels, num_channels):
+        """ Writes the motec log to disc one channel at a time.
+
+        The header and channel meta data regions are reserved first, then the data of each channel
+        is converted and written as soon as the channel is produced. Only the pointers in the
+        header and the final channel are patched afterwards. Writing a channel to disc overlaps
+        with producing the next one, so at most two channels of data are held at once.
+
+        Any channels added with add_channel() are ignored.
+
+        log_channels: Iterable of data_log.Channel, can be a generator producing channels lazily
+        num_channels: Maximum number of channels that log_channels will produce
+        """
+        self.ld_channels = []
+        self.ld_header.meta_ptr = self.HEADER_PTR
+        self.ld_header.data_ptr = self.HEADER_PTR + num_channels * self.CHANNEL_HEADER_SIZE
+
+        with open(filename, "wb") as f:
+            self.ld_header.write(f, num_channels)
+
+            data_ptr = self.ld_header.data_ptr
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                pending_write = None
+                for i, log_channel in enumerate(log_channels):
+                    if i >= num_channels:
+                        raise ValueError("More than the %d reserved channels were provided" % \
+                            num_channels)
+
+                    ld_channel = self.__create_ld_channel(log_channel)
+                    ld_channel.meta_ptr = self.HEADER_PTR + i * self.CHANNEL_HEADER_SIZE
+                    ld_channel.prev_meta_ptr = self.ld_channels[-1].meta_ptr if i > 0 else 0
+                    ld_channel.next_meta_ptr = ld_channel.meta_ptr + self.CHANNEL_HEADER_SIZE
+                    ld_channel.data_ptr = data_ptr
+                    data_ptr += ld_channel._data.nbytes
+
+                    # Only allow a single channel to be queued for writing at a time
+                    if pending_write:
+                        pending_write.result()
+                    pending_write = executor.submit(self.__write_ld_channel, f, ld_channel, i)
+
+                    self.ld_channels.append(ld_channel)
+
+                if pending_write:
+                    pending_write.result()
+
+            # Need to zero out the final channel pointer
+            if self.ld_channels:
+                self.ld_channels[-1].next_meta_ptr = 0
+                self.ld_channels[-1].write(f, len(self.ld_channels) - 1)
+            else:
+                self.ld_header.data_ptr = self.HEADER_PTR
+
+            # Patch the header when fewer channels were produced than were reserved
+            if len(self.ld_channels) != num_channels:
+                f.seek(0)
+                self.ld_header.write(f, len(self.ld_channels))
+
+    @staticmethod
+    def __write_ld_channel(f, ld_channel, index):
+        """ Writes the data and meta data for a single channel, then releases its data. """
+        f.seek(ld_channel.data_ptr)
+        f.write(np.ascontiguousarray(ld_channel._data))
+        ld_channel.write(f, index)
+        ld_channel._data = None
+
+    def __create_ld_channel(self, log_channel):
+        """ Creates an ldChan populated with the data from a channel, without any file pointers.
+
+        log_channel: data_log.Channel
+        """
+        ld_channel = self.create_ld_channel(log_channel.name, log_channel.units, \
+            log_channel.data_type, int(log_channel.avg_frequency()), len(log_channel))
+
+        # Convert the channel data in a single step. When the channel values are already stored
+        # with the data type needed by the log they are handed over directly without a copy.
+        ld_channel._data = np.asarray(log_channel.values, dtype=ld_channel.dtype)
+
+        return ld_channel
+
+    @staticmethod
+    def create_ld_channel(name, units, data_type, freq, data_len):
+        """ Creates an ldChan with the given specs, without any data or file pointers.
+
+        Channel data is stored without any conversion, so the samples of the channel can be written
+        directly to the file as an array of the channel's dtype.
+
+        name: Channel name
+        units: Channel units
+        data_type: Python type of the channel data, float or int
+        freq: Frequency of the channel data [Hz]
+        data_len: Number of samples in the channel
+        """
+        # Channel specs
+        data_type = np.float32 if data_type is float else np.int32
+        shift = 0
+        multiplier = 1
+        scale = 1
+
+        # Decimal places must be hard coded to zero, the ldparser library doesn't properly
+        # handle non zero values, consequently all channels will have zero decimal places
+        # decimals = log_channel.decimals
+        decimals = 0
+
+        # File pointers are filled in once the file layout is known
+        return ldChan(None, 0, 0, 0, 0, data_len, data_type, freq, shift, multiplier, scale, \
+            decimals, name, "", units)
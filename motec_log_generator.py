@@ -1,19 +1,33 @@
 #!/usr/bin/env python3
 
 import argparse
-import cantools
+import cache
+import can_readers
+import channel_filter
+import concurrent.futures
+import csv
+import glob
+import log_index
+import merge
 import os
+import re
+import sessions
+import sys
+import time
 
 from data_log import DataLog
+from live_log import FollowLog, LiveLog
+from log_file import LogFile
 from motec_log import MotecLog
 
 DESCRIPTION = """Generates MoTeC .ld files from external log files generated by: CAN bus dumps, CSV
  files, or COBB Accessport CSV files"""
 
-EPILOG = """The CAN bus log must be the same format as what is generated by 'candump' with the '-l'
-option from the linux package can-utils. A MoTeC channel will be created for every signal in the
-DBC file that has messages in the CAN log. The signal name and units will be directly copied from
-the DBC file.
+EPILOG = """The CAN bus log can be the format generated by 'candump' with the '-l' option from the
+linux package can-utils, a Vector BLF (.blf) or ASC (.asc) log, or a pcap/pcapng capture of a
+SocketCAN interface (.pcap, .pcapng). BLF and ASC logs require python-can. A MoTeC channel will be
+created for every signal in the DBC file that has messages in the CAN log. The signal name and
+units will be directly copied from the DBC file.
 
 CSV files must have time as their first column. A MoTeC channel will be generated for all remaining
 columns. All channels will not have any units assigned.
@@ -21,19 +35,540 @@ columns. All channels will not have any units assigned.
 COBB Accessport CSV logs are simply generated by starting a logging session on the accessport. A
 MoTeC channel will be created for every channel logged, the name and units will be directly copied
 over.
+
+When 'log' is a directory or a glob pattern every matching log is converted in batch mode, with up
+to JOBS logs converted at once. Directories are searched for files with any of the CAN log
+extensions for CAN logs, and a .csv extension for CSV and Accessport logs. Metadata for individual
+logs can be given in a MANIFEST CSV file, which has a 'log' column with the log filename followed
+by columns for any of the metadata fields (e.g. driver, venue_name, event_session). The filename
+can include the directories of the log (e.g. day1/run.log) to tell apart logs with the same name.
+Values in the manifest take precedence over the metadata arguments.
 """
 
+# Metadata fields of the MoTeC log and their types
+METADATA_FIELDS = {
+    "driver": str,
+    "vehicle_id": str,
+    "vehicle_weight": int,
+    "vehicle_type": str,
+    "vehicle_comment": str,
+    "venue_name": str,
+    "event_name": str,
+    "event_session": str,
+    "long_comment": str,
+    "short_comment": str,
+}
+
+# File extensions of the logs to convert when searching a directory in batch mode
+LOG_EXTENSIONS = {
+    "CAN": sorted(can_readers.EXTENSIONS.keys()),
+    "CSV": [".csv"],
+    "ACCESSPORT": [".csv"],
+}
+
+def load_data_log(log_filename, log_type, decode_plan=None, can_format=None, \
+    selected_channels=None, time_window=None):
+    """ Creates a data log from a log file.
+
+    log_filename: Path to the log file
+    log_type: One of CAN, CSV, or ACCESSPORT
+    decode_plan: can_decode.DecodePlan for the database, required when the log type is CAN. Only
+        the signals in the plan are decoded, see can_decode.DecodePlan.select().
+    can_format: Format of a CAN log, detected from the file extension if not provided
+    selected_channels: Optional channel_filter.ChannelFilter selecting the columns of CSV and
+        Accessport logs to load
+    time_window: Optional tuple of the start and end of the data to load, relative to the start
+        of the log, either can be None [s]. See find_time_window().
+    """
+    data_log = DataLog()
+
+    if log_type == "CAN":
+        can_format = can_format or can_readers.detect_format(log_filename)
+
+    # Candump logs are parsed directly from the memory mapped log, so only the part of the log
+    # holding the time window is parsed
+    if log_type == "CAN" and can_format == "candump":
+        start, end, window = 0, None, None
+        if time_window:
+            start, end, window = find_time_window(log_filename, time_window)
+
+        with LogFile(log_filename) as log:
+            data_log.append_can_chunks(log.chunks(start, end), decode_plan)
+
+        if window:
+            data_log.slice(*window)
+        return data_log
+
+    # Other CAN logs are read in batches of frames by the reader for their format, which drops
+    # frames the plan does not decode as early as it can
+    if log_type == "CAN":
+        data_log.from_can_frames(can_readers.read_can_frames(log_filename, can_format, \
+            decode_plan.frame_ids), decode_plan)
+        if time_window:
+            slice_data_log(data_log, time_window)
+        return data_log
+
+    # The log is memory mapped and parsed in chunks directly from the mapping, rather than being
+    # read into memory up front
+    with LogFile(log_filename) as log:
+        if log_type == "CSV":
+            data_log.from_csv_log(log, selected_channels)
+        elif log_type == "ACCESSPORT":
+            data_log.from_accessport_log(log, selected_channels)
+
+    if time_window:
+        slice_data_log(data_log, time_window)
+    return data_log
+
+def find_time_window(log_filename, time_window):
+    """ Finds the part of a candump log holding a time window, using the time index of the log.
+
+    The index is built on the first use and then cached, see log_index.load_time_index().
+
+    log_filename: Path to the candump log
+    time_window: Tuple of the start and end of the window, relative to the first frame in the log,
+        either can be None [s]
+    returns: Tuple of the start and end offsets of the lines to parse [bytes], and a tuple of the
+        start and end of the window in the timestamps of the log [s]
+    """
+    with LogFile(log_filename) as log:
+        index = log_index.load_time_index(log)
+
+    log_start = index.start_time() or 0.0
+    window = tuple(None if time is None else log_start + time for time in time_window)
+    return index.byte_range(*window) + (window,)
+
+def slice_data_log(data_log, time_window, log_filename=None, can_format=None):
+    """ Removes all messages outside of a time window from a data log loaded from an entire log.
+
+    The window is relative to the first frame of candump logs, the same as find_time_window(), and
+    to the first message in the data log for all other logs.
+
+    data_log: DataLog to slice
+    time_window: Tuple of the start and end of the window, either can be None [s]
+    log_filename: Path to the log the data log was loaded from, required for candump logs
+    can_format: Format of a CAN log the data log was loaded from
+    """
+    if can_format == "candump":
+        window = find_time_window(log_filename, time_window)[2]
+    else:
+        log_start = data_log.start()
+        window = tuple(None if time is None else log_start + time for time in time_window)
+
+    data_log.slice(*window)
+
+def load_selected_decode_plan(dbc_filename, selected_channels):
+    """ Loads the decode plan for a DBC file, limited to the selected channels.
+
+    dbc_filename: Path to the DBC file
+    selected_channels: channel_filter.ChannelFilter
+    raises: ValueError if none of the signals in the DBC file are selected
+    """
+    decode_plan = cache.load_decode_plan(dbc_filename).select(selected_channels)
+    if not decode_plan.messages:
+        raise ValueError("None of the signals in %s match the selected channels" % dbc_filename)
+
+    return decode_plan
+
+def save_motec_log(data_log, ld_filename, metadata, frequency, channel_frequencies):
+    """ Resamples a data log and saves it as a MoTeC log.
+
+    data_log: DataLog to save
+    ld_filename: Path of the .ld file to create
+    metadata: Dict mapping metadata field names to their values
+    frequency: Frequency to resample all channels at
+    channel_frequencies: Dict mapping channel names to the frequency to resample them at instead
+    """
+    motec_log = MotecLog()
+    for field, value in metadata.items():
+        setattr(motec_log, field, value)
+
+    motec_log.initialize()
+
+    output_dir = os.path.dirname(ld_filename)
+    if output_dir and not os.path.isdir(output_dir):
+        print("Directory '%s' does not exist, will create it" % output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Resample all the channels to occur at a fixed frequency. We must do this because the data in
+    # motec log expects a constant sample rate, it does not associate a timestamp to each individual
+    # message in a channel. Individual channels can be given their own frequency so slow channels
+    # are not padded up to the global frequency.
+    #
+    # Channels are resampled one at a time while the log is being saved, so only a couple of
+    # resampled channels are ever held in memory.
+    resampled_channels = data_log.iter_resampled(frequency, channel_frequencies)
+    motec_log.write_streaming(ld_filename, resampled_channels, len(data_log.channels))
+
+def split_sessions(data_log, ld_filename, metadata, session_split):
+    """ Splits a data log into its sessions, each of which is saved as its own MoTeC log.
+
+    The sessions are windows of the decoded log, so the log is only read and decoded once no
+    matter how many sessions it holds.
+
+    data_log: DataLog to split
+    ld_filename: Path of the .ld file for the entire log, the number of each session is added to
+        the name
+    metadata: Dict mapping metadata field names to their values, the event session is numbered for
+        each session
+    session_split: Tuple of the minimum gap, sessions.SessionCondition, and minimum duration of the
+        condition used to find breaks between sessions, see sessions.find_sessions()
+    returns: List of (data_log, ld_filename, metadata) tuples for each session
+    raises: ValueError if no sessions are found, so nothing would be saved
+    """
+    name, extension = os.path.splitext(ld_filename)
+    event_session = metadata.get("event_session") or "Session"
+
+    found = sessions.find_sessions(data_log, *session_split)
+    if not found:
+        raise ValueError("No sessions of at least %.1fs found in the log" % \
+            sessions.MIN_SESSION_DURATION)
+
+    split = []
+    for i, (start, end) in enumerate(found, 1):
+        split.append((data_log.window(start, end), "%s_%d%s" % (name, i, extension), \
+            dict(metadata, event_session="%s %d" % (event_session, i))))
+
+    return split
+
+def load_merge_sources(sources, selected_channels, jobs=1):
+    """ Loads the logs of the sources to merge into the main log, concurrently when there are
+    several of them.
+
+    sources: List of merge.LogSource, CAN sources must have a DBC file
+    selected_channels: channel_filter.ChannelFilter selecting the channels to load
+    jobs: Maximum number of processes to load the logs with
+    returns: List of the DataLog loaded from each source
+    raises: ValueError if none of the signals in the DBC file of a CAN source are selected
+    """
+    if jobs == 1 or len(sources) == 1:
+        return [_load_merge_source(source, selected_channels) for source in sources]
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(jobs, len(sources))) as executor:
+        return list(executor.map(_load_merge_source, sources, \
+            [selected_channels] * len(sources)))
+
+def _load_merge_source(source, selected_channels):
+    """ Loads the log of a single source to merge, see load_merge_sources(). """
+    decode_plan = None
+    if source.log_type == "CAN":
+        decode_plan = load_selected_decode_plan(source.dbc_filename, selected_channels)
+
+    return load_data_log(source.filename, source.log_type, decode_plan, source.can_format, \
+        selected_channels)
+
+def read_cached_data_log(cache_filename):
+    """ Returns a data log with the decoded channels stored in the cache, or None when the log is
+    not in the cache.
+
+    cache_filename: Path of the cache entry, see cache.decoded_log_filename()
+    """
+    channels = cache.read_decoded_log(cache_filename)
+    if channels is None:
+        return None
+
+    data_log = DataLog()
+    for name, units, timestamps, values in channels:
+        data_log.add_channel(name, units, float, 3).set_data(timestamps, values)
+
+    return data_log
+
+def write_cached_data_log(cache_filename, data_log):
+    """ Stores the decoded channels of a data log in the cache, before they are resampled.
+
+    cache_filename: Path of the cache entry, see cache.decoded_log_filename()
+    """
+    cache.write_decoded_log(cache_filename, [(channel.name, channel.units, channel.timestamps, \
+        channel.values) for channel in data_log.channels.values()])
+
+def get_ld_filename(log_filename, output):
+    """ Returns the path of the .ld file to generate for a log.
+
+    log_filename: Path to the log file
+    output: Name of the output file, or the empty string to use the same path and name as the log
+    """
+    if output:
+        return os.path.splitext(output)[0] + ".ld"
+
+    # Copy the path and name from the source file, but change the extension
+    log_dir, log_name = os.path.split(log_filename)
+    log_name = os.path.splitext(log_name)[0]
+    return os.path.join(log_dir, log_name + ".ld")
+
+def find_logs(pattern, log_type):
+    """ Returns the sorted list of log files in a directory, or matching a glob pattern. """
+    if os.path.isdir(pattern):
+        filenames = []
+        for extension in LOG_EXTENSIONS[log_type]:
+            filenames += glob.glob(os.path.join(pattern, "*" + extension))
+    else:
+        filenames = glob.glob(pattern)
+
+    return sorted(filename for filename in set(filenames) if os.path.isfile(filename))
+
+def load_manifest(manifest_filename):
+    """ Loads the metadata for individual logs from a manifest file.
+
+    The manifest is a CSV file with a 'log' column holding the log filename, and a column for each
+    metadata field to set. Empty cells are ignored. The filename can include some of the
+    directories of the log to tell apart logs with the same name, see match_manifest().
+
+    returns: Dict mapping log filenames to a dict of metadata
+    """
+    manifest = {}
+    with open(manifest_filename, "r", newline="") as file:
+        reader = csv.DictReader(file)
+        if reader.fieldnames is None or "log" not in reader.fieldnames:
+            raise ValueError("Manifest %s does not have a 'log' column" % manifest_filename)
+
+        for field in reader.fieldnames:
+            if field != "log" and field not in METADATA_FIELDS:
+                raise ValueError("Manifest %s has unknown metadata field '%s'" % \
+                    (manifest_filename, field))
+
+        for row in reader:
+            metadata = {}
+            for field, value in row.items():
+                if field != "log" and value:
+                    metadata[field] = METADATA_FIELDS[field](value)
+            manifest[os.path.normpath(row["log"])] = metadata
+
+    return manifest
+
+def match_manifest(manifest, log_filenames):
+    """ Returns the metadata from a manifest for each log of a batch.
+
+    An entry matches a log when its filename is the end of the path of the log, so it can be just
+    the name of the log (e.g. 'run.log') or include its directories (e.g. 'day1/run.log'). Each log
+    uses the longest entry matching it.
+
+    manifest: Dict of the entries of a manifest, see load_manifest()
+    log_filenames: List of log files in the batch
+    returns: List of the metadata dict for each log, empty for logs not in the manifest
+    raises: ValueError if an entry is the best match for more than one log
+    """
+    entries = [(entry, entry.split(os.sep)) for entry in manifest]
+
+    matched = {}
+    log_metadata = []
+    for log_filename in log_filenames:
+        path = os.path.normpath(os.path.abspath(log_filename)).split(os.sep)
+        best = None
+        for entry, entry_path in entries:
+            if path[-len(entry_path):] == entry_path and \
+                (best is None or len(entry_path) > len(best.split(os.sep))):
+                best = entry
+
+        if best in matched:
+            raise ValueError("Manifest entry '%s' matches both %s and %s, include the directory " \
+                "of the log to tell them apart" % (best, matched[best], log_filename))
+        if best is not None:
+            matched[best] = log_filename
+        log_metadata.append(manifest.get(best, {}))
+
+    return log_metadata
+
+def get_batch_ld_filenames(log_filenames, output):
+    """ Returns the paths of the .ld files to generate for a batch of logs.
+
+    Without an output directory each .ld file is saved next to its log. With one, the directories
+    of the logs below the directory they all share are recreated in it, so logs with the same name
+    in different directories (e.g. day1/run.log and day2/run.log) are kept apart.
+
+    log_filenames: List of log files in the batch
+    output: Directory to save the .ld files in, or the empty string to save them next to the logs
+    raises: ValueError if two logs would be saved to the same .ld file, e.g. run.log and run.blf
+    """
+    if output:
+        log_paths = [os.path.abspath(log_filename) for log_filename in log_filenames]
+        log_root = os.path.commonpath([os.path.dirname(path) for path in log_paths])
+        ld_filenames = [get_ld_filename(os.path.join(output, os.path.relpath(path, log_root)), "") \
+            for path in log_paths]
+    else:
+        ld_filenames = [get_ld_filename(log_filename, "") for log_filename in log_filenames]
+
+    converted = {}
+    for log_filename, ld_filename in zip(log_filenames, ld_filenames):
+        key = os.path.normpath(os.path.abspath(ld_filename))
+        if key in converted:
+            raise ValueError("%s and %s would both be saved to %s" % (converted[key], \
+                log_filename, ld_filename))
+        converted[key] = log_filename
+
+    return ld_filenames
+
+# Settings shared by every log converted in a batch worker process
+_batch_settings = None
+
+def _init_batch_worker(log_type, decode_plan, can_format, frequency, channel_frequencies, \
+    dbc_hash, selected_channels, time_window, session_split):
+    """ Stores the settings for the batch in each worker process, so the decode plan is only
+    transferred to each process once.
+    """
+    global _batch_settings
+    _batch_settings = (log_type, decode_plan, can_format, frequency, channel_frequencies, \
+        dbc_hash, selected_channels, time_window, session_split)
+
+def _convert_batch_log(log_filename, ld_filename, metadata):
+    """ Converts a single log of a batch in a worker process.
+
+    returns: Tuple of the number of channels, log duration, and the conversion time [s]
+    """
+    log_type, decode_plan, can_format, frequency, channel_frequencies, dbc_hash, \
+        selected_channels, time_window, session_split = _batch_settings
+
+    start_time = time.perf_counter()
+
+    # Decoded CAN logs are cached, so converting a log again only needs to resample it. Only
+    # entire logs are cached, a time window is sliced from the cached log.
+    data_log = None
+    if dbc_hash:
+        can_format = can_format or can_readers.detect_format(log_filename)
+        cache_filename = cache.decoded_log_filename(log_filename, dbc_hash, can_format, \
+            selected_channels.key())
+        data_log = read_cached_data_log(cache_filename)
+        if data_log is not None and time_window:
+            slice_data_log(data_log, time_window, log_filename, can_format)
+
+    if data_log is None:
+        data_log = load_data_log(log_filename, log_type, decode_plan, can_format, \
+            selected_channels, time_window)
+        if dbc_hash and not time_window:
+            write_cached_data_log(cache_filename, data_log)
+
+    if not data_log.channels:
+        raise ValueError("Failed to find any channels in log data")
+
+    if session_split:
+        for session_log, session_ld_filename, session_metadata in split_sessions(data_log, \
+            ld_filename, metadata, session_split):
+            save_motec_log(session_log, session_ld_filename, session_metadata, frequency, \
+                channel_frequencies)
+    else:
+        save_motec_log(data_log, ld_filename, metadata, frequency, channel_frequencies)
+
+    return len(data_log.channels), data_log.duration(), time.perf_counter() - start_time
+
+def convert_batch(log_filenames, ld_filenames, metadata, log_type, decode_plan, can_format, \
+    frequency, channel_frequencies, jobs, dbc_hash=None, selected_channels=None, \
+    time_window=None, session_split=None):
+    """ Converts many logs concurrently with a pool of processes.
+
+    At most two logs per process are queued at once, so results are reported as they finish and the
+    pending work is bounded for large batches.
+
+    log_filenames: List of log files to convert
+    ld_filenames: List of .ld files to generate for each log
+    metadata: List of metadata dicts for each log
+    jobs: Number of processes to convert logs with
+    dbc_hash: Hash of the DBC file, enables caching the decoded CAN logs when provided
+    selected_channels: Optional channel_filter.ChannelFilter selecting the channels to load, the
+        decode plan must already be limited to the selected signals
+    time_window: Optional tuple of the start and end of the data to convert from each log,
+        relative to the start of the log, either can be None [s]
+    session_split: Optional tuple of the settings used to split each log into sessions, see
+        split_sessions()
+    returns: Dict mapping log filenames to either a (num_channels, duration, time) tuple or an
+        exception for logs that could not be converted
+    """
+    results = {}
+    work = iter(zip(log_filenames, ld_filenames, metadata))
+    pending = {}
+
+    settings = (log_type, decode_plan, can_format, frequency, channel_frequencies, dbc_hash, \
+        selected_channels or channel_filter.ChannelFilter(), time_window, session_split)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, \
+        initializer=_init_batch_worker, initargs=settings) as executor:
+        while True:
+            for log_filename, ld_filename, log_metadata in work:
+                future = executor.submit(_convert_batch_log, log_filename, ld_filename, \
+                    log_metadata)
+                pending[future] = log_filename
+                if len(pending) >= 2 * jobs:
+                    break
+
+            if not pending:
+                break
+
+            done, _ = concurrent.futures.wait(pending, \
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                log_filename = pending.pop(future)
+                try:
+                    results[log_filename] = future.result()
+                    print("Converted %s (%.2fs)" % (log_filename, results[log_filename][2]))
+                except Exception as e:
+                    results[log_filename] = e
+                    print("ERROR: Failed to convert %s: %s" % (log_filename, e))
+
+    return results
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description=DESCRIPTION, epilog=EPILOG)
-    parser.add_argument("log", type=str, help="Path to logfile")
+    parser.add_argument("log", type=str, \
+        help="Path to logfile, or a directory or glob pattern of logfiles to convert in batch mode")
     parser.add_argument("log_type", type=str, help="Type of log to process", \
         choices=["CAN", "CSV", "ACCESSPORT"])
 
     parser.add_argument("--output", type=str, \
-        help="Name of output file, defaults to the same filename as 'log'")
+        help="Name of output file, defaults to the same filename as 'log'. In batch mode this is " \
+        "the directory to write all the output files to, with the directories of the logs " \
+        "recreated below it.")
     parser.add_argument("--frequency", type=float, default=20.0, \
         help="Fixed frequency to resample all channels at")
+    parser.add_argument("--channel_frequency", type=str, action="append", default=[], \
+        metavar="NAME=FREQUENCY", \
+        help="Frequency to resample a single channel at instead of FREQUENCY, can be repeated")
     parser.add_argument("--dbc", type=str, help="Path to DBC file, required if log type CAN")
+    parser.add_argument("--can_format", type=str, choices=sorted(can_readers.READERS), \
+        help="Format of CAN logs, detected from the file extension by default (candump for " \
+        "unknown extensions)")
+    parser.add_argument("--jobs", type=int, default=1, \
+        help="Number of processes to decode CAN logs with, or to convert logs with in batch mode")
+    parser.add_argument("--manifest", type=str, \
+        help="CSV file with metadata for individual logs in batch mode")
+    parser.add_argument("--channels", type=str, action="append", default=[], metavar="PATTERN", \
+        help="Only convert channels matching a glob pattern, or a regular expression prefixed " \
+        "with 're:', can be repeated")
+    parser.add_argument("--exclude", type=str, action="append", default=[], metavar="PATTERN", \
+        help="Leave out channels matching a glob pattern, or a regular expression prefixed with " \
+        "'re:', can be repeated")
+    parser.add_argument("--channel_file", type=str, \
+        help="File with a channel pattern to convert on each line, or to leave out when " \
+        "prefixed with '!'")
+    parser.add_argument("--start", type=float, \
+        help="Only convert the data from this time onwards, relative to the start of the log [s]")
+    parser.add_argument("--end", type=float, \
+        help="Only convert the data up to this time, relative to the start of the log [s]")
+    parser.add_argument("--split_gap", type=float, \
+        help="Split the log into a .ld file for each session, starting a new session after a gap " \
+        "in the messages longer than this [s]")
+    parser.add_argument("--split_condition", type=str, metavar="CONDITION", \
+        help="Split the log into a .ld file for each session, with sessions separated by periods " \
+        "where a channel condition holds, e.g. 'SPEED<1'")
+    parser.add_argument("--split_duration", type=float, default=30.0, \
+        help="Minimum time the split condition must hold for to end a session [s]")
+    parser.add_argument("--merge", type=str, action="append", default=[], metavar="SOURCE", \
+        help="Merge a log from another logger recording the same session, in the form TYPE:PATH " \
+        "optionally followed by any of ',prefix=PREFIX', ',offset=SECONDS', ',align=CHANNEL', " \
+        "',dbc=DBC', and ',format=CAN_FORMAT', can be repeated")
+    parser.add_argument("--align_channel", type=str, metavar="CHANNEL", \
+        help="Channel used to line up merged logs without an offset, by cross correlating it " \
+        "with the same channel (or the 'align' channel) of each merged log, e.g. RPM")
+    parser.add_argument("--no_cache", action="store_true", \
+        help="Always decode CAN logs, rather than using decoded channels cached by a previous run")
+    parser.add_argument("--incremental", action="store_true", \
+        help="Only convert the lines added to a candump log since the last run, extending the " \
+        "existing output file")
+    parser.add_argument("--follow", action="store_true", \
+        help="Keep converting a candump log as it is recorded, periodically replacing the output " \
+        "file with a snapshot. Use '-' as the log to read from stdin.")
+    parser.add_argument("--interval", type=float, default=5.0, \
+        help="Time between snapshots when following a log [s]")
+    parser.add_argument("--window", type=float, default=1800.0, \
+        help="Duration of the most recent data kept in snapshots when following a log, 0 keeps " \
+        "all data [s]")
 
     parser.add_argument("--driver", type=str, default="", help="Motec log metadata field")
     parser.add_argument("--vehicle_id", type=str, default="", help="Motec log metadata field")
@@ -53,84 +588,360 @@ if __name__ == '__main__':
         args.dbc = os.path.expanduser(args.dbc)
     if args.output:
         args.output = os.path.expanduser(args.output)
+    if args.manifest:
+        args.manifest = os.path.expanduser(args.manifest)
+    if args.channel_file:
+        args.channel_file = os.path.expanduser(args.channel_file)
 
-    # Make sure our input files are valid
-    if not os.path.isfile(args.log):
-        print("ERROR: log file %s does not exist" % args.log)
-        exit(1)
+    # Anything other than a single file is converted in batch mode
+    read_stdin = args.follow and args.log == "-"
+    batch_mode = not read_stdin and not os.path.isfile(args.log)
+    if batch_mode:
+        log_filenames = find_logs(args.log, args.log_type)
+        if not log_filenames:
+            print("ERROR: log file %s does not exist" % args.log)
+            exit(1)
+
+    channel_frequencies = {}
+    for entry in args.channel_frequency:
+        name, _, frequency = entry.rpartition("=")
+        try:
+            channel_frequencies[name] = float(frequency)
+        except ValueError:
+            name = ""
+
+        if not name or channel_frequencies[name] <= 0:
+            print("ERROR: Invalid channel frequency '%s', must be NAME=FREQUENCY" % entry)
+            exit(1)
 
     if args.log_type == "CAN" and not os.path.isfile(args.dbc):
         print("ERROR: DBC file %s does not exist" % args.dbc)
         exit(1)
 
-    print("Loading log...")
-    with open(args.log, "r") as file:
-        lines = file.readlines()
+    if args.jobs < 1:
+        print("ERROR: Number of jobs must be at least 1")
+        exit(1)
 
-    # Create our data log from the input data
-    data_log = DataLog()
+    if args.manifest and not batch_mode:
+        print("ERROR: A manifest can only be used when converting a directory or glob of logs")
+        exit(1)
+
+    if args.manifest and not os.path.isfile(args.manifest):
+        print("ERROR: Manifest file %s does not exist" % args.manifest)
+        exit(1)
+
+    if args.incremental and (batch_mode or args.log_type != "CAN" or \
+        (args.can_format or can_readers.detect_format(args.log)) != "candump"):
+        print("ERROR: Incremental mode is only supported when converting a single candump log")
+        exit(1)
+
+    if args.follow and (batch_mode or args.incremental or args.log_type != "CAN" or \
+        (not read_stdin and (args.can_format or can_readers.detect_format(args.log)) != "candump")):
+        print("ERROR: Follow mode is only supported when converting a single candump log")
+        exit(1)
+
+    if args.follow and read_stdin and not args.output:
+        print("ERROR: An output file is required when following stdin")
+        exit(1)
+
+    if args.follow and (args.interval <= 0 or args.window < 0):
+        print("ERROR: The snapshot interval must be positive, and the window can not be negative")
+        exit(1)
+
+    if (args.start is not None or args.end is not None) and (args.incremental or args.follow):
+        print("ERROR: A time window can not be used in incremental or follow mode")
+        exit(1)
+
+    if (args.start is not None and args.start < 0) or \
+        (args.start is not None and args.end is not None and args.end <= args.start):
+        print("ERROR: The start time can not be negative, and must be before the end time")
+        exit(1)
+
+    if (args.split_gap is not None or args.split_condition) and (args.incremental or args.follow):
+        print("ERROR: A log can not be split into sessions in incremental or follow mode")
+        exit(1)
+
+    if (args.split_gap is not None and args.split_gap <= 0) or args.split_duration < 0:
+        print("ERROR: The split gap must be positive, and the split duration can not be negative")
+        exit(1)
+
+    # Sessions are split from the decoded log before it is resampled
+    session_split = None
+    if args.split_gap is not None or args.split_condition:
+        condition = None
+        if args.split_condition:
+            try:
+                condition = sessions.SessionCondition.parse(args.split_condition)
+            except ValueError as e:
+                print("ERROR: %s" % e)
+                exit(1)
+        session_split = (args.split_gap, condition, args.split_duration)
+
+    # Logs from other loggers are merged into the log once it has been loaded
+    merge_sources = []
+    if args.merge and (batch_mode or args.incremental or args.follow):
+        print("ERROR: Logs can only be merged when converting a single log")
+        exit(1)
+
+    for source in args.merge:
+        try:
+            merge_source = merge.LogSource.parse(source)
+        except ValueError as e:
+            print("ERROR: %s" % e)
+            exit(1)
+
+        if not os.path.isfile(merge_source.filename):
+            print("ERROR: log file %s does not exist" % merge_source.filename)
+            exit(1)
+
+        if merge_source.log_type == "CAN":
+            merge_source.dbc_filename = merge_source.dbc_filename or args.dbc
+            if not merge_source.dbc_filename or not os.path.isfile(merge_source.dbc_filename):
+                print("ERROR: DBC file %s does not exist" % merge_source.dbc_filename)
+                exit(1)
+
+            if merge_source.can_format and merge_source.can_format not in can_readers.READERS:
+                print("ERROR: Unknown CAN log format %s" % merge_source.can_format)
+                exit(1)
+
+        if merge_source.offset is None and not args.align_channel:
+            print("ERROR: An align channel or offset is required to merge %s" % merge_source)
+            exit(1)
+
+        merge_sources.append(merge_source)
+
+    # Only the data within the time window is converted
+    time_window = None
+    if args.start is not None or args.end is not None:
+        time_window = (args.start, args.end)
+
+    if args.channel_file and not os.path.isfile(args.channel_file):
+        print("ERROR: Channel file %s does not exist" % args.channel_file)
+        exit(1)
+
+    # Only the selected channels are decoded, the patterns from the channel file are combined with
+    # the patterns given as arguments
+    include = list(args.channels)
+    exclude = list(args.exclude)
+    if args.channel_file:
+        file_include, file_exclude = channel_filter.read_channel_file(args.channel_file)
+        include += file_include
+        exclude += file_exclude
+
+    try:
+        selected_channels = channel_filter.ChannelFilter(include, exclude)
+    except re.error as e:
+        print("ERROR: Invalid channel pattern: %s" % e)
+        exit(1)
+
+    metadata = {field: getattr(args, field) for field in METADATA_FIELDS}
+
+    # Decoded CAN logs are cached by the DBC file they were decoded with
+    dbc_hash = None
+    if args.log_type == "CAN" and not args.no_cache:
+        dbc_hash = cache.file_hash(args.dbc)
 
-    if args.log_type == "CAN":
-        if not os.path.isfile(args.dbc):
-            print("ERROR: DBC file %s does not exist" % args.dbc)
+    if batch_mode:
+        manifest = {}
+        try:
+            if args.manifest:
+                manifest = load_manifest(args.manifest)
+
+            ld_filenames = get_batch_ld_filenames(log_filenames, args.output)
+            log_metadata = [dict(metadata, **log_manifest) for log_manifest in \
+                match_manifest(manifest, log_filenames)]
+        except ValueError as e:
+            print("ERROR: %s" % e)
             exit(1)
 
-        # Load the databse and log file
+        # The database is loaded once, then shared with each of the worker processes
+        decode_plan = None
+        if args.log_type == "CAN":
+            print("Loading DBC...")
+            try:
+                decode_plan = load_selected_decode_plan(args.dbc, selected_channels)
+            except ValueError as e:
+                print("ERROR: %s" % e)
+                exit(1)
+
+        print("Converting %d logs with %d processes..." % (len(log_filenames), args.jobs))
+        start_time = time.perf_counter()
+        results = convert_batch(log_filenames, ld_filenames, log_metadata, args.log_type, \
+            decode_plan, args.can_format, args.frequency, channel_frequencies, args.jobs, \
+            dbc_hash, selected_channels, time_window, session_split)
+        elapsed = time.perf_counter() - start_time
+
+        total_bytes = sum(os.path.getsize(log_filename) for log_filename in log_filenames)
+        failed = [log_filename for log_filename in log_filenames \
+            if isinstance(results[log_filename], Exception)]
+
+        print("\nConverted %d of %d logs in %.2fs (%.1f logs/s, %.1f MB/s):" % \
+            (len(log_filenames) - len(failed), len(log_filenames), elapsed, \
+            len(log_filenames) / elapsed, total_bytes / 1e6 / elapsed))
+        for log_filename in log_filenames:
+            result = results[log_filename]
+            if isinstance(result, Exception):
+                print("\t%s: FAILED (%s)" % (log_filename, result))
+            else:
+                num_channels, duration, convert_time = result
+                print("\t%s: %.2fs, %d channels, %.1fs log" % \
+                    (log_filename, convert_time, num_channels, duration))
+
+        if failed:
+            exit(1)
+        exit(0)
+
+    if args.incremental:
+        # Lines already converted are skipped using the checkpoint stored next to the output file
+        ld_filename = get_ld_filename(args.log, args.output)
+        output_dir = os.path.dirname(ld_filename)
+        if output_dir and not os.path.isdir(output_dir):
+            print("Directory '%s' does not exist, will create it" % output_dir)
+            os.makedirs(output_dir, exist_ok=True)
+
+        print("Loading DBC...")
+        live_log = LiveLog(args.log, ld_filename, args.dbc, args.frequency, channel_frequencies, \
+            metadata, selected_channels)
+
+        print("Updating MoTeC log...")
+        num_bytes, rebuilt = live_log.update()
+        if rebuilt:
+            print("No matching checkpoint for %s, converted the entire log" % ld_filename)
+        print("Parsed %d new bytes, %.1fs log with %d channels" % \
+            (num_bytes, live_log.duration(), live_log.num_channels()))
+        print("Done!")
+        exit(0)
+
+    if args.follow:
+        ld_filename = get_ld_filename(args.log, args.output)
+        output_dir = os.path.dirname(ld_filename)
+        if output_dir and not os.path.isdir(output_dir):
+            print("Directory '%s' does not exist, will create it" % output_dir)
+            os.makedirs(output_dir, exist_ok=True)
+
         print("Loading DBC...")
-        can_db = cantools.database.load_file(args.dbc)
+        try:
+            decode_plan = load_selected_decode_plan(args.dbc, selected_channels)
+        except ValueError as e:
+            print("ERROR: %s" % e)
+            exit(1)
+
+        follow_log = FollowLog(ld_filename, decode_plan, args.frequency, channel_frequencies, \
+            metadata, args.window if args.window else None)
+
+        def print_snapshot(data_log):
+            print("%s: Saved %.1fs of log with %d channels to %s" % \
+                (time.strftime("%H:%M:%S"), data_log.duration(), len(data_log.channels), \
+                ld_filename))
+
+        print("Following %s, press Ctrl+C to stop..." % ("stdin" if read_stdin else args.log))
+        if read_stdin:
+            follow_log.follow(sys.stdin.buffer, args.interval, print_snapshot)
+        else:
+            with open(args.log, "rb") as stream:
+                follow_log.follow(stream, args.interval, print_snapshot)
+        print("Done!")
+        exit(0)
+
+    # Create our data log from the input data. Only candump logs can be split between processes.
+    can_format = args.can_format or can_readers.detect_format(args.log)
+    if args.log_type == "CAN" and args.jobs > 1 and can_format != "candump":
+        print("WARNING: Only candump logs can be decoded with multiple processes, using one")
 
-        print("Extracting data...")
-        data_log.from_can_log(lines, can_db)
-    elif args.log_type == "CSV":
-        print("Extracting data...")
-        data_log.from_csv_log(lines)
-    elif args.log_type == "ACCESSPORT":
-        print("Extracting data...")
-        data_log.from_accessport_log(lines)
+    # A CAN log which has been decoded before is loaded from the cache, skipping straight to
+    # resampling it. Only entire logs are cached, a time window is sliced from the cached log.
+    data_log = None
+    if dbc_hash:
+        cache_filename = cache.decoded_log_filename(args.log, dbc_hash, can_format, \
+            selected_channels.key())
+        data_log = read_cached_data_log(cache_filename)
+
+    if data_log is not None:
+        print("Loaded decoded data from cache...")
+        if time_window:
+            slice_data_log(data_log, time_window, args.log, can_format)
+    else:
+        if args.log_type == "CAN" and args.jobs > 1 and can_format == "candump":
+            # Each process loads the database and decodes its own portion of the log, only the
+            # part of the log holding the time window is split between the processes
+            start, end, window = 0, None, None
+            if time_window:
+                start, end, window = find_time_window(args.log, time_window)
+
+            print("Extracting data with %d processes..." % args.jobs)
+            data_log = DataLog()
+            data_log.from_can_log_file(args.log, args.dbc, args.jobs, selected_channels, start, \
+                end)
+            if window:
+                data_log.slice(*window)
+        else:
+            decode_plan = None
+            if args.log_type == "CAN":
+                # Load the database, this uses a cached copy of the decode plan when the DBC file
+                # has been used before
+                print("Loading DBC...")
+                try:
+                    decode_plan = load_selected_decode_plan(args.dbc, selected_channels)
+                except ValueError as e:
+                    print("ERROR: %s" % e)
+                    exit(1)
+
+            print("Extracting data...")
+            data_log = load_data_log(args.log, args.log_type, decode_plan, can_format, \
+                selected_channels, time_window)
+
+        if dbc_hash and not time_window:
+            write_cached_data_log(cache_filename, data_log)
 
     if not data_log.channels:
         print("ERROR: Failed to find any channels in log data")
         exit(1)
 
+    if merge_sources:
+        # The merged logs are lined up with the log, then limited to the time it covers when only
+        # a time window of the log is converted
+        log_window = (data_log.start(), data_log.end())
+
+        print("Extracting data from %d merged logs..." % len(merge_sources))
+        try:
+            source_logs = load_merge_sources(merge_sources, selected_channels, args.jobs)
+            merged = merge.merge_sources(data_log, merge_sources, source_logs, \
+                args.align_channel)
+        except ValueError as e:
+            print("ERROR: %s" % e)
+            exit(1)
+
+        for merge_source, source_log, (offset, renamed) in zip(merge_sources, source_logs, \
+            merged):
+            print("\tMerged %s with an offset of %.3fs, %d channels" % (merge_source, offset, \
+                len(source_log.channels)))
+            for name, merged_name in renamed.items():
+                print("\t\tRenamed %s to %s" % (name, merged_name))
+
+        if time_window:
+            data_log.slice(*log_window)
+
     print("Parsed %.1fs log with %s channels:" % (data_log.duration(), len(data_log.channels)))
     for channel_name, channel in data_log.channels.items():
         print("\t%s" % channel)
 
-    # Resample all the channels to occur at a fixed frequency. We must do this because the data in
-    # motec log expects a constant sample rate, it does not associate a timestamp to each individual
-    # message in a channel.
-    data_log.resample(args.frequency)
-
     print("Converting to MoTeC log...")
+    ld_filename = get_ld_filename(args.log, args.output)
 
-    motec_log = MotecLog()
-    motec_log.driver = args.driver
-    motec_log.vehicle_id = args.vehicle_id
-    motec_log.vehicle_weight = args.vehicle_weight
-    motec_log.vehicle_type = args.vehicle_type
-    motec_log.vehicle_comment = args.vehicle_comment
-    motec_log.venue_name = args.venue_name
-    motec_log.event_name = args.event_name
-    motec_log.event_session = args.event_session
-    motec_log.long_comment = args.long_comment
-    motec_log.short_comment = args.short_comment
-
-    motec_log.initialize()
-    motec_log.add_all_channels(data_log)
+    if session_split:
+        try:
+            split = split_sessions(data_log, ld_filename, metadata, session_split)
+        except ValueError as e:
+            print("ERROR: %s" % e)
+            exit(1)
 
-    print("Saving MoTeC log...")
-    if args.output:
-        ld_filename = os.path.splitext(args.output)[0] + ".ld"
+        print("Saving %d sessions..." % len(split))
+        for session_log, session_ld_filename, session_metadata in split:
+            save_motec_log(session_log, session_ld_filename, session_metadata, args.frequency, \
+                channel_frequencies)
+            print("\t%s: %.1fs, %d channels" % (session_ld_filename, session_log.duration(), \
+                len(session_log.channels)))
     else:
-        # Copy the path and name from the source file, but change the extension
-        candump_dir, candump_filename = os.path.split(args.log)
-        candump_filename = os.path.splitext(candump_filename)[0]
-        ld_filename = os.path.join(candump_dir, candump_filename + ".ld")
-
-    output_dir = os.path.dirname(ld_filename)
-    if output_dir and not os.path.isdir(output_dir):
-        print("Directory '%s' does not exist, will create it" % output_dir)
-        os.makedirs(output_dir)
-
-    motec_log.write(ld_filename)
+        print("Saving MoTeC log...")
+        save_motec_log(data_log, ld_filename, metadata, args.frequency, channel_frequencies)
     print("Done!")
@@ -0,0 +1,140 @@
+import numpy as np
+import re
+
+# Comparison operators which can be used in a session condition
+CONDITION_OPERATORS = {
+    "<": np.less,
+    "<=": np.less_equal,
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+# Sessions shorter than this are dropped, e.g. the few messages logged before the first message of
+# the condition channel [s]
+MIN_SESSION_DURATION = 1.0
+
+# Condition comparing a channel against a value, e.g. 'SPEED<1'
+CONDITION_PATTERN = re.compile(r"^\s*(.+?)\s*(<=|>=|==|!=|<|>)\s*([^<>=!\s]+)\s*$")
+
+class SessionCondition(object):
+    """ Condition on the value of a channel which holds while the logger is between sessions, e.g.
+    the vehicle speed being zero.
+    """
+    def __init__(self, channel_name, operator, value):
+        """ channel_name: Name of the channel to check
+            operator: One of the CONDITION_OPERATORS
+            value: Value the channel is compared against
+        """
+        self.channel_name = channel_name
+        self.operator = operator
+        self.value = value
+
+    @classmethod
+    def parse(cls, condition):
+        """ Parses a condition in the form NAME<VALUE, using any of the CONDITION_OPERATORS.
+
+        raises: ValueError if the condition is not valid
+        """
+        match = CONDITION_PATTERN.match(condition)
+        try:
+            return cls(match.group(1), match.group(2), float(match.group(3)))
+        except (AttributeError, ValueError):
+            raise ValueError("Invalid session condition '%s', must be in the form NAME<VALUE" % \
+                condition)
+
+    def __call__(self, values):
+        """ Returns a boolean array which is true for each value the condition holds for. """
+        return CONDITION_OPERATORS[self.operator](values, self.value)
+
+    def __str__(self):
+        return "%s%s%g" % (self.channel_name, self.operator, self.value)
+
+def find_sessions(data_log, min_gap=None, condition=None, min_duration=0.0):
+    """ Finds the sessions in a log, as the periods of time between the breaks in logging.
+
+    A break is either a gap in the timestamps of all channels longer than min_gap, or a period of
+    at least min_duration where a condition holds (e.g. the vehicle is stationary). Messages within
+    a break are not part of any session. When neither is given the entire log is a single session.
+    Sessions shorter than MIN_SESSION_DURATION are left out.
+
+    data_log: data_log.DataLog to split
+    min_gap: Minimum gap between messages that separates two sessions, None to not split on gaps
+        [s]
+    condition: Optional SessionCondition that holds between sessions
+    min_duration: Minimum time the condition must hold for to separate two sessions [s]
+    returns: List of (start, end) tuples of the time of the first and last message in each
+        session [s]
+    raises: ValueError if the channel of the condition is not in the log
+    """
+    if not any(len(channel) for channel in data_log.channels.values()):
+        return []
+
+    timestamps = _merged_timestamps(data_log)
+
+    breaks = []
+    if min_gap is not None:
+        breaks += _find_gaps(timestamps, min_gap)
+    if condition is not None:
+        breaks += _find_condition_breaks(data_log, condition, min_duration)
+
+    # Sessions are the periods of the log which are not covered by any of the breaks
+    sessions = []
+    session_start = data_log.start()
+    for break_start, break_end in sorted(breaks):
+        if break_start > session_start:
+            sessions.append((session_start, break_start))
+        session_start = max(session_start, break_end)
+
+    sessions.append((session_start, np.inf))
+
+    # Trim each session to the messages it contains, dropping sessions which are too short
+    trimmed = []
+    for start, end in sessions:
+        first, last = np.searchsorted(timestamps, (start, end), side="left")
+        if first < last and timestamps[last - 1] - timestamps[first] >= MIN_SESSION_DURATION:
+            trimmed.append((float(timestamps[first]), float(timestamps[last - 1])))
+
+    return trimmed
+
+def _merged_timestamps(data_log):
+    """ Returns the sorted unique timestamps of all messages in a log. """
+    return np.unique(np.concatenate([channel.timestamps for channel in \
+        data_log.channels.values()]))
+
+def _find_gaps(timestamps, min_gap):
+    """ Returns the gaps between consecutive timestamps longer than min_gap, as a list of (start,
+    end) tuples where end is the first timestamp after the gap [s].
+    """
+    gaps = np.flatnonzero(np.diff(timestamps) > min_gap)
+
+    # Gaps start just after the previous message, so it stays in the session before the gap
+    return [(np.nextafter(timestamps[i], np.inf), timestamps[i + 1]) for i in gaps]
+
+def _find_condition_breaks(data_log, condition, min_duration):
+    """ Returns the periods a condition holds for at least min_duration, as a list of (start, end)
+    tuples where start is the first message the condition holds for and end is the first message
+    after that where it does not hold [s].
+    """
+    channel = data_log.channels.get(condition.channel_name)
+    if channel is None:
+        raise ValueError("Channel %s used to split sessions is not in the log" % \
+            condition.channel_name)
+
+    timestamps = channel.timestamps
+    holds = condition(channel.values).astype(np.int8)
+
+    # Find each run of consecutive messages where the condition holds
+    edges = np.diff(np.concatenate(([0], holds, [0])))
+    run_starts = np.flatnonzero(edges == 1)
+    run_ends = np.flatnonzero(edges == -1)
+
+    breaks = []
+    for first, stop in zip(run_starts, run_ends):
+        # A run at the end of the log lasts until the end of the log
+        end = timestamps[stop] if stop < timestamps.size else np.inf
+        if min(end, data_log.end()) - timestamps[first] >= min_duration:
+            breaks.append((timestamps[first], end))
+
+    return breaks
@@ -0,0 +1,90 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import cache
+import can_log
+import log_file
+import log_index
+
+class EvictionTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def entry(self, directory, name):
+        return os.path.join(self.cache_dir, directory, name)
+
+    def age(self, filename, seconds):
+        os.utime(filename, ns=(0, os.stat(filename).st_mtime_ns - int(seconds * 1e9)))
+
+    def test_indexes_share_the_budget(self):
+        # Decoded logs and both kinds of index are evicted together, least recently used first
+        decoded = self.entry("decoded_logs", "a.npz")
+        cache.write_decoded_log(decoded, [("a", "", np.zeros(1000), np.zeros(1000))], 10 ** 6)
+        time_index = self.entry("time_indexes", "a.pickle")
+        cache.write_log_index(time_index, ([0], [1.0]), 10 ** 6)
+        self.age(decoded, 20)
+        self.age(time_index, 10)
+
+        id_index = self.entry("id_indexes", "a.pickle")
+        cache.write_log_index(id_index, (np.zeros(4000),), 40000)
+        self.assertFalse(os.path.exists(decoded))
+        self.assertTrue(os.path.exists(time_index))
+        self.assertTrue(os.path.exists(id_index))
+
+    def test_reading_an_index_marks_it_used(self):
+        filename = self.entry("id_indexes", "a.pickle")
+        cache.write_log_index(filename, (1, 2), 10 ** 6)
+        self.age(filename, 10)
+        modified = os.stat(filename).st_mtime_ns
+
+        self.assertEqual(cache.read_log_index(filename), (1, 2))
+        self.assertGreater(os.stat(filename).st_mtime_ns, modified)
+
+class IdIndexTest(unittest.TestCase):
+    LOG = b"(1.000000) can0 123#01\n(2.000000) can0 1ABCDEF0#0203\n(3.000000) can0 123#04\n"
+
+    def test_compact_index(self):
+        with tempfile.NamedTemporaryFile(suffix=".log") as file:
+            file.write(self.LOG)
+            file.flush()
+            with log_file.LogFile(file.name) as log:
+                index = log_index.IdIndex.build(log)
+                self.assertEqual(index.offsets.dtype, np.uint32)
+                self.assertEqual(index.lengths.dtype, np.uint16)
+
+                frames = list(index.iter_frames(log, [0x123]))
+                self.assertEqual(frames[0].timestamps.tolist(), [1.0, 3.0])
+                self.assertEqual(frames[0].data[:, 0].tolist(), [1, 4])
+
+    def test_standard_and_extended_ids_are_apart(self):
+        log_data = b"(1.000000) can0 123#11\n(2.000000) can0 00000123#2222\n" \
+            b"(3.000000) can0 123#33\n"
+        with tempfile.NamedTemporaryFile(suffix=".log") as file:
+            file.write(log_data)
+            file.flush()
+            with log_file.LogFile(file.name) as log:
+                index = log_index.IdIndex.build(log)
+                for id, timestamps in (("123", [1.0, 3.0]), ("00000123", [2.0])):
+                    key = can_log.parse_id_key(id)
+                    self.assertEqual(index.count(key), len(timestamps), id)
+                    frames = list(index.iter_frames(log, [key]))
+                    self.assertEqual(frames[0].timestamps.tolist(), timestamps, id)
+                    self.assertEqual(frames[0].extended.tolist(), [len(id) == 8] * len(timestamps))
+
+    def test_dtypes(self):
+        self.assertEqual(log_index.IdIndex.offset_dtype(2 ** 32 - 1), np.uint32)
+        self.assertEqual(log_index.IdIndex.offset_dtype(2 ** 32), np.int64)
+        self.assertEqual(log_index.IdIndex.length_dtype(2 ** 16), np.uint32)
+
+if __name__ == '__main__':
+    unittest.main()
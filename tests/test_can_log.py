@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import can_log
+
+class ParseCandumpTest(unittest.TestCase):
+    def parse(self, chunk):
+        return can_log.parse_candump(memoryview(chunk))
+
+    def test_chunks_without_frames(self):
+        # Blank lines, whitespace, and lines which are not frames (e.g. a header) have no frames
+        for chunk in [b"", b"\n", b"\n\n\n", b"   \n\t\n", b"hello\n", b"hello world\n\n"]:
+            frames = self.parse(chunk)
+            self.assertEqual(len(frames.ids), 0, chunk)
+            self.assertEqual(len(frames.timestamps), 0, chunk)
+
+    def test_blank_lines_around_frames(self):
+        frames = self.parse(b"\n\n(1630268615.800257) can0 0D4#0102\n\n  \n")
+        self.assertEqual(frames.ids.tolist(), [0x0D4])
+        self.assertEqual(frames.timestamps.tolist(), [1630268615.800257])
+        self.assertEqual(frames.data[0, :frames.lengths[0]].tolist(), [1, 2])
+
+    def test_non_frame_lines_are_skipped(self):
+        frames = self.parse(b"hello\n(1.000000) can0 123#AB\ncandump header\n")
+        self.assertEqual(frames.ids.tolist(), [0x123])
+
+    def test_empty_final_frame_without_newline(self):
+        # A frame without data as the last line, with nothing after the '#'
+        for chunk in [b"(1.000000) can0 123#", b"(1.000000) can0 0D4#0102\n(2.000000) can0 123#"]:
+            frames = self.parse(chunk)
+            self.assertEqual(frames.ids.tolist()[-1], 0x123, chunk)
+            self.assertEqual(frames.lengths.tolist()[-1], 0, chunk)
+            self.assertEqual(frames.timestamps.tolist()[-1], float(len(frames)), chunk)
+
+class ExtendedIdTest(unittest.TestCase):
+    LOG = b"(1.000000) can0 00000123#01\n(2.000000) can0 123#02\n(3.000000) can1 1ABCDEF0#0304\n"
+
+    def test_digits_set_extended(self):
+        # Extended ids are written with 8 digits, even when their value fits in 11 bits
+        frames = can_log.parse_candump(self.LOG)
+        self.assertEqual(frames.ids.tolist(), [0x123, 0x123, 0x1ABCDEF0])
+        self.assertEqual(frames.extended.tolist(), [True, False, True])
+
+    def test_frame_ids_keep_extended(self):
+        frames = can_log.parse_candump(self.LOG, [0x1ABCDEF0])
+        self.assertEqual(frames.extended.tolist(), [True])
+        self.assertEqual(frames.select([0]).extended.tolist(), [True])
+
+    def test_format_round_trip(self):
+        self.assertEqual(can_log.format_candump(can_log.parse_candump(self.LOG)), \
+            self.LOG.decode())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "can_utils"))
+
+import can_log
+import can_readers
+import can_utils
+
+# Frames with a standard and an extended id of the same value, and an extended id above 11 bits
+FRAMES = [(1.0, 0x123, False, b"\x01"), (2.0, 0x123, True, b"\x02\x03"), \
+    (3.0, 0x1ABCDEF0, True, b"\x04")]
+
+def write_pcap(filename, fixed_size):
+    """ Writes FRAMES to a pcap capture of SocketCAN frames, with the same record size for every
+    frame when fixed_size is set so the frames are decoded as a matrix.
+    """
+    with open(filename, "wb") as file:
+        file.write(struct.pack("<IHHiIII", 0xa1b2c3d4, 2, 4, 0, 0, 65535, \
+            can_readers.LINKTYPE_CAN_SOCKETCAN))
+        for stamp, id, extended, data in FRAMES:
+            can_id = id | can_readers.CAN_EFF_FLAG if extended else id
+            packet = struct.pack(">IB3x", can_id, len(data)) + \
+                (data.ljust(8, b"\0") if fixed_size else data)
+            file.write(struct.pack("<IIII", int(stamp), 0, len(packet), len(packet)) + packet)
+
+class ExtendedIdTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, filename):
+        frames = list(can_readers.read_can_frames(filename))
+        self.assertEqual(len(frames), 1)
+        return frames[0]
+
+    def assert_frames(self, frames):
+        self.assertEqual(frames.ids.tolist(), [frame[1] for frame in FRAMES])
+        self.assertEqual(frames.extended.tolist(), [frame[2] for frame in FRAMES])
+
+    def test_pcap(self):
+        for fixed_size in (True, False):
+            filename = os.path.join(self.directory, "log.pcap")
+            write_pcap(filename, fixed_size)
+            self.assert_frames(self.read(filename))
+
+    def test_python_can(self):
+        try:
+            import can
+        except ImportError:
+            self.skipTest("python-can is not installed")
+
+        for extension in (".blf", ".asc"):
+            filename = os.path.join(self.directory, "log" + extension)
+            with can.Logger(filename) as logger:
+                for stamp, id, extended, data in FRAMES:
+                    logger.on_message_received(can.Message(timestamp=stamp, arbitration_id=id, \
+                        is_extended_id=extended, data=data, channel=0))
+            self.assert_frames(self.read(filename))
+
+    def test_id_stats(self):
+        # Standard and extended ids with the same value have separate statistics
+        filename = os.path.join(self.directory, "log.pcap")
+        write_pcap(filename, True)
+        id_stats = can_utils.get_id_stats_from_file(filename)
+        self.assertEqual(sorted(id_stats), ["00000123", "123", "1ABCDEF0"])
+        self.assertEqual(id_stats["00000123"].bytes_max, 2)
+
+        frames = self.read(filename)
+        self.assertEqual(can_log.format_candump(frames).split("\n")[:2], \
+            ["(1.000000) can0 123#01", "(2.000000) can0 00000123#0203"])
+
+if __name__ == '__main__':
+    unittest.main()
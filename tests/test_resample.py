@@ -0,0 +1,117 @@
+import math
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from data_log import DataLog
+
+def reference_resample(timestamps, values, start_time, end_time, frequency):
+    """ The original per tick Channel.resample loop, which the vectorized resampling must match.
+
+    returns: Tuple of lists of the sample times and values
+    """
+    num_msgs = math.floor(frequency * (end_time - start_time))
+    dt_step = 1.0 / frequency
+
+    value = 0
+    t = start_time
+    current_msgs_index = 0
+    new_times = []
+    new_values = []
+    for i in range(num_msgs):
+        while current_msgs_index < len(timestamps):
+            if timestamps[current_msgs_index] < t + 0.5 * dt_step:
+                value = values[current_msgs_index]
+                current_msgs_index += 1
+            else:
+                break
+
+        new_times.append(t)
+        new_values.append(value)
+        t += dt_step
+
+    return new_times, new_values
+
+def tick_times(start_time, frequency, count):
+    """ Returns the sample times the reference loop steps through. """
+    times = []
+    t = start_time
+    for i in range(count):
+        times.append(t)
+        t += 1.0 / frequency
+    return times
+
+class ResampleParityTest(unittest.TestCase):
+    def make_log(self, channels):
+        data_log = DataLog()
+        for name, (timestamps, values) in channels.items():
+            data_log.add_channel(name, "", float, 0).set_data(timestamps, values)
+        return data_log
+
+    def assert_parity(self, channels, frequency, channel_frequencies=None):
+        """ Checks both DataLog.resample and DataLog.iter_resampled against the reference. """
+        channel_frequencies = channel_frequencies or {}
+        data_log = self.make_log(channels)
+        start = data_log.start()
+        end = data_log.end()
+
+        expected = {}
+        for name, (timestamps, values) in channels.items():
+            if len(timestamps):
+                expected[name] = reference_resample(list(timestamps), list(values), start, end, \
+                    channel_frequencies.get(name, frequency))
+
+        resampled = {channel.name: channel for channel in \
+            data_log.iter_resampled(frequency, channel_frequencies)}
+        data_log.resample(frequency, channel_frequencies)
+
+        self.assertEqual(sorted(resampled), sorted(expected))
+        for name, (times, values) in expected.items():
+            for channel in (resampled[name], data_log.channels[name]):
+                self.assertEqual(channel.timestamps.tolist(), times, name)
+                self.assertEqual(channel.values.tolist(), values, name)
+
+    def test_regular_messages(self):
+        timestamps = np.arange(0, 10, 0.013) + 1630268615.8
+        self.assert_parity({"a": (timestamps, np.sin(timestamps))}, 20.0)
+
+    def test_gaps(self):
+        # Long gaps hold the last value, and a channel starting late is zero until its first message
+        timestamps = np.concatenate((np.arange(0, 2, 0.01), np.arange(7.5, 8, 0.01), [15.0]))
+        late = np.arange(10, 15, 0.1)
+        self.assert_parity({"a": (timestamps, np.arange(timestamps.size)), \
+            "late": (late, late * 2)}, 10.0)
+
+    def test_duplicate_timestamps(self):
+        # The latest of the messages sharing a timestamp is used
+        timestamps = np.repeat(np.arange(0, 5, 0.25), 3)
+        self.assert_parity({"a": (timestamps, np.arange(timestamps.size))}, 8.0)
+
+    def test_half_window_edges(self):
+        # Messages exactly at, and just either side of, the middle of each sample interval
+        frequency = 10.0
+        ticks = np.array(tick_times(100.0, frequency, 50))
+        edges = ticks + 0.5 / frequency
+        timestamps = np.sort(np.concatenate(([100.0], edges, np.nextafter(edges, -np.inf), \
+            np.nextafter(edges, np.inf), [ticks[-1] + 1.0])))
+        self.assert_parity({"a": (timestamps, np.arange(timestamps.size))}, frequency)
+
+    def test_unsorted_timestamps(self):
+        # Messages are consumed in order, so one arriving out of order waits for the later message
+        timestamps = np.array([0.0, 0.3, 0.2, 0.25, 0.9, 0.5, 1.4, 2.0])
+        self.assert_parity({"a": (timestamps, np.arange(timestamps.size))}, 10.0)
+
+    def test_channel_frequencies(self):
+        # Channels with their own frequency share the log start and end with the other channels
+        fast = np.arange(0.05, 12, 0.007)
+        slow = np.arange(1.0, 11, 0.9)
+        other = np.arange(0.0, 12.5, 0.05)
+        self.assert_parity({"fast": (fast, np.cos(fast)), "slow": (slow, slow), \
+            "other": (other, -other), "empty": ([], [])}, 20.0, {"fast": 100.0, "slow": 1.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import motec_log_generator
+import sessions
+from data_log import DataLog
+
+class SplitSessionsTest(unittest.TestCase):
+    def make_log(self):
+        data_log = DataLog()
+        timestamps = np.concatenate((np.arange(0, 10, 0.1), np.arange(30, 40, 0.1)))
+        data_log.add_channel("RPM", "rpm", float, 0).set_data(timestamps, timestamps * 100)
+        return data_log
+
+    def test_split(self):
+        split = motec_log_generator.split_sessions(self.make_log(), "log.ld", \
+            {"event_session": "Practice"}, (5.0, None, 0.0))
+        self.assertEqual([ld_filename for _, ld_filename, _ in split], ["log_1.ld", "log_2.ld"])
+        self.assertEqual([metadata["event_session"] for _, _, metadata in split], \
+            ["Practice 1", "Practice 2"])
+
+    def test_no_sessions(self):
+        # A condition holding for the entire log leaves no sessions, which must not be reported as
+        # a successful conversion
+        condition = sessions.SessionCondition.parse("RPM<100000")
+        with self.assertRaises(ValueError):
+            motec_log_generator.split_sessions(self.make_log(), "log.ld", {}, \
+                (None, condition, 0.0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+UTILS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "can_utils")
+sys.path.insert(0, UTILS_DIR)
+
+import can_log
+import signal_discovery
+
+def colliding_log():
+    """ Returns a candump log with a counter on the standard id 123, and a constant payload on the
+    extended id with the same value.
+    """
+    lines = []
+    for i in range(64):
+        lines.append("(%d.000000) can0 123#%02X000000\n" % (2 * i, i % 16))
+        lines.append("(%d.000000) can0 00000123#AABBCCDD\n" % (2 * i + 1))
+    return "".join(lines)
+
+class CollidingIdsTest(unittest.TestCase):
+    def test_signals_by_key(self):
+        discovery = signal_discovery.SignalDiscovery()
+        discovery.update(can_log.parse_candump(colliding_log()))
+
+        standard = discovery.signals(can_log.parse_id_key("123"), 4)
+        self.assertIn("counter", [signal.kind for signal in standard])
+        # Bits which never change are left out, so the constant extended id has no signals
+        self.assertEqual(discovery.signals(can_log.parse_id_key("00000123"), 4), [])
+
+    def test_dbc_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            log_filename = os.path.join(directory, "log.log")
+            with open(log_filename, "w") as file:
+                file.write(colliding_log())
+
+            dbc_filename = os.path.join(directory, "log.dbc")
+            subprocess.run([sys.executable, os.path.join(UTILS_DIR, "dbc_file_from_can_log.py"), \
+                log_filename, "--output", dbc_filename, "--discover"], check=True, \
+                stdout=subprocess.DEVNULL)
+            with open(dbc_filename) as file:
+                dbc = file.read()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertIn("BO_ 291 ", dbc)
+        self.assertNotIn("BO_ %d " % (0x123 | can_log.EXTENDED_KEY_FLAG), dbc)
+
+if __name__ == '__main__':
+    unittest.main()